@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the local allergen matcher (backend/allergen_matcher.py)
+Runs a labelled corpus of ingredient lists through ProfileMatcher and a naive
+per-term regex scan, and reports accuracy, LLM calls avoided and throughput.
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from allergen_matcher import ALLERGEN_TERMS, ProfileMatcher, profile_categories  # noqa: E402
+
+# (profile, ingredient list, definitely unsafe?)
+# False means "not a definite hit" -- safe, or ambiguous enough to go to the LLM.
+# Skin sensitivities are always left to the LLM, so their unsafe cases count as misses.
+CORPUS = [
+    ({"allergies": ["peanuts"]}, "Milk chocolate (sugar, cocoa butter, milk powder), peanuts (25%), salt", True),
+    ({"allergies": ["peanuts"]}, "Sugar, cocoa butter, cocoa mass, emulsifier (sunflower lecithin)", False),
+    ({"allergies": ["peanuts"]}, "Oats, honey, sunflower seeds. May contain traces of peanuts and other nuts.", False),
+    ({"allergies": ["peanuts"]}, "Roasted groundnuts, vegetable oil, salt", True),
+    ({"allergies": ["peanuts"]}, "Refined arachis oil, vitamin E", True),
+    ({"allergies": ["peanuts"]}, "Peanut-free sunflower seed butter: sunflower seeds, sugar, salt", False),
+    ({"allergies": ["tree nuts"]}, "Almond milk (water, almonds 2%), calcium carbonate", True),
+    ({"allergies": ["tree nuts"]}, "Wheat flour, sugar, nutmeg, cinnamon, butternut squash puree", False),
+    ({"allergies": ["tree nuts"]}, "Dark chocolate, praline filling (sugar, hazelnuts), marzipan", True),
+    ({"allergies": ["dairy"]}, "Water, almond milk base, pea protein, coconut cream", False),
+    ({"allergies": ["dairy"]}, "Wheat flour, sugar, whey powder, salt, raising agent", True),
+    ({"allergies": ["dairy"]}, "Cocoa butter, sugar, rice syrup, vanilla. Dairy-free.", False),
+    ({"allergies": ["dairy"]}, "Potatoes, sunflower oil, cheese flavour seasoning (lactose, sodium caseinate)", True),
+    ({"allergies": ["dairy"]}, "Aqua, shea butter, glycerin, hand cream base", False),
+    ({"allergies": ["lactose intolerance"]}, "Ghee, spices, onion, garlic", True),
+    ({"allergies": ["eggs"]}, "Pasta (durum wheat semolina, egg), water, salt", True),
+    ({"allergies": ["eggs"]}, "Eggplant, tomato, olive oil, basil", False),
+    ({"allergies": ["eggs"]}, "Sugar, dried egg white, gelatin, natural flavouring", True),
+    ({"allergies": ["eggs"]}, "Wine (contains lysozyme from egg), sulphites", True),
+    ({"allergies": ["gluten"]}, "Rice flour, tapioca starch, xanthan gum, buckwheat", False),
+    ({"allergies": ["gluten"]}, "Barley malt extract, water, hops, yeast", True),
+    ({"allergies": ["celiac"]}, "Oats (gluten-free), honey, raisins", False),
+    ({"allergies": ["celiac"]}, "Couscous salad with cucumber and mint", True),
+    ({"allergies": ["soy"]}, "Chocolate (sugar, cocoa mass, emulsifier: soya lecithin)", True),
+    ({"allergies": ["soy"]}, "Coconut aminos, water, sea salt", False),
+    ({"allergies": ["soy"]}, "Tamari, rice vinegar, sesame oil", True),
+    ({"allergies": ["shellfish"]}, "Rice noodles, prawns, bean sprouts, peanuts, lime", True),
+    ({"allergies": ["shellfish"]}, "King oyster mushrooms, garlic, butter, parsley", False),
+    ({"allergies": ["seafood"]}, "Caesar dressing (oil, anchovies, egg yolk, parmesan)", True),
+    ({"allergies": ["sesame"]}, "Chickpeas, tahini, lemon juice, garlic", True),
+    ({"allergies": ["mustard"]}, "Vinegar, water, mustard seed, salt, turmeric", True),
+    ({"allergies": ["sulphites"]}, "Dried apricots, preservative (sulphur dioxide)", True),
+    ({"allergies": ["sulphites"]}, "Dried apricots, rice flour. No added sulphites.", False),
+    ({"skin_sensitivities": ["fragrance"]}, "Aqua, glycerin, parfum, linalool, limonene", True),
+    ({"skin_sensitivities": ["fragrance"]}, "Aqua, cetearyl alcohol, glycerin. Fragrance-free.", False),
+    ({"skin_sensitivities": ["fragrance"]}, "Alcohol denat., parfum, citronellol, geraniol, coumarin", True),
+    ({"skin_sensitivities": ["parabens"]}, "Aqua, glycerin, methylparaben, propylparaben", True),
+    ({"skin_sensitivities": ["parabens"]}, "Aqua, glycerin, phenoxyethanol, ethylhexylglycerin", False),
+    ({"skin_sensitivities": ["sulfates"]}, "Water, sodium laureth sulfate, cocamidopropyl betaine", True),
+    ({"skin_sensitivities": ["sulfates"]}, "Water, sodium cocoyl isethionate, glycerin. Sulfate-free.", False),
+    ({"skin_sensitivities": ["alcohol"]}, "Aqua, cetyl alcohol, stearyl alcohol, glycerin", False),
+    ({"religion_restrictions": ["halal"]}, "Sugar, glucose syrup, gelatine (pork), citric acid", True),
+    ({"religion_restrictions": ["halal"]}, "Sugar, glucose syrup, pectin, citric acid", False),
+    ({"religion_restrictions": ["halal"]}, "Beef, onion, spices, salt", False),
+    ({"religion_restrictions": ["kosher"]}, "Pasta, bacon, cream, parmesan, egg yolk", True),
+    ({"dietary_restrictions": ["vegan"]}, "Oats, maple syrup, almonds, dates", False),
+    ({"dietary_restrictions": ["vegan"]}, "Sugar, glucose, colour (carmine), flavouring", True),
+    ({"dietary_restrictions": ["vegan"]}, "Oats, honey, almonds", True),
+    ({"dietary_restrictions": ["vegetarian"]}, "Wheat flour, water, lard, salt", True),
+    ({"dietary_restrictions": ["vegetarian"]}, "Hamburger bun (wheat flour, yeast, sesame)", False),
+    ({"allergies": ["kiwi"]}, "Apple, kiwis, strawberries, orange juice", True),
+    ({"allergies": ["kiwi"]}, "Apple, banana, strawberries, orange juice", False),
+    ({"allergies": ["milk", "eggs", "peanuts"]},
+     "Enriched flour, sugar, vegetable oil, contains no milk, eggs or peanuts, salt", False),
+    ({"allergies": ["milk"]}, "Milk thistle extract, vitamin C, cellulose", False),
+    ({"allergies": ["milk"]}, "Ice cream (cream, skimmed milk, sugar), cookie pieces", True),
+    ({"allergies": ["dairy"]}, "Peanut butter (roasted peanuts, salt), banana, oats", False),
+    ({"allergies": ["peanuts"]}, "Peanut butter (roasted peanuts, salt), banana, oats", True),
+    ({"allergies": ["dairy"]}, "Almond butter, dates, cocoa powder", False),
+    ({"allergies": ["dairy"]}, "Coconut butter, sunflower seed butter, maple syrup", False),
+    ({"allergies": ["dairy"]}, "Vegan cheese (cashews, coconut oil), tomato, basil", False),
+    ({"allergies": ["dairy"]}, "Flour, sugar, Violife vegan butter, vanilla", False),
+    ({"allergies": ["dairy"]}, "Pizza base, tomato, dairy-free cream cheese", False),
+    ({"allergies": ["dairy"]}, "Eggless butter cake (flour, butter, sugar)", True),
+    ({"allergies": ["eggs"]}, "Eggless mayonnaise (rapeseed oil, aquafaba, lemon juice)", False),
+    ({"allergies": ["fish"]}, "Swedish Fish candy (sugar, corn syrup, citric acid)", False),
+    ({"allergies": ["fish"]}, "Fish and chips (cod, batter, potatoes)", True),
+    ({"dietary_restrictions": ["low sugar"]}, "Low sugar jam: strawberries, pectin, lemon juice", False),
+    ({"dietary_restrictions": ["keto"]}, "Keto bread: almond flour, eggs, psyllium husk", False),
+    ({"dietary_restrictions": ["diabetic"]}, "Diabetic chocolate (cocoa mass, sweetener: maltitol)", False),
+    ({"religion_restrictions": ["no pork"]}, "Chicken sausage (chicken, spices, salt). No pork.", False),
+    ({"religion_restrictions": ["no pork"]}, "Pork sausage (pork, salt, pepper)", True),
+    ({"skin_sensitivities": ["alcohol"]}, "Beef stew with red wine, carrots and thyme", False),
+    ({"allergies": ["dairy"]}, "Coconut milk ice cream (coconut milk, sugar, vanilla)", False),
+    ({"allergies": ["dairy"]}, "Coconut milk ice cream with chocolate sauce (cream, sugar)", True),
+    ({"religion_restrictions": ["halal"]}, "Olive oil, red wine vinegar, oregano, salt", False),
+    ({"religion_restrictions": ["halal"]}, "Rice wine vinegar, soy sauce, ginger", False),
+    ({"religion_restrictions": ["halal"]}, "Chicken braised in white wine, garlic", True),
+    ({"allergies": ["shellfish"]}, "Crab apple jelly (crab apples, sugar, lemon juice)", False),
+    ({"allergies": ["shellfish"]}, "Crab cakes (crab, breadcrumbs, egg)", True),
+    ({"allergies": ["milk"]}, "Cold cream: mineral oil, beeswax, water, borax", False),
+]
+
+
+class NaiveMatcher:
+    """Baseline: one word-bounded regex search per profile term, no qualifiers"""
+
+    def __init__(self, profile: dict):
+        categories, literals = profile_categories(profile)
+        terms = [term for category in categories for term in ALLERGEN_TERMS.get(category, [])]
+        terms.extend(literals)
+        self.patterns = [re.compile(r"\b" + re.escape(term) + r"\b") for term in terms]
+
+    def definitive_unsafe(self, text: str):
+        lowered = text.lower()
+        matches = [pattern.pattern for pattern in self.patterns if pattern.search(lowered)]
+        return matches or None
+
+
+def evaluate(matcher_cls):
+    stats = {"tp": 0, "fp": 0, "tn": 0, "fn": 0, "false_positive_cases": []}
+    for profile, text, expected in CORPUS:
+        predicted = matcher_cls(profile).definitive_unsafe(text) is not None
+        if predicted and expected:
+            stats["tp"] += 1
+        elif predicted:
+            stats["fp"] += 1
+            stats["false_positive_cases"].append(text)
+        elif expected:
+            stats["fn"] += 1
+        else:
+            stats["tn"] += 1
+    return stats
+
+
+def throughput(matcher_cls, rounds: int):
+    # Compile once per distinct profile, as a request would; time the scans
+    compiled = [(matcher_cls(profile), text) for profile, text, _ in CORPUS]
+    characters = sum(len(text) for _, text in compiled) * rounds
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for matcher, text in compiled:
+            matcher.definitive_unsafe(text)
+    elapsed = time.perf_counter() - started
+
+    compile_started = time.perf_counter()
+    for _ in range(rounds):
+        for profile, _, _ in CORPUS:
+            matcher_cls(profile)
+    compile_elapsed = time.perf_counter() - compile_started
+
+    scans = len(compiled) * rounds
+    return {
+        "scans_per_second": scans / elapsed,
+        "mb_per_second": characters / elapsed / 1e6,
+        "compile_ms": compile_elapsed / scans * 1000,
+    }
+
+
+def report(name: str, stats: dict, speed: dict):
+    total = stats["tp"] + stats["fp"] + stats["tn"] + stats["fn"]
+    precision = stats["tp"] / (stats["tp"] + stats["fp"]) if stats["tp"] + stats["fp"] else 0.0
+    recall = stats["tp"] / (stats["tp"] + stats["fn"]) if stats["tp"] + stats["fn"] else 0.0
+    print(f"\n{name}")
+    print("-" * 60)
+    print(f"Accuracy:            {(stats['tp'] + stats['tn']) / total:.1%} ({total} cases)")
+    print(f"Precision (unsafe):  {precision:.1%}   <- wrong 'unsafe' verdicts never reach the LLM")
+    print(f"Recall (unsafe):     {recall:.1%}   <- share of unsafe cases answered locally")
+    print(f"LLM calls avoided:   {(stats['tp'] + stats['fp']) / total:.1%}")
+    print(f"Scans per second:    {speed['scans_per_second']:,.0f} ({speed['mb_per_second']:.2f} MB/s)")
+    print(f"Compile per profile: {speed['compile_ms']:.3f} ms")
+    for text in stats["false_positive_cases"]:
+        print(f"   ❌ false positive: {text}")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print("🔍 Allergen matcher benchmark")
+    print("=" * 60)
+
+    matcher_stats = evaluate(ProfileMatcher)
+    report("Aho-Corasick ProfileMatcher", matcher_stats, throughput(ProfileMatcher, rounds))
+    report("Naive regex baseline", evaluate(NaiveMatcher), throughput(NaiveMatcher, rounds))
+
+    if matcher_stats["fp"]:
+        print("\n❌ ProfileMatcher produced false 'unsafe' verdicts")
+        return 1
+    print("\n✅ No false 'unsafe' verdicts from ProfileMatcher")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
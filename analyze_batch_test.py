@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test for the batch analysis endpoint (shopping lists)
+Tests /api/analyze/batch routing, authentication and request validation
+"""
+
+import requests
+import sys
+
+def test_analyze_batch_endpoint():
+    """Test the /api/analyze/batch endpoint"""
+    base_url = "https://menu-scanner-11.preview.emergentagent.com"
+    api_url = f"{base_url}/api"
+
+    print("🔍 Testing Batch Analysis Endpoint")
+    print("=" * 60)
+
+    test_results = []
+    shopping_list = ["Peanut butter", "Organic almond milk", "Gluten-free bread", "Dark chocolate 70%"]
+
+    # Test 1: Endpoint exists and is accessible
+    print("\n1. Testing endpoint accessibility...")
+    try:
+        response = requests.post(f"{api_url}/analyze/batch", json={"queries": shopping_list})
+        if response.status_code == 401:
+            print("✅ Endpoint exists and requires authentication (401)")
+            test_results.append(("Endpoint Exists", True, "Returns 401 as expected"))
+        else:
+            print(f"❌ Unexpected response: {response.status_code}")
+            test_results.append(("Endpoint Exists", False, f"Got {response.status_code}"))
+    except Exception as e:
+        print(f"❌ Error accessing endpoint: {e}")
+        test_results.append(("Endpoint Exists", False, str(e)))
+
+    # Test 2: Method validation (POST only)
+    print("\n2. Testing HTTP method validation...")
+    try:
+        response = requests.get(f"{api_url}/analyze/batch")
+        if response.status_code == 405:
+            print("✅ GET method correctly rejected (405)")
+            test_results.append(("Method Validation", True, "GET returns 405"))
+        else:
+            print(f"❌ GET method response: {response.status_code}")
+            test_results.append(("Method Validation", False, f"GET returns {response.status_code}"))
+    except Exception as e:
+        print(f"❌ Error testing GET method: {e}")
+        test_results.append(("Method Validation", False, str(e)))
+
+    # Test 3: Request validation - missing queries field
+    print("\n3. Testing request validation...")
+    for label, payload in [("missing queries", {}), ("queries not a list", {"queries": "milk"})]:
+        try:
+            response = requests.post(f"{api_url}/analyze/batch", json=payload)
+            if response.status_code in [401, 422]:
+                print(f"✅ {label} handled correctly ({response.status_code})")
+                test_results.append((f"Validation: {label}", True, f"Returns {response.status_code}"))
+            else:
+                print(f"❌ Unexpected response for {label}: {response.status_code}")
+                test_results.append((f"Validation: {label}", False, f"Returns {response.status_code}"))
+        except Exception as e:
+            print(f"❌ Error testing {label}: {e}")
+            test_results.append((f"Validation: {label}", False, str(e)))
+
+    # Test 4: Single-item endpoint is not shadowed by the batch route
+    print("\n4. Testing /api/analyze still routes separately...")
+    try:
+        response = requests.post(f"{api_url}/analyze", json={"query": "Peanut butter"})
+        if response.status_code == 401:
+            print("✅ /api/analyze requires authentication (401)")
+            test_results.append(("Single Endpoint", True, "Returns 401"))
+        else:
+            print(f"❌ /api/analyze response: {response.status_code}")
+            test_results.append(("Single Endpoint", False, f"Returns {response.status_code}"))
+    except Exception as e:
+        print(f"❌ Error testing /api/analyze: {e}")
+        test_results.append(("Single Endpoint", False, str(e)))
+
+    # Summary
+    print("\n" + "=" * 60)
+    print("📊 Test Summary:")
+    passed = sum(1 for _, success, _ in test_results if success)
+    total = len(test_results)
+
+    for test_name, success, details in test_results:
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status}: {test_name} - {details}")
+
+    print(f"\n🎯 Results: {passed}/{total} tests passed ({(passed/total)*100:.1f}%)")
+
+    if passed == total:
+        print("🎉 All batch analysis tests passed!")
+        return True
+    else:
+        print("⚠️ Some tests failed - see details above")
+        return False
+
+def main():
+    """Main test function"""
+    success = test_analyze_batch_endpoint()
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
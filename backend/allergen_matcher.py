@@ -0,0 +1,405 @@
+"""Local, deterministic allergen matching.
+
+A synonym/derivative dictionary (whey -> milk, albumin -> egg, E-numbers,
+fragrance compounds, ...) is compiled per profile into an Aho-Corasick
+automaton. Scanning an ingredient list is then a single pass over the text.
+
+The matcher only ever answers "definitely unsafe": a match that is
+qualified ("dairy-free", "may contain", "without nuts", "vegan cheese") or
+masked by a known false friend ("cocoa butter", "almond milk") doesn't
+count, and anything short of an unqualified hit is left to the LLM. So is
+free text it can't map to a category, except in the allergies field, and
+skin sensitivities, which describe contact rather than what may be eaten.
+"""
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# Category -> terms that mean the product contains it
+ALLERGEN_TERMS: Dict[str, List[str]] = {
+    "peanut": [
+        "peanut", "peanuts", "groundnut", "groundnuts", "arachis oil", "arachis hypogaea",
+        "monkey nuts", "peanut butter", "peanut oil", "peanut flour",
+    ],
+    "tree nut": [
+        "almond", "almonds", "cashew", "cashews", "walnut", "walnuts", "pecan", "pecans",
+        "hazelnut", "hazelnuts", "filbert", "filberts", "pistachio", "pistachios",
+        "macadamia", "brazil nut", "brazil nuts", "pine nut", "pine nuts", "praline",
+        "marzipan", "gianduja", "nut butter", "tree nuts",
+    ],
+    "milk": [
+        "milk", "whole milk", "skimmed milk", "milk powder", "milk solids", "milkfat", "milk fat",
+        "whey", "whey protein", "casein", "caseinate", "sodium caseinate", "calcium caseinate",
+        "lactose", "lactalbumin", "lactoglobulin", "butter", "buttermilk", "butterfat",
+        "cream", "sour cream", "cheese", "ghee", "yogurt", "yoghurt", "curd", "curds",
+        "kefir", "paneer", "e966",
+    ],
+    "egg": [
+        "egg", "eggs", "egg white", "egg yolk", "dried egg", "albumin", "albumen", "ovalbumin",
+        "ovomucoid", "ovovitellin", "lysozyme", "e1105", "mayonnaise", "meringue",
+    ],
+    "gluten": [
+        "wheat", "wheat flour", "gluten", "barley", "rye", "spelt", "kamut", "semolina", "durum",
+        "farina", "malt", "malt extract", "seitan", "couscous", "bulgur", "triticale",
+    ],
+    "soy": [
+        "soy", "soya", "soybean", "soybeans", "soy protein", "soy lecithin", "soya lecithin",
+        "edamame", "tofu", "tempeh", "miso", "soy sauce", "shoyu", "tamari",
+    ],
+    "fish": [
+        "fish", "anchovy", "anchovies", "cod", "salmon", "tuna", "sardine", "sardines",
+        "haddock", "tilapia", "pollock", "mackerel", "fish sauce", "fish oil",
+    ],
+    "shellfish": [
+        "shellfish", "shrimp", "shrimps", "prawn", "prawns", "crab", "lobster", "crayfish",
+        "langoustine", "scampi", "krill", "oyster", "oysters", "mussel", "mussels", "clam",
+        "clams", "scallop", "scallops", "squid", "octopus",
+    ],
+    "sesame": ["sesame", "sesame seeds", "sesame oil", "tahini", "gingelly", "benne seed"],
+    "mustard": ["mustard", "mustard seed", "mustard flour"],
+    "celery": ["celery", "celeriac", "celery salt"],
+    "lupin": ["lupin", "lupine", "lupin flour"],
+    "sulphites": [
+        "sulphite", "sulphites", "sulfite", "sulfites", "sulphur dioxide", "sulfur dioxide",
+        "metabisulphite", "metabisulfite", "sodium metabisulphite", "sodium metabisulfite",
+        "e220", "e221", "e222", "e223", "e224", "e225", "e226", "e227", "e228",
+    ],
+    "fragrance": [
+        "fragrance", "parfum", "perfume", "linalool", "limonene", "citronellol", "geraniol",
+        "eugenol", "isoeugenol", "coumarin", "cinnamal", "hexyl cinnamal", "amyl cinnamal",
+        "citral", "farnesol", "benzyl alcohol", "benzyl benzoate", "benzyl salicylate",
+        "benzyl cinnamate", "hydroxycitronellal", "alpha-isomethyl ionone", "evernia prunastri",
+        "oakmoss",
+    ],
+    "paraben": [
+        "paraben", "parabens", "methylparaben", "ethylparaben", "propylparaben", "butylparaben",
+        "isobutylparaben",
+    ],
+    "sulfate": [
+        "sodium lauryl sulfate", "sodium laureth sulfate", "ammonium lauryl sulfate",
+        "ammonium laureth sulfate", "sls", "sles",
+    ],
+    "pork": [
+        "pork", "bacon", "ham", "lard", "pancetta", "prosciutto", "chorizo", "pepperoni", "salami",
+    ],
+    "gelatin": ["gelatin", "gelatine", "e441"],
+    "alcohol": ["alcohol", "ethanol", "wine", "beer", "rum", "brandy", "vodka", "whisky", "whiskey", "liqueur"],
+    "meat": ["beef", "chicken", "lamb", "mutton", "veal", "turkey", "duck", "venison", "meat"],
+    "animal additive": ["carmine", "cochineal", "e120", "shellac", "e904", "bone phosphate", "e542", "isinglass"],
+    "honey": ["honey", "beeswax", "royal jelly", "propolis"],
+}
+
+# Phrases that contain an allergen word but don't mean the allergen
+FALSE_FRIENDS = [
+    "cocoa butter", "shea butter", "mango butter", "kokum butter", "illipe butter", "apple butter",
+    "cream of tartar", "cream soda", "milk thistle", "butternut", "butterfly",
+    "peanut-free", "nut-free", "dairy-free", "milk-free", "egg-free", "gluten-free", "soy-free",
+    "alcohol-free", "fragrance-free", "paraben-free", "sulfate-free",
+    "cetyl alcohol", "cetearyl alcohol", "stearyl alcohol", "behenyl alcohol", "lanolin alcohol",
+    "sugar alcohol", "nutmeg", "buckwheat", "hamburger", "oyster mushroom", "oyster mushrooms",
+    "crab apple", "crab apples",
+    # Cosmetics named after food textures
+    "hand cream", "face cream", "eye cream", "day cream", "night cream", "body cream", "foot cream",
+    "moisturizing cream", "moisturising cream", "shaving cream", "sun cream", "cold cream", "cream cleanser",
+    "body butter", "lip butter", "body milk", "cleansing milk",
+]
+
+# Phrases that don't mean one category but may still name another
+# ("peanut butter" is no dairy, but it is peanut)
+CATEGORY_FALSE_FRIENDS: Dict[str, List[str]] = {
+    "milk": [
+        "coconut milk", "almond milk", "oat milk", "soy milk", "soya milk", "rice milk", "cashew milk",
+        "hemp milk", "pea milk", "coconut cream", "coconut yogurt", "coconut yoghurt",
+        "coconut milk ice cream", "almond milk ice cream", "oat milk ice cream",
+        "peanut butter", "nut butter", "almond butter", "cashew butter", "hazelnut butter",
+        "pistachio butter", "macadamia butter", "walnut butter", "pecan butter", "coconut butter",
+        "seed butter", "sunflower butter", "sunflower seed butter", "pumpkin seed butter", "soy butter",
+        "sesame butter",
+    ],
+    "fish": ["swedish fish", "fish-shaped"],
+    "alcohol": ["wine vinegar"],
+}
+
+# A qualifier right before a term: the product is a substitute for these categories
+_ANIMAL_PRODUCTS = ("meat", "pork", "fish", "shellfish", "gelatin", "animal additive", "milk", "egg", "honey")
+_SUBSTITUTE_QUALIFIERS: Dict[str, Tuple[str, ...]] = {
+    "vegan": _ANIMAL_PRODUCTS,
+    "plantbased": _ANIMAL_PRODUCTS,
+    "eggless": ("egg",),
+    "eggfree": ("egg",),
+    "dairyfree": ("milk",),
+    "milkfree": ("milk",),
+}
+
+# What a user may write in their profile -> categories it covers
+PROFILE_ALIASES: Dict[str, List[str]] = {
+    "peanut": ["peanut"], "peanuts": ["peanut"], "groundnut": ["peanut"],
+    "nut": ["peanut", "tree nut"], "nuts": ["peanut", "tree nut"],
+    "tree nut": ["tree nut"], "tree nuts": ["tree nut"], "treenut": ["tree nut"], "treenuts": ["tree nut"],
+    "milk": ["milk"], "dairy": ["milk"], "lactose": ["milk"], "lactose intolerance": ["milk"],
+    "lactose intolerant": ["milk"], "casein": ["milk"], "whey": ["milk"],
+    "egg": ["egg"], "eggs": ["egg"],
+    "gluten": ["gluten"], "wheat": ["gluten"], "celiac": ["gluten"], "coeliac": ["gluten"],
+    "gluten-free": ["gluten"], "gluten free": ["gluten"],
+    "soy": ["soy"], "soya": ["soy"], "soybean": ["soy"], "soybeans": ["soy"],
+    "fish": ["fish"], "shellfish": ["shellfish"], "crustacean": ["shellfish"], "crustaceans": ["shellfish"],
+    "molluscs": ["shellfish"], "mollusks": ["shellfish"], "seafood": ["fish", "shellfish"],
+    "sesame": ["sesame"], "mustard": ["mustard"], "celery": ["celery"], "lupin": ["lupin"],
+    "sulphites": ["sulphites"], "sulfites": ["sulphites"], "sulphite": ["sulphites"], "sulfite": ["sulphites"],
+    "fragrance": ["fragrance"], "fragrances": ["fragrance"], "perfume": ["fragrance"], "parfum": ["fragrance"],
+    "paraben": ["paraben"], "parabens": ["paraben"],
+    "sulfate": ["sulfate"], "sulfates": ["sulfate"], "sulphates": ["sulfate"], "sls": ["sulfate"],
+    "pork": ["pork"], "gelatin": ["gelatin"], "gelatine": ["gelatin"], "alcohol": ["alcohol"],
+    "honey": ["honey"],
+    "halal": ["pork", "alcohol", "gelatin"],
+    "kosher": ["pork", "shellfish"],
+    "vegetarian": ["meat", "pork", "fish", "shellfish", "gelatin", "animal additive"],
+    "vegan": ["meat", "pork", "fish", "shellfish", "gelatin", "animal additive", "milk", "egg", "honey"],
+    "hindu vegetarian": ["meat", "pork", "fish", "shellfish", "gelatin", "animal additive", "egg"],
+    "jain": ["meat", "pork", "fish", "shellfish", "gelatin", "animal additive", "egg", "honey"],
+}
+
+# Generic safe swaps per category, used when the verdict never reaches the LLM
+ALTERNATIVES: Dict[str, List[str]] = {
+    "peanut": ["Sunflower seed butter", "Pumpkin seed butter", "Tahini (if sesame is safe)", "Roasted chickpea snacks"],
+    "tree nut": ["Sunflower seeds", "Pumpkin seeds", "Toasted oats", "Seed-based granola"],
+    "milk": ["Oat milk", "Coconut yogurt", "Dairy-free cheese", "Olive oil spread"],
+    "egg": ["Flax egg (ground flaxseed + water)", "Aquafaba", "Egg-free mayonnaise", "Chia seed egg"],
+    "gluten": ["Certified gluten-free bread", "Rice or quinoa", "Buckwheat noodles", "Corn tortillas"],
+    "soy": ["Coconut aminos", "Chickpea tofu", "Oat milk", "Sunflower lecithin products"],
+    "fish": ["Seaweed-based seasoning", "Jackfruit 'tuna'", "Algae oil (omega-3)", "Chickpea salad"],
+    "shellfish": ["King oyster mushroom 'scallops'", "Hearts of palm 'crab'", "Tofu", "Chicken"],
+    "sesame": ["Sunflower seed butter", "Pumpkin seeds", "Olive oil", "Hemp seeds"],
+    "mustard": ["Turmeric and vinegar dressing", "Mustard-free mayonnaise", "Horseradish sauce"],
+    "celery": ["Fennel", "Cucumber", "Bok choy"],
+    "lupin": ["Chickpea flour", "Rice flour", "Oat flour"],
+    "sulphites": ["Sulphite-free wine", "Fresh (undried) fruit", "Preservative-free products"],
+    "fragrance": ["Fragrance-free moisturizer", "Unscented soap", "Fragrance-free laundry detergent"],
+    "paraben": ["Paraben-free skincare", "Preservative-free minimalist formulas", "Certified organic skincare"],
+    "sulfate": ["Sulfate-free shampoo", "Gentle cleansing bar", "Co-wash conditioner"],
+    "pork": ["Halal beef or chicken", "Turkey bacon", "Plant-based sausage"],
+    "gelatin": ["Agar-agar", "Pectin-set sweets", "Carrageenan-based desserts"],
+    "alcohol": ["Alcohol-free extracts", "Sparkling juice", "Non-alcoholic alternatives"],
+    "meat": ["Tofu", "Tempeh", "Lentils", "Chickpeas"],
+    "animal additive": ["Beet-red colouring", "Plant-based glazes", "Certified vegan products"],
+    "honey": ["Maple syrup", "Agave syrup", "Date syrup"],
+}
+
+# Words before/after a term that turn it from "contains" into something else.
+# Precautionary labelling qualifies the rest of its sentence; plain negation
+# only the list item it appears in.
+_PRECAUTION_BEFORE = re.compile(
+    r"\b(?:may\s+(?:also\s+)?contain|traces?\s+of|facility|factory|equipment|produced\s+in|made\s+in\s+a)\b[^.;\n]{0,80}$"
+)
+_NEGATION_BEFORE = re.compile(
+    r"\b(?:no|non|not|without|free\s+(?:from|of)|substitute\s+for|instead\s+of|imitation|allergy|allergic|avoid)\b[^.,;:\n]{0,25}$"
+)
+# "no milk, eggs or peanuts": a negation carried along a short plain list
+_NEGATED_LIST_BEFORE = re.compile(
+    r"\b(?:no|without|free\s+(?:from|of))\s+[\w\s-]{1,25}(?:,\s*[\w\s-]{1,25}){0,4},?\s*(?:(?:or|nor|and)\s+)?$"
+)
+_NEGATION_AFTER = re.compile(r"^\s*-?\s*(?:free|alternative|substitute|allergy|allergic)\b")
+# "vegan butter", "eggless mayonnaise", "dairy-free cream cheese"
+_SUBSTITUTE_BEFORE = re.compile(
+    r"\b(vegan|plant[\s-]?based|eggless|egg[\s-]?free|dairy[\s-]?free|milk[\s-]?free)\s+(?:[a-z]+\s+)?$"
+)
+# "no pork", "avoid alcohol" in a profile mean the category itself
+_PROFILE_RESTRICTION_PREFIX = re.compile(r"^(?:no|avoid)\s+")
+
+_WORD_CHAR = re.compile(r"\w")
+
+
+# Process-wide counters, reported under /api/metrics
+MATCHER_STATS = {"local_verdicts": 0, "llm_overrides": 0}
+
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    term: str
+    category: str
+
+
+class _Mask(NamedTuple):
+    """Automaton payload of a false friend: hides matches of category (None: any) inside it"""
+    category: Optional[str]
+
+
+class AhoCorasick:
+    """Minimal Aho-Corasick automaton over lowercase strings."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, object]]] = [[]]
+        for pattern, payload in patterns:
+            self._add(pattern, payload)
+        self._build()
+
+    def _add(self, pattern: str, payload):
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((pattern, payload))
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0) if state else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str):
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern, payload in out[state]:
+                yield index - len(pattern) + 1, index + 1, pattern, payload
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+
+def profile_categories(profile: dict) -> Tuple[Set[str], Set[str]]:
+    """Map profile entries to (known categories, unrecognised literal terms)
+
+    Only allergies become literals: dietary and religious free text ("keto",
+    "low sugar") isn't an ingredient name. Skin sensitivities are left out.
+    """
+    categories: Set[str] = set()
+    literals: Set[str] = set()
+    for field in ('allergies', 'dietary_restrictions', 'religion_restrictions'):
+        for raw in profile.get(field) or []:
+            term = _PROFILE_RESTRICTION_PREFIX.sub('', str(raw).strip().lower())
+            if not term or term in ('none', 'n/a'):
+                continue
+            if term in PROFILE_ALIASES:
+                categories.update(PROFILE_ALIASES[term])
+            elif term.rstrip('s') in PROFILE_ALIASES:
+                categories.update(PROFILE_ALIASES[term.rstrip('s')])
+            elif term in ALLERGEN_TERMS:
+                categories.add(term)
+            elif field == 'allergies':
+                literals.add(term)
+    return categories, literals
+
+
+class ProfileMatcher:
+    """Aho-Corasick matcher for one allergy profile."""
+
+    def __init__(self, profile: dict):
+        self.categories, self.literals = profile_categories(profile)
+        patterns = []
+        for category in sorted(self.categories):
+            for term in ALLERGEN_TERMS.get(category, []):
+                patterns.append((term, category))
+        for literal in sorted(self.literals):
+            patterns.append((literal, literal))
+            if not literal.endswith('s'):
+                patterns.append((literal + 's', literal))
+        if patterns:
+            # False friends only matter when something could collide with them
+            patterns.extend((phrase, _Mask(None)) for phrase in FALSE_FRIENDS)
+            for category in sorted(self.categories & set(CATEGORY_FALSE_FRIENDS)):
+                patterns.extend((phrase, _Mask(category)) for phrase in CATEGORY_FALSE_FRIENDS[category])
+        self.automaton = AhoCorasick(patterns) if patterns else None
+
+    @staticmethod
+    def _is_word_bounded(text: str, start: int, end: int) -> bool:
+        before_ok = start == 0 or not _WORD_CHAR.match(text[start - 1])
+        after_ok = end >= len(text) or not _WORD_CHAR.match(text[end])
+        return before_ok and after_ok
+
+    @staticmethod
+    def _is_qualified(text: str, start: int, end: int, category: str) -> bool:
+        before = text[max(0, start - 120):start]
+        substitute = _SUBSTITUTE_BEFORE.search(before)
+        if substitute and category in _SUBSTITUTE_QUALIFIERS[re.sub(r'[\s-]', '', substitute.group(1))]:
+            return True
+        return bool(_PRECAUTION_BEFORE.search(before) or
+                    _NEGATION_BEFORE.search(before) or
+                    _NEGATED_LIST_BEFORE.search(before) or
+                    _NEGATION_AFTER.match(text[end:end + 20]))
+
+    def find(self, text: str) -> List[Match]:
+        """Unqualified allergen matches in ``text`` (longest match per span)"""
+        if self.automaton is None or not text:
+            return []
+        lowered = text.lower()
+        hits = []
+        masks = []
+        for start, end, term, category in self.automaton.iter_matches(lowered):
+            if not self._is_word_bounded(lowered, start, end):
+                continue
+            if isinstance(category, _Mask):
+                masks.append((start, end, category.category))
+            else:
+                hits.append(Match(start, end, term, category))
+
+        matches = []
+        for hit in sorted(hits, key=lambda m: (m.start, -(m.end - m.start))):
+            if any(m_start <= hit.start and hit.end <= m_end and m_category in (None, hit.category)
+                   for m_start, m_end, m_category in masks):
+                continue
+            if matches and hit.start < matches[-1].end:
+                continue  # shorter overlap of a term already matched
+            if self._is_qualified(lowered, hit.start, hit.end, hit.category):
+                continue
+            matches.append(hit)
+        return matches
+
+    def definitive_unsafe(self, text: str) -> Optional[List[Match]]:
+        """Matches if ``text`` certainly contains something the profile excludes, else None"""
+        matches = self.find(text)
+        return matches or None
+
+
+INGREDIENTS_LABEL = re.compile(r"\bingredients?\s*[:\-]", re.IGNORECASE)
+
+
+def ingredient_section(text: str, max_length: int = 2000) -> Optional[str]:
+    """The text following an 'Ingredients:' label, if there is one"""
+    label = INGREDIENTS_LABEL.search(text)
+    if not label:
+        return None
+    section = text[label.end():label.end() + max_length]
+    # Stop at the next blank line / section break
+    return re.split(r"\n\s*\n", section, maxsplit=1)[0]
+
+
+def describe_matches(matches: List[Match], text: str) -> Tuple[List[str], List[str]]:
+    """(warnings, alternatives) for a list of matches"""
+    by_category: Dict[str, List[str]] = {}
+    for match in matches:
+        found = text[match.start:match.end]
+        terms = by_category.setdefault(match.category, [])
+        if found not in terms:
+            terms.append(found)
+
+    warnings = [
+        f"Contains {category} ({', '.join(terms)})" if terms[0].lower() != category else f"Contains {category}"
+        for category, terms in by_category.items()
+    ]
+    alternatives: List[str] = []
+    for category in by_category:
+        for option in ALTERNATIVES.get(category, []):
+            if option not in alternatives:
+                alternatives.append(option)
+    return warnings, alternatives[:5]
@@ -0,0 +1,48 @@
+"""Grouping a list of products into multi-item prompts, and mapping the answers back.
+
+A shopping list is analyzed with a few prompts of several items each
+instead of one call per item. Repeated items are asked about once. The
+model is asked to echo each product name, and answers are matched to
+queries by that name. The order of the answers is only trusted when the
+model renamed every item but still answered each one. Answers matched by
+position are never cached as single-item answers.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from llm_cache import normalize_query
+from menu_chunks import batched
+
+
+def unique_queries(queries: Sequence[str]) -> List[str]:
+    """The first spelling of every distinct query, in list order"""
+    first = {}
+    for query in queries:
+        first.setdefault(normalize_query(query), query)
+    return list(first.values())
+
+
+def query_groups(queries: Sequence[str], items_per_prompt: int) -> List[Sequence[str]]:
+    return batched(unique_queries(queries), items_per_prompt)
+
+
+def match_answers(queries: Sequence[str], answers: Sequence[dict]) -> List[Tuple[Optional[dict], bool]]:
+    """(answer or None, matched by name) for each query, in order
+
+    Each answer is given to at most one query. Answers go by position only
+    when none matched by name and there is exactly one answer per query.
+    """
+    by_item = {}
+    for index, answer in enumerate(answers):
+        by_item.setdefault(normalize_query(str(answer.get('item', ''))), index)
+
+    matched: List[Tuple[Optional[dict], bool]] = [(None, False)] * len(queries)
+    claimed = set()
+    for position, query in enumerate(queries):
+        index = by_item.get(normalize_query(query))
+        if index is not None and index not in claimed:
+            claimed.add(index)
+            matched[position] = (answers[index], True)
+
+    if not claimed and len(answers) == len(queries):
+        matched = [(answer, False) for answer in answers]
+    return matched
@@ -0,0 +1,90 @@
+import os
+from typing import Dict, Optional, Tuple
+
+from allergen_matcher import ProfileMatcher
+from llm_cache import PROFILE_FIELDS, canonical_terms, profile_fingerprint
+from ttl_cache import TTLCache
+
+
+def _joined(terms: Tuple[str, ...]) -> str:
+    return ', '.join(terms) if terms else 'None'
+
+
+class CompiledProfile:
+    """Everything derived from an allergy profile that doesn't depend on the request.
+
+    Built once per distinct profile (by fingerprint) and shared by every user
+    with the same lists: the normalized terms, the allergen matcher and the
+    profile lines the system prompts start with.
+    """
+
+    def __init__(self, profile: dict, fingerprint: Optional[str] = None):
+        self.fingerprint = fingerprint or profile_fingerprint(profile)
+        self.terms: Dict[str, Tuple[str, ...]] = {
+            field: tuple(canonical_terms(profile.get(field))) for field in PROFILE_FIELDS
+        }
+        self.matcher = ProfileMatcher(self.terms)
+
+        allergies = _joined(self.terms['allergies'])
+        dietary = _joined(self.terms['dietary_restrictions'])
+        religion = _joined(self.terms['religion_restrictions'])
+        skin = _joined(self.terms['skin_sensitivities'])
+        restrictions = (
+            f"User's allergies: {allergies}\n"
+            f"Dietary restrictions: {dietary}\n"
+            f"Religion restrictions: {religion}"
+        )
+        # Analysis and label prompts
+        self.prompt_header = f"{restrictions}\nSkin sensitivities: {skin}"
+        # Menu prompts leave skin sensitivities out
+        self.menu_prompt_header = restrictions
+        self.recipe_prompt_header = f"{restrictions}\nSkin sensitivities (avoid if relevant): {skin}"
+
+    @property
+    def automaton_states(self) -> int:
+        automaton = self.matcher.automaton
+        return automaton.states if automaton is not None else 0
+
+
+class CompiledProfileCache:
+    """Bounded cache of CompiledProfile objects keyed by profile fingerprint.
+
+    It also remembers which fingerprint each user last resolved to, so a
+    profile write can drop that user's entry without reading the old
+    profile back.
+    """
+
+    def __init__(self):
+        maxsize = int(os.environ.get('PROFILE_CACHE_SIZE', '1000'))
+        ttl = float(os.environ.get('PROFILE_CACHE_TTL', str(60 * 60)))
+        self._compiled = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._by_user = TTLCache(maxsize=maxsize * 10, ttl=ttl)
+        self.compiles = 0
+        self.invalidations = 0
+
+    def get(self, profile: dict) -> CompiledProfile:
+        fingerprint = profile_fingerprint(profile)
+        compiled = self._compiled.get(fingerprint)
+        if compiled is None:
+            compiled = CompiledProfile(profile, fingerprint)
+            self._compiled.set(fingerprint, compiled)
+            self.compiles += 1
+        if profile.get('user_id'):
+            self._by_user.set(profile['user_id'], fingerprint)
+        return compiled
+
+    def invalidate_user(self, user_id: str):
+        """Forget the compiled profile the user was last seen with"""
+        fingerprint = self._by_user.pop(user_id)
+        if fingerprint is not None and self._compiled.pop(fingerprint) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        compiled = self._compiled.values()
+        return {
+            **self._compiled.stats(),
+            "users_tracked": len(self._by_user),
+            "compiles": self.compiles,
+            "invalidations": self.invalidations,
+            "automaton_states": sum(entry.automaton_states for entry in compiled),
+        }
@@ -0,0 +1,299 @@
+"""Document text extraction.
+
+Extractors are registered once and picked by magic bytes first, then by
+content type, then by file extension. Each one yields text incrementally so
+callers can stop as soon as their character budget is filled -- a 300-page
+PDF only has its first few pages extracted when the prompt can only hold
+20k characters.
+
+Everything here is synchronous and CPU-bound, and runs inside the document
+worker pool (see worker_pool.py), so entry points must stay module-level and
+take/return only picklable values.
+"""
+import io
+import json
+import logging
+import zipfile
+from typing import Callable, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+logger = logging.getLogger(__name__)
+
+UNWANTED_TAGS = ["script", "style", "nav", "header", "footer", "iframe", "noscript"]
+PRODUCT_SECTION_KEYWORDS = ['product', 'item', 'detail', 'description', 'ingredient', 'content', 'info']
+MENU_SECTION_KEYWORDS = ['menu', 'food', 'dish', 'item', 'product', 'category']
+MENU_LINK_KEYWORDS = ['menu', 'food', 'dish', 'category', 'breakfast', 'lunch', 'dinner',
+                      'drink', 'beverage', 'appetizer', 'entree', 'dessert', 'sandwich', 'salad']
+MENU_SKIP_PHRASES = ['sign in', 'account', 'rewards', 'join', 'login', 'register', 'newsletter', 'subscribe', 'cart', 'checkout']
+
+TEXT_SLICE = 4096
+
+
+class ExtractionContext:
+    """Per-document options and side outputs shared with an extractor."""
+
+    def __init__(self, mode: str = 'product', encoding: Optional[str] = None,
+                 base_url: str = "", collect_links: bool = False):
+        self.mode = mode  # 'product' or 'menu'
+        self.encoding = encoding
+        self.base_url = base_url
+        self.collect_links = collect_links
+        self.links: List[str] = []
+
+
+class Extractor:
+    def __init__(self, name: str, fn: Callable[[bytes, ExtractionContext], Iterator[str]],
+                 content_types=(), extensions=(), sniff: Callable[[bytes], bool] = None,
+                 sectioned: bool = False):
+        self.name = name
+        self.fn = fn
+        self.content_types = content_types
+        self.extensions = extensions
+        self.sniff = sniff
+        # Sectioned extractors yield independent sections (HTML menu blocks);
+        # the others yield consecutive slices of a single document.
+        self.sectioned = sectioned
+
+
+EXTRACTORS: List[Extractor] = []
+
+
+def register_extractor(name, content_types=(), extensions=(), sniff=None, sectioned=False):
+    def decorator(fn):
+        EXTRACTORS.append(Extractor(name, fn, content_types, extensions, sniff, sectioned))
+        return fn
+    return decorator
+
+
+def _zip_member_prefix(content: bytes, prefix: str) -> bool:
+    if not content.startswith(b'PK\x03\x04'):
+        return False
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            return any(name.startswith(prefix) for name in archive.namelist())
+    except zipfile.BadZipFile:
+        return False
+
+
+def _looks_like_html(content: bytes) -> bool:
+    head = content[:1024].lstrip().lower()
+    return head.startswith((b'<!doctype html', b'<html')) or b'<html' in head
+
+
+def select_extractor(content: bytes, content_type: str = "", filename: str = "") -> Optional[Extractor]:
+    content_type = (content_type or "").lower()
+    path = urlparse(filename).path.lower() if filename else ""
+
+    for extractor in EXTRACTORS:
+        if extractor.sniff and extractor.sniff(content):
+            return extractor
+    for extractor in EXTRACTORS:
+        if any(marker in content_type for marker in extractor.content_types):
+            return extractor
+    for extractor in EXTRACTORS:
+        if path.endswith(extractor.extensions):
+            return extractor
+    return None
+
+
+def _decode(content: bytes, encoding: Optional[str]) -> str:
+    return content.decode(encoding or 'utf-8', errors='replace')
+
+
+def _clean_text(text: str, min_length: int) -> str:
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk and len(chunk) > min_length)
+
+
+def _keep_menu_line(line: str) -> bool:
+    return len(line) > 10 and not any(phrase in line.lower() for phrase in MENU_SKIP_PHRASES)
+
+
+def filter_menu_content(menu_pieces: List[str]) -> str:
+    """Join crawled menu pieces and drop short or promotional lines"""
+    combined_menu = '\n\n=== MENU SECTION ===\n\n'.join(menu_pieces)
+    return '\n'.join(line for line in combined_menu.split('\n') if _keep_menu_line(line))
+
+
+def menu_text_length(text: str) -> int:
+    """Characters ``text`` contributes once passed through filter_menu_content"""
+    return sum(len(line) + 1 for line in text.split('\n') if _keep_menu_line(line))
+
+
+# Extractors, in registration order. Sniffers are checked before content
+# types, so a PDF served as application/octet-stream is still read as a PDF.
+
+@register_extractor('pdf', content_types=('pdf',), extensions=('.pdf',),
+                    sniff=lambda content: content.startswith(b'%PDF-'))
+def _extract_pdf(content: bytes, context: ExtractionContext) -> Iterator[str]:
+    from PyPDF2 import PdfReader
+    pdf_reader = PdfReader(io.BytesIO(content))
+    for page in pdf_reader.pages:
+        yield (page.extract_text() or "") + "\n"
+
+
+@register_extractor('docx', content_types=('word', 'officedocument.wordprocessing'), extensions=('.doc', '.docx'),
+                    sniff=lambda content: _zip_member_prefix(content, 'word/'))
+def _extract_docx(content: bytes, context: ExtractionContext) -> Iterator[str]:
+    from docx import Document
+    doc = Document(io.BytesIO(content))
+    for paragraph in doc.paragraphs:
+        yield paragraph.text + "\n"
+
+
+@register_extractor('xlsx', content_types=('excel', 'spreadsheet'), extensions=('.xls', '.xlsx'),
+                    sniff=lambda content: _zip_member_prefix(content, 'xl/'))
+def _extract_xlsx(content: bytes, context: ExtractionContext) -> Iterator[str]:
+    import openpyxl
+    wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        for sheet in wb.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                row_text = " | ".join([str(cell) if cell else "" for cell in row])
+                if row_text.strip():
+                    yield row_text + "\n"
+    finally:
+        wb.close()
+
+
+@register_extractor('html', content_types=('html',), extensions=('.html', '.htm'),
+                    sniff=_looks_like_html, sectioned=True)
+def _extract_html(content: bytes, context: ExtractionContext) -> Iterator[str]:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(_decode(content, context.encoding), 'html.parser')
+    for element in soup(UNWANTED_TAGS):
+        element.decompose()
+
+    if context.collect_links:
+        base_netloc = urlparse(context.base_url).netloc
+        for link in soup.find_all('a', href=True):
+            href = link.get('href')
+            link_text = link.get_text().lower()
+            if any(keyword in link_text or keyword in href.lower() for keyword in MENU_LINK_KEYWORDS):
+                full_url = urljoin(context.base_url, href)
+                # Only follow links from the same domain
+                if urlparse(full_url).netloc == base_netloc:
+                    context.links.append(full_url)
+
+    if context.mode == 'menu':
+        menu_sections = soup.find_all(['main', 'article', 'section', 'div'], class_=lambda x: x and any(
+            keyword in str(x).lower() for keyword in MENU_SECTION_KEYWORDS
+        ))
+        for section in menu_sections:
+            clean_text = _clean_text(section.get_text(), 10)
+            if clean_text:
+                yield clean_text
+        return
+
+    # Product pages: prefer product-related sections, else all visible text
+    found = False
+    product_sections = soup.find_all(['div', 'section', 'article'], class_=lambda x: x and any(
+        keyword in str(x).lower() for keyword in PRODUCT_SECTION_KEYWORDS
+    ))
+    for section in product_sections:
+        clean_text = _clean_text(section.get_text(), 5)
+        if clean_text:
+            found = True
+            yield clean_text + "\n\n"
+    if not found:
+        yield _clean_text(soup.get_text(), 5)
+
+
+@register_extractor('json', content_types=('json',), extensions=('.json',))
+def _extract_json(content: bytes, context: ExtractionContext) -> Iterator[str]:
+    data = json.loads(content.decode('utf-8'))
+    yield json.dumps(data, indent=2)
+
+
+@register_extractor('csv', content_types=('csv',), extensions=('.csv',))
+def _extract_csv(content: bytes, context: ExtractionContext) -> Iterator[str]:
+    import csv
+    reader = csv.reader(io.StringIO(content.decode('utf-8')))
+    for row in reader:
+        yield " | ".join(row) + "\n"
+
+
+@register_extractor('text', content_types=('text',), extensions=('.txt',))
+def _extract_plain_text(content: bytes, context: ExtractionContext) -> Iterator[str]:
+    text = _decode(content, context.encoding)
+    for start in range(0, len(text), TEXT_SLICE):
+        yield text[start:start + TEXT_SLICE]
+
+
+def _unknown_format(content: bytes) -> Optional[str]:
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def iter_text(content: bytes, content_type: str = "", filename: str = "",
+              context: ExtractionContext = None) -> Iterator[str]:
+    """Yield text from a document using whichever extractor matches it"""
+    context = context or ExtractionContext()
+    extractor = select_extractor(content, content_type, filename)
+    if extractor is None:
+        text = _unknown_format(content)
+        if text:
+            yield text
+        return
+    yield from extractor.fn(content, context)
+
+
+def _take(chunks: Iterator[str], limit: Optional[int], measure: Callable[[str], int] = len) -> List[str]:
+    """Consume chunks until ``limit`` measured characters have been collected"""
+    taken = []
+    total = 0
+    try:
+        for chunk in chunks:
+            taken.append(chunk)
+            total += measure(chunk)
+            if limit is not None and total >= limit:
+                break
+    finally:
+        chunks.close()  # stop the extractor (and release its parser) early
+    return taken
+
+
+def extract_text(content: bytes, content_type: str = "", filename: str = "",
+                 encoding: Optional[str] = None, limit: Optional[int] = None) -> str:
+    """Extract up to ``limit`` characters of text from any supported document"""
+    context = ExtractionContext(mode='product', encoding=encoding)
+    text = ''.join(_take(iter_text(content, content_type, filename, context), limit))
+    return text[:limit] if limit is not None else text
+
+
+def extract_product_text(content: bytes, encoding: Optional[str], content_type: str, limit: int = None) -> str:
+    """Extract product information from a fetched product page or document"""
+    return extract_text(content, content_type, encoding=encoding, limit=limit)
+
+
+def extract_menu_page(
+    content: bytes,
+    encoding: Optional[str],
+    content_type: str,
+    url: str,
+    base_url: str,
+    is_main_page: bool,
+    limit: int = None
+) -> Tuple[List[str], List[str]]:
+    """Return (menu text pieces, same-domain menu links) for one crawled page"""
+    extractor = select_extractor(content, content_type, url)
+    context = ExtractionContext(
+        mode='menu', encoding=encoding, base_url=base_url,
+        collect_links=is_main_page and extractor is not None and extractor.name == 'html'
+    )
+
+    try:
+        chunks = _take(iter_text(content, content_type, url, context), limit, menu_text_length)
+    except Exception as e:
+        logger.error(f"Error extracting content from {content_type}: {str(e)}")
+        return [], []
+
+    if extractor is not None and extractor.sectioned:
+        return chunks, context.links
+
+    # Non-HTML documents become a single menu section
+    text = ''.join(chunks)
+    return ([text] if text else []), context.links
@@ -0,0 +1,132 @@
+"""Keyset pagination over the per-user history collections.
+
+Pages are ordered newest first by (timestamp, id). The cursor for the next
+page is the "<timestamp>,<id>" of the last document returned, passed back
+as ``before=``; unlike skip/offset it stays cheap however deep the user
+pages, and doesn't shift when new entries arrive.
+"""
+import os
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import DESCENDING
+
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '20'))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', '100'))
+
+HISTORY_SORT = [("timestamp", DESCENDING), ("id", DESCENDING)]
+
+# fields=summary: just enough for a list row
+SUMMARY_FIELDS = {
+    "analysis_history": ("id", "query", "analysis_type", "is_safe", "timestamp"),
+    "image_analysis_history": ("id", "product_name", "is_safe", "safety_rating", "timestamp"),
+    "menu_analysis_history": ("id", "restaurant_name", "source", "source_data", "timestamp"),
+    "recipe_history": ("id", "food_item", "timestamp"),
+}
+
+# Bookkeeping stored next to a result (e.g. for incremental menu re-analysis), never returned
+INTERNAL_FIELDS = ("profile_fingerprint", "dish_hashes")
+
+
+def encode_cursor(doc: dict) -> str:
+    return f"{doc['timestamp']},{doc['id']}"
+
+
+def parse_cursor(before: str) -> Tuple[str, str]:
+    # An unencoded "+00:00" arrives as " 00:00"
+    timestamp, _, doc_id = before.replace(' ', '+').rpartition(',')
+    if not timestamp or not doc_id:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected before=<timestamp>,<id>")
+    return timestamp, doc_id
+
+
+def page_size(limit: Optional[int]) -> int:
+    if limit is None:
+        return HISTORY_PAGE_SIZE
+    return max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+
+def history_projection(collection_name: str, fields: Optional[str]) -> dict:
+    if fields is None or fields == 'full':
+        return {"_id": 0, **{field: 0 for field in INTERNAL_FIELDS}}
+    if fields == 'summary':
+        return {"_id": 0, **{field: 1 for field in SUMMARY_FIELDS[collection_name]}}
+    raise HTTPException(status_code=400, detail="fields must be 'summary' or 'full'")
+
+
+def keyset_filter(user_id: str, before: Optional[str]) -> dict:
+    query = {"user_id": user_id}
+    if before:
+        timestamp, doc_id = parse_cursor(before)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "id": {"$lt": doc_id}},
+        ]
+    return query
+
+
+async def fetch_history_page(
+    collection, user_id: str, before: Optional[str] = None,
+    limit: Optional[int] = None, fields: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of a user's history, plus the cursor for the next page (None on the last)"""
+    size = page_size(limit)
+    projection = history_projection(collection.name, fields)
+    # Read one extra document to know whether another page exists
+    docs = await collection.find(
+        keyset_filter(user_id, before), projection
+    ).sort(HISTORY_SORT).limit(size + 1).to_list(size + 1)
+
+    next_cursor = encode_cursor(docs[size - 1]) if len(docs) > size else None
+    return docs[:size], next_cursor
+
+
+# /api/activity: collection -> (kind, row title, row is_safe)
+ACTIVITY_SOURCES = {
+    "analysis_history": ("text", "$query", "$is_safe"),
+    "image_analysis_history": ("image", "$product_name", "$is_safe"),
+    "menu_analysis_history": (
+        "menu",
+        {"$cond": [{"$gt": [{"$ifNull": ["$restaurant_name", ""]}, ""]}, "$restaurant_name", "$source_data"]},
+        {"$gt": [{"$size": {"$ifNull": ["$safe_dishes", []]}}, 0]},
+    ),
+    # Recipes are generated to be safe
+    "recipe_history": ("recipe", "$food_item", {"$literal": True}),
+}
+
+
+def _activity_branch(collection_name: str, match: dict, size: int) -> List[dict]:
+    kind, title, is_safe = ACTIVITY_SOURCES[collection_name]
+    return [
+        # Each branch is limited on its own index before the merge
+        {"$match": match},
+        {"$sort": dict(HISTORY_SORT)},
+        {"$limit": size + 1},
+        {"$project": {
+            **{field: 1 for field in SUMMARY_FIELDS[collection_name]},
+            "_id": 0,
+            "kind": {"$literal": kind},
+            "title": title,
+            "is_safe": is_safe,
+        }},
+    ]
+
+
+async def fetch_activity_page(
+    db, user_id: str, before: Optional[str] = None, limit: Optional[int] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Summary rows from all four history collections, merged newest first"""
+    size = page_size(limit)
+    match = keyset_filter(user_id, before)
+    first, *others = ACTIVITY_SOURCES
+    pipeline = _activity_branch(first, match, size)
+    for collection_name in others:
+        pipeline.append({"$unionWith": {
+            "coll": collection_name,
+            "pipeline": _activity_branch(collection_name, match, size),
+        }})
+    pipeline += [{"$sort": dict(HISTORY_SORT)}, {"$limit": size + 1}]
+
+    docs = await db[first].aggregate(pipeline).to_list(size + 1)
+    next_cursor = encode_cursor(docs[size - 1]) if len(docs) > size else None
+    return docs[:size], next_cursor
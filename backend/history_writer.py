@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from pymongo.errors import BulkWriteError
+
+from llm_scheduler import Timings
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class HistoryWriter:
+    """Write-behind queue for history documents.
+
+    ``add()`` returns as soon as the document is queued; a background task
+    writes queued documents per collection with ``insert_many`` every
+    HISTORY_FLUSH_INTERVAL seconds (or as soon as a batch fills). Failed
+    batches are retried with exponential backoff. The queue is capped at
+    HISTORY_QUEUE_SIZE documents -- past that, ``add()`` writes through
+    synchronously, so a stalled database slows requests down rather than
+    growing memory without bound.
+
+    On shutdown ``close()`` tries each remaining batch once, within
+    HISTORY_CLOSE_TIMEOUT seconds in total, and logs what it had to drop.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.max_pending = int(os.environ.get('HISTORY_QUEUE_SIZE', '5000'))
+        self.batch_size = int(os.environ.get('HISTORY_BATCH_SIZE', '100'))
+        self.flush_interval = float(os.environ.get('HISTORY_FLUSH_INTERVAL', '0.5'))
+        self.max_retries = int(os.environ.get('HISTORY_MAX_RETRIES', '5'))
+        self.retry_backoff = float(os.environ.get('HISTORY_RETRY_BACKOFF', '0.5'))
+        self.close_timeout = float(os.environ.get('HISTORY_CLOSE_TIMEOUT', '5'))
+        self._pending = deque()  # (collection name, document)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.write_through = 0
+        self.flush_latency = Timings()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the background task and write what is still queued, without retries or hanging"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(max_retries=0), self.close_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"History flush did not finish within {self.close_timeout}s of shutdown")
+        except Exception as e:
+            logger.error(f"History flush error on shutdown: {str(e)}")
+        if self._pending:
+            by_collection = Counter(name for name, _ in self._pending)
+            self.dropped += len(self._pending)
+            logger.error(f"Dropping {len(self._pending)} queued history documents on shutdown: {dict(by_collection)}")
+            self._pending.clear()
+
+    async def add(self, collection_name: str, document: dict):
+        if self._task is None or len(self._pending) >= self.max_pending:
+            self.write_through += 1
+            await self.db[collection_name].insert_one(document)
+            return
+        self._pending.append((collection_name, document))
+        self.enqueued += 1
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def add_many(self, collection_name: str, documents: list):
+        """Queue documents together, so they go out in one insert_many"""
+        if not documents:
+            return
+        if self._task is None or len(self._pending) + len(documents) > self.max_pending:
+            self.write_through += len(documents)
+            await self.db[collection_name].insert_many(documents, ordered=False)
+            return
+        self._pending.extend((collection_name, document) for document in documents)
+        self.enqueued += len(documents)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self, collection_name: Optional[str] = None) -> int:
+        if collection_name is None:
+            return len(self._pending)
+        return sum(1 for name, _ in self._pending if name == collection_name)
+
+    async def flush(self, collection_name: Optional[str] = None, max_retries: Optional[int] = None):
+        """Write queued documents now (for one collection, or all of them)"""
+        if not self.pending(collection_name):
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self.pending(collection_name):
+                await self._write_batch(collection_name, max_retries)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"History flush error: {str(e)}")
+
+    def _take_batch(self, collection_name: Optional[str]):
+        """Pop up to batch_size queued documents of one collection"""
+        if collection_name is None:
+            collection_name = self._pending[0][0]
+        batch, skipped = [], []
+        while self._pending and len(batch) < self.batch_size:
+            entry = self._pending.popleft()
+            if entry[0] == collection_name:
+                batch.append(entry[1])
+            else:
+                skipped.append(entry)
+        self._pending.extendleft(reversed(skipped))
+        return collection_name, batch
+
+    async def _write_batch(self, collection_name: Optional[str], max_retries: Optional[int] = None):
+        collection_name, batch = self._take_batch(collection_name)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        started = time.perf_counter()
+        for attempt in range(max_retries + 1):
+            try:
+                await self.db[collection_name].insert_many(batch, ordered=False)
+                break
+            except asyncio.CancelledError:
+                # Shutting down mid-write: requeue so close() can account for them
+                self._pending.extendleft((collection_name, document) for document in reversed(batch))
+                raise
+            except BulkWriteError as e:
+                # A retry after a partial write sees its own earlier inserts
+                if all(error.get('code') == DUPLICATE_KEY for error in e.details.get('writeErrors', [])):
+                    break
+                error = e
+            except Exception as e:
+                error = e
+            if attempt == max_retries:
+                self.dropped += len(batch)
+                logger.error(f"Dropping {len(batch)} {collection_name} documents after {attempt + 1} attempts: {str(error)}")
+                return
+            self.retries += 1
+            try:
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+            except asyncio.CancelledError:
+                self._pending.extendleft((collection_name, document) for document in reversed(batch))
+                raise
+
+        self.written += len(batch)
+        self.batches += 1
+        self.flush_latency.add(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._pending),
+            "max_pending": self.max_pending,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "write_through": self.write_through,
+            "flush_latency_seconds": self.flush_latency.as_dict(),
+        }
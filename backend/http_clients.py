@@ -0,0 +1,104 @@
+import os
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class PoolStats:
+    """Counts requests vs. fresh TCP connections so we can see keep-alive reuse."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+    async def on_request(self, request: httpx.Request):
+        self.requests += 1
+        # httpcore reports connection lifecycle events through the trace extension
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name.endswith(".failed"):
+            self.errors += 1
+
+    def as_dict(self) -> dict:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+            "errors": self.errors,
+        }
+
+
+class HttpPools:
+    """Long-lived pooled AsyncClients, one per purpose, opened at startup."""
+
+    # purpose -> (timeout env var, default seconds)
+    PURPOSES = {
+        "auth": ("HTTP_AUTH_TIMEOUT", 10.0),
+        "product": ("HTTP_PRODUCT_TIMEOUT", 30.0),
+        "menu": ("HTTP_MENU_TIMEOUT", 30.0),
+    }
+
+    def __init__(self):
+        self._clients = {}
+        self._stats = {}
+
+    def start(self):
+        if self._clients:
+            return
+
+        max_connections = int(os.environ.get('HTTP_MAX_CONNECTIONS', '100'))
+        max_keepalive = int(os.environ.get('HTTP_MAX_KEEPALIVE', '20'))
+        keepalive_expiry = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '30'))
+        http2 = os.environ.get('HTTP_ENABLE_HTTP2', 'true').lower() == 'true'
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but the 'h2' package is missing; falling back to HTTP/1.1")
+            http2 = False
+
+        for purpose, (env_var, default_timeout) in self.PURPOSES.items():
+            timeout = float(os.environ.get(env_var, str(default_timeout)))
+            stats = PoolStats()
+            self._stats[purpose] = stats
+            self._clients[purpose] = httpx.AsyncClient(
+                http2=http2,
+                timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive,
+                    keepalive_expiry=keepalive_expiry
+                ),
+                follow_redirects=purpose != "auth",
+                event_hooks={"request": [stats.on_request]}
+            )
+
+    async def close(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    def get(self, purpose: str) -> httpx.AsyncClient:
+        if not self._clients:
+            # Handlers can run before startup in tests/scripts; open lazily
+            self.start()
+        return self._clients[purpose]
+
+    def stats(self) -> dict:
+        return {purpose: stats.as_dict() for purpose, stats in self._stats.items()}
+
+
+http_pools = HttpPools()
@@ -0,0 +1,130 @@
+"""Shrinks uploaded photos before they are sent to the LLM.
+
+Phone photos are often 8-12 MB; the model reads a label just as well from a
+~1600px JPEG of a few hundred KB. ``preprocess_image`` fixes the EXIF
+orientation, downscales to IMAGE_MAX_EDGE, optionally converts labels to
+grayscale / stretches their contrast, and re-encodes as JPEG or WebP. It
+runs in the document worker pool, since decoding a large photo is CPU-bound.
+"""
+import io
+import logging
+import os
+import time
+from typing import Tuple
+
+from PIL import Image, ImageOps
+
+from worker_pool import doc_workers
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+SOURCE_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def preprocess_image(
+    data: bytes, max_edge: int, output_format: str, quality: int,
+    grayscale: bool = False, autocontrast: bool = False
+) -> Tuple[bytes, str, dict]:
+    """(encoded bytes, mime type, info) for one uploaded image"""
+    pil_format, mime_type = OUTPUT_FORMATS[output_format]
+    with Image.open(io.BytesIO(data)) as source:
+        source_format = source.format
+        original_size = source.size
+        # Let the JPEG decoder skip detail we would throw away anyway
+        source.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(source)
+
+        if max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        if grayscale:
+            image = image.convert('L')
+        elif image.mode in ('RGBA', 'LA', 'P'):
+            # Flatten transparency onto white, as a label would be printed
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        if autocontrast:
+            image = ImageOps.autocontrast(image, cutoff=1)
+
+        output = io.BytesIO()
+        if pil_format == 'JPEG':
+            image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(output, 'WEBP', quality=quality, method=4)
+        encoded = output.getvalue()
+        size = image.size
+
+    info = {
+        "source_format": source_format,
+        "original_bytes": len(data),
+        "original_size": original_size,
+        "bytes": len(encoded),
+        "size": size,
+    }
+    # Re-encoding a small, already-compressed upload can make it bigger
+    if len(encoded) >= len(data) and size == original_size and source_format in SOURCE_MIME_TYPES:
+        info["bytes"] = len(data)
+        return data, SOURCE_MIME_TYPES[source_format], info
+    return encoded, mime_type, info
+
+
+class ImagePreprocessor:
+    """Settings and counters around ``preprocess_image``."""
+
+    def __init__(self):
+        self.max_edge = int(os.environ.get('IMAGE_MAX_EDGE', '1600'))
+        self.output_format = os.environ.get('IMAGE_FORMAT', 'jpeg').lower()
+        if self.output_format not in OUTPUT_FORMATS:
+            self.output_format = 'jpeg'
+        self.quality = int(os.environ.get('IMAGE_QUALITY', '85'))
+        self.label_grayscale = os.environ.get('IMAGE_LABEL_GRAYSCALE', 'false').lower() == 'true'
+        self.label_autocontrast = os.environ.get('IMAGE_LABEL_AUTOCONTRAST', 'false').lower() == 'true'
+        self.processed = 0
+        self.fallbacks = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    async def prepare(self, data: bytes, mime_type: str = "image/jpeg", label: bool = False) -> Tuple[bytes, str]:
+        """(bytes, mime type) to send upstream; the original upload if it can't be decoded"""
+        started = time.perf_counter()
+        try:
+            encoded, encoded_type, _ = await doc_workers.run(
+                preprocess_image, data, self.max_edge, self.output_format, self.quality,
+                label and self.label_grayscale, label and self.label_autocontrast
+            )
+        except Exception as e:
+            # Unsupported format (e.g. HEIC without a plugin), truncated file, ...
+            logger.warning(f"Image preprocessing failed, sending original: {str(e)}")
+            self.fallbacks += 1
+            encoded, encoded_type = data, mime_type
+        else:
+            self.processed += 1
+        self.seconds += time.perf_counter() - started
+        self.bytes_in += len(data)
+        self.bytes_out += len(encoded)
+        return encoded, encoded_type
+
+    def stats(self) -> dict:
+        return {
+            "max_edge": self.max_edge,
+            "format": self.output_format,
+            "quality": self.quality,
+            "processed": self.processed,
+            "fallbacks": self.fallbacks,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "compression_ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 0.0,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,118 @@
+"""Declarative MongoDB indexes for the hot query paths.
+
+``ensure_indexes(db)`` runs at startup; creating an index that already
+exists with the same spec is a no-op, so it is safe on every boot.
+Indexes listed in RETIRED_INDEXES, which newer ones have replaced, are
+dropped if they are still there. A failure on one index (e.g. duplicates
+blocking a unique index) is logged and doesn't stop the others or the app.
+"""
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLLECTIONS = (
+    "analysis_history",
+    "image_analysis_history",
+    "menu_analysis_history",
+    "recipe_history",
+)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    **{
+        # find({"user_id", <keyset on (timestamp, id)>}).sort(timestamp -1, id -1)
+        collection: [IndexModel(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="user_id_timestamp_id"
+        )]
+        for collection in HISTORY_COLLECTIONS
+    },
+    "sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        # Mongo drops the session once expires_at_dt has passed
+        IndexModel([("expires_at_dt", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "allergy_profiles": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+}
+
+# Indexes superseded by an INDEXES entry; each one costs a write per insert
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    # (user_id, timestamp), before the keyset pagination added id
+    collection: ["user_id_timestamp"] for collection in HISTORY_COLLECTIONS
+}
+
+# (collection, filter, sort) for every lookup that runs on a request path;
+# used to check that each one is served by an index
+HOT_QUERIES = [
+    *[(collection, {"user_id": "u"}, [("timestamp", DESCENDING), ("id", DESCENDING)])
+      for collection in HISTORY_COLLECTIONS],
+    ("sessions", {"session_token": "t"}, None),
+    ("users", {"email": "e"}, None),
+    ("users", {"id": "u"}, None),
+    ("allergy_profiles", {"user_id": "u"}, None),
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every declared index; returns collection -> index names that exist"""
+    created = {}
+    for collection, models in INDEXES.items():
+        names = []
+        for model in models:
+            try:
+                names.extend(await db[collection].create_indexes([model]))
+            except Exception as e:
+                logger.error(f"Index error on {collection}.{model.document['name']}: {str(e)}")
+        created[collection] = names
+    for collection, retired in RETIRED_INDEXES.items():
+        try:
+            existing = set(await db[collection].index_information())
+        except Exception as e:
+            logger.error(f"Index listing error on {collection}: {str(e)}")
+            continue
+        for name in retired:
+            if name not in existing:
+                continue
+            try:
+                await db[collection].drop_index(name)
+                logger.info(f"Dropped retired index {collection}.{name}")
+            except Exception as e:
+                logger.error(f"Index drop error on {collection}.{name}: {str(e)}")
+    return created
+
+
+def plan_stages(plan: dict) -> List[str]:
+    """All stage names in an explain() plan tree"""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries(db) -> List[dict]:
+    """Winning plan stages for each HOT_QUERIES entry"""
+    results = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.limit(20).explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        results.append({
+            "collection": collection,
+            "query": sorted(query),
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return results
@@ -0,0 +1,189 @@
+"""Index of label photos that have already been read by the LLM.
+
+Photos of the same product taken by different users differ in pixels but
+not in structure, so they are matched by a perceptual difference hash
+(dHash): the image is shrunk to (HASH_SIZE + 1) x HASH_SIZE grayscale and
+each bit records whether a pixel is brighter than its right neighbour.
+
+A dHash sees layout and colour, not small print: two flavours of the same
+brand (same packaging, different ingredient list) land only a few bits
+apart -- as close as a re-encode of one photo (7 vs 6 bits measured). The
+distance alone therefore never stands in for reading the label:
+
+- the same upload (identical bytes, looked up by their sha256) reuses the
+  earlier extraction -- product name and ingredients -- outright,
+  including a local "unsafe";
+- a different photo within LABEL_HASH_REUSE_DISTANCE bits (even 0) is
+  still read by the LLM, and its ingredients are compared with the
+  earlier ones. Whether they agreed is counted per distance, which is
+  what LABEL_HASH_REUSE_DISTANCE is calibrated against.
+
+Near matches are found without scanning every known hash: the hash is cut
+into LABEL_HASH_REUSE_DISTANCE + 1 bands, and two hashes at most that many
+bits apart agree on at least one whole band, so only labels sharing a band
+with the new one are compared.
+"""
+import hashlib
+import io
+import os
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from PIL import Image, ImageOps
+
+from ttl_cache import TTLCache
+from worker_pool import doc_workers
+
+HASH_SIZE = 16  # 256-bit hashes
+
+
+def label_dhash(data: bytes, hash_size: int = HASH_SIZE) -> int:
+    with Image.open(io.BytesIO(data)) as source:
+        source.draft('L', (hash_size * 8, hash_size * 8))
+        image = ImageOps.exif_transpose(source).convert('L')
+        image = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = list(image.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def ingredient_set(ingredients: List[str]) -> FrozenSet[str]:
+    return frozenset(' '.join(str(item).lower().split()) for item in ingredients if str(item).strip())
+
+
+class KnownLabel(NamedTuple):
+    label_hash: Optional[int]
+    digest: str
+    product_name: str
+    ingredients: List[str]
+    distance: int = 0
+
+
+class LabelIndex:
+    """Bounded LRUs (with TTL) of extracted product name and ingredients, by photo digest and by label hash."""
+
+    def __init__(self):
+        self.reuse_distance = int(os.environ.get('LABEL_HASH_REUSE_DISTANCE', '6'))
+        maxsize = int(os.environ.get('LABEL_INDEX_SIZE', '5000'))
+        ttl = float(os.environ.get('LABEL_INDEX_TTL', str(7 * 24 * 60 * 60)))
+        self._photos = TTLCache(maxsize=maxsize, ttl=ttl)  # sha256 -> KnownLabel, exact reuse
+        self._labels = TTLCache(maxsize=maxsize, ttl=ttl)  # dHash -> KnownLabel, near-match statistics
+        bits = HASH_SIZE * HASH_SIZE
+        bands = min(self.reuse_distance + 1, bits)
+        self._band_width = -(-bits // bands)
+        self._bands: Dict[Tuple[int, int], Set[int]] = {}
+        self._banded = 0
+        self.hash_failures = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.reused = 0
+        # distance -> [same ingredients, different ingredients] for near matches read again
+        self.near_outcomes: Dict[int, List[int]] = {}
+
+    async def hash_image(self, data: bytes) -> Optional[int]:
+        try:
+            return await doc_workers.run(label_dhash, data)
+        except Exception:
+            self.hash_failures += 1
+            return None
+
+    def find_same_photo(self, data: bytes) -> Optional[KnownLabel]:
+        """The label read from exactly these bytes, if any (the only case its extraction is reused)"""
+        known = self._photos.get(content_digest(data))
+        if known is not None:
+            self.exact_hits += 1
+        return known
+
+    def _band_keys(self, label_hash: int) -> List[Tuple[int, int]]:
+        mask = (1 << self._band_width) - 1
+        bits = HASH_SIZE * HASH_SIZE
+        return [(start, (label_hash >> start) & mask) for start in range(0, bits, self._band_width)]
+
+    def _index_bands(self, label_hash: int):
+        for key in self._band_keys(label_hash):
+            self._bands.setdefault(key, set()).add(label_hash)
+            self._banded += 1
+
+    def _rebuild_bands(self):
+        """Drop evicted and expired hashes from the bands"""
+        self._bands = {}
+        self._banded = 0
+        for known in self._labels.values():
+            self._index_bands(known.label_hash)
+
+    def lookup(self, label_hash: Optional[int]) -> Optional[KnownLabel]:
+        """The closest other photo's label within reuse_distance bits, if any"""
+        if label_hash is None:
+            return None
+        candidates = set()
+        for key in self._band_keys(label_hash):
+            candidates.update(self._bands.get(key, ()))
+
+        best_hash, best_distance = None, None
+        for candidate in candidates:
+            distance = hamming(label_hash, candidate)
+            if distance <= self.reuse_distance and (best_distance is None or distance < best_distance):
+                if candidate in self._labels:
+                    best_hash, best_distance = candidate, distance
+
+        if best_hash is None:
+            self.misses += 1
+            return None
+        self.near_hits += 1
+        return self._labels.get(best_hash)._replace(distance=best_distance)
+
+    def record_reuse(self):
+        self.reused += 1
+
+    def record_near_match(self, known: KnownLabel, ingredients: List[str]) -> bool:
+        """Compare a near match's fresh extraction with the known one; True if they agree"""
+        same = bool(ingredients) and ingredient_set(ingredients) == ingredient_set(known.ingredients)
+        self.near_outcomes.setdefault(known.distance, [0, 0])[0 if same else 1] += 1
+        return same
+
+    def add(self, label_hash: Optional[int], data: bytes, product_name: str, ingredients: List[str]):
+        if not ingredients:
+            return
+        known = KnownLabel(label_hash, content_digest(data), product_name or '', [str(item) for item in ingredients])
+        self._photos.set(known.digest, known)
+        if label_hash is None:
+            return
+        self._labels.set(label_hash, known)
+        self._index_bands(label_hash)
+        if self._banded > 2 * len(self._band_keys(0)) * max(len(self._labels), 1):
+            self._rebuild_bands()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            **self._labels.stats(),
+            "photos": self._photos.stats(),
+            "reuse_distance": self.reuse_distance,
+            "hash_bits": HASH_SIZE * HASH_SIZE,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "label_hit_ratio": round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            "extractions_reused": self.reused,
+            "near_matches_by_distance": {
+                str(distance): {"same_ingredients": same, "different_ingredients": different}
+                for distance, (same, different) in sorted(self.near_outcomes.items())
+            },
+            "hash_failures": self.hash_failures,
+        }
+
+
+label_index = LabelIndex()
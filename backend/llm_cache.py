@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ('allergies', 'dietary_restrictions', 'religion_restrictions', 'skin_sensitivities')
+
+
+def canonical_terms(values) -> list:
+    return sorted({str(value).strip().lower() for value in (values or []) if str(value).strip()})
+
+
+def profile_fingerprint(profile: dict) -> str:
+    """Stable hash of the profile lists that feed the system prompts.
+
+    Two users with the same allergies/restrictions (in any order or case)
+    get the same fingerprint, so they can share cached answers.
+    """
+    canonical = {field: canonical_terms(profile.get(field)) for field in PROFILE_FIELDS}
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r'\s+', ' ', query.strip().lower())
+
+
+class LLMResponseCache:
+    """Cache of raw LLM answers keyed by (kind, profile fingerprint, query, model).
+
+    An in-process LRU with TTL, optionally backed by a MongoDB collection
+    (LLM_CACHE_PERSIST=true) so workers share answers. Each entry remembers
+    how long the original call took, which is what a hit saves.
+    """
+
+    def __init__(self, collection=None):
+        self.ttl = float(os.environ.get('LLM_CACHE_TTL', str(24 * 60 * 60)))
+        self._memory = TTLCache(
+            maxsize=int(os.environ.get('LLM_CACHE_SIZE', '2000')),
+            ttl=self.ttl
+        )
+        persist = os.environ.get('LLM_CACHE_PERSIST', 'false').lower() == 'true'
+        self.collection = collection if persist else None
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self.saved_latency = 0.0
+
+    @staticmethod
+    def make_key(kind: str, fingerprint: str, query: str, model: str) -> str:
+        raw = '\x1f'.join((kind, fingerprint, normalize_query(query), model))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index("expire_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"LLM cache index error: {str(e)}")
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None and self.collection is not None:
+            try:
+                entry = await self.collection.find_one({"_id": key})
+            except Exception as e:
+                logger.error(f"LLM cache read error: {str(e)}")
+                entry = None
+            if entry:
+                self.persistent_hits += 1
+                self._memory.set(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.saved_latency += entry.get("latency", 0.0)
+        return entry["response"]
+
+    async def set(self, key: str, response: str, latency: float):
+        entry = {"_id": key, "response": response, "latency": latency}
+        self._memory.set(key, entry)
+        if self.collection is None:
+            return
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {**entry, "expire_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"LLM cache write error: {str(e)}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "memory": self._memory.stats(),
+            "persistent": self.collection is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent_hits": self.persistent_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_llm_seconds": round(self.saved_latency, 3),
+        }
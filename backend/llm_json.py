@@ -0,0 +1,16 @@
+"""Reading the JSON object out of an LLM answer."""
+import json
+from typing import Optional
+
+
+def parse_llm_json(text: str) -> Optional[dict]:
+    """The JSON object in an LLM answer (optionally inside a code fence), or None"""
+    if '```json' in text:
+        text = text.split('```json')[1].split('```')[0].strip()
+    elif '```' in text:
+        text = text.split('```')[1].split('```')[0].strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
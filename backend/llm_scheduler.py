@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+# Lower runs first: quick text analysis ahead of label photos, recipes, then menus;
+# background recipe prefetches only use slots nobody is waiting for
+PRIORITY_CLASSES = {
+    "analyze": 0,
+    "image": 1,
+    "recipe": 2,
+    "menu_photo": 2,
+    "menu_url": 3,
+    "recipe_prefetch": 4,
+}
+
+
+class SchedulerOverloaded(Exception):
+    """The LLM queue is full (or a request waited too long for a slot)."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("AI service is busy, please retry shortly")
+        self.retry_after = retry_after
+
+
+def _percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Timings:
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def mean(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "avg": round(self.mean(), 4),
+            "p50": round(_percentile(self.samples, 0.5), 4),
+            "p95": round(_percentile(self.samples, 0.95), 4),
+        }
+
+
+class LLMScheduler:
+    """Caps concurrent LLM calls process-wide and queues the rest by priority.
+
+    When the queue is already at LLM_MAX_QUEUE, or a request has waited
+    LLM_QUEUE_TIMEOUT seconds without a slot, the call is rejected with
+    SchedulerOverloaded so the endpoint can answer 503 + Retry-After
+    instead of piling up coroutines until the provider times them out.
+    """
+
+    def __init__(self):
+        self.max_in_flight = int(os.environ.get('LLM_MAX_IN_FLIGHT', '8'))
+        self.max_queue = int(os.environ.get('LLM_MAX_QUEUE', '64'))
+        self.queue_timeout = float(os.environ.get('LLM_QUEUE_TIMEOUT', '30'))
+        self.in_flight = 0
+        self._queue = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queue_wait = Timings()
+        self.service_time = Timings()
+        self.per_class = {name: 0 for name in PRIORITY_CLASSES}
+
+    def _retry_after(self) -> int:
+        # Rough time for the current backlog to drain through the open slots
+        backlog = len(self._queue) + 1
+        service = self.service_time.mean() or 5.0
+        return max(1, math.ceil(backlog * service / self.max_in_flight))
+
+    async def _acquire(self, priority: int):
+        if self.in_flight < self.max_in_flight and not self._queue:
+            self.in_flight += 1
+            return
+
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerOverloaded(self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._queue, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just as we gave up; pass it on
+                self._release()
+            else:
+                future.cancel()
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise SchedulerOverloaded(self._retry_after())
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the highest-priority live waiter
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def run(self, priority_class: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        priority = PRIORITY_CLASSES.get(priority_class, max(PRIORITY_CLASSES.values()))
+        queued_at = time.perf_counter()
+        await self._acquire(priority)
+
+        started = time.perf_counter()
+        self.queue_wait.add(started - queued_at)
+        self.admitted += 1
+        self.per_class[priority_class] = self.per_class.get(priority_class, 0) + 1
+        try:
+            return await fn()
+        finally:
+            self.service_time.add(time.perf_counter() - started)
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "admitted_by_class": dict(self.per_class),
+            "queue_wait_seconds": self.queue_wait.as_dict(),
+            "service_time_seconds": self.service_time.as_dict(),
+        }
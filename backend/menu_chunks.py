@@ -0,0 +1,130 @@
+"""Splitting large menus into chunks that are read by parallel LLM calls.
+
+A crawled menu can be far longer than what one prompt should carry, and a
+single giant prompt is also the slowest way to read it: the answer (every
+dish, in JSON) is generated token by token. Instead, the filtered menu text
+is cut on section and heading boundaries into blocks, which are packed into
+chunks of at most MENU_CHUNK_CHARS, extracted concurrently (at most
+MENU_CHUNK_CONCURRENCY at a time per request, on top of the global LLM
+scheduler) and merged afterwards. Blocks, not chunks, are what a later
+crawl is diffed against: inserting a dish changes one block, whereas it
+would shift the packing of every chunk after it.
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Any, Awaitable, Callable, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+MENU_CHUNK_CHARS = int(os.environ.get('MENU_CHUNK_CHARS', '6000'))
+MENU_MAX_CHUNKS = int(os.environ.get('MENU_MAX_CHUNKS', '20'))
+MENU_CHUNK_CONCURRENCY = int(os.environ.get('MENU_CHUNK_CONCURRENCY', '4'))
+# Dishes per profile-evaluation call
+MENU_EVAL_BATCH = int(os.environ.get('MENU_EVAL_BATCH', '80'))
+
+SECTION_MARKER = '=== MENU SECTION ==='
+
+_PRICE = re.compile(r'\d')
+
+
+def _is_heading(line: str) -> bool:
+    """Short title-like lines ("STARTERS", "Wood-fired Pizzas") that open a menu section"""
+    line = line.strip()
+    if not line or len(line) > 40 or _PRICE.search(line) or line[-1] in '.,;:':
+        return False
+    return line.isupper() or line.istitle()
+
+
+def _blocks(text: str) -> List[List[str]]:
+    """Lines grouped into sections: a crawled-page marker or a heading starts a new one"""
+    blocks: List[List[str]] = [[]]
+    for line in text.split('\n'):
+        if line.strip() == SECTION_MARKER:
+            if blocks[-1]:
+                blocks.append([])
+            continue
+        if not line.strip():
+            continue
+        if _is_heading(line) and blocks[-1] and not _is_heading(blocks[-1][-1]):
+            blocks.append([])
+        blocks[-1].append(line)
+    return [block for block in blocks if block]
+
+
+def menu_blocks(text: str, max_chars: int = MENU_CHUNK_CHARS) -> List[str]:
+    """Menu text as sections of at most max_chars, the unit that is hashed and re-read.
+
+    A section's boundaries depend only on its own lines, so editing one
+    section leaves every other block unchanged. A section that is too long
+    on its own is split between lines, and each continuation repeats the
+    section heading so the model still knows where it is. Lines are only
+    cut when a single line exceeds max_chars.
+    """
+    blocks: List[str] = []
+    for section in _blocks(text):
+        if sum(len(line) + 1 for line in section) <= max_chars:
+            blocks.append('\n'.join(section))
+            continue
+        heading = section[0] if _is_heading(section[0]) else None
+        current: List[str] = []
+        size = 0
+        for index, line in enumerate(section):
+            while len(line) + 1 > max_chars:
+                if current:
+                    blocks.append('\n'.join(current))
+                current, size = [], 0
+                blocks.append(line[:max_chars])
+                line = line[max_chars:]
+            if size + len(line) + 1 > max_chars:
+                if current:
+                    blocks.append('\n'.join(current))
+                current, size = [], 0
+                if heading and index > 0:
+                    current.append(heading)
+                    size = len(heading) + 1
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            blocks.append('\n'.join(current))
+    return blocks
+
+
+def pack_blocks(blocks: Sequence[str], max_chars: int = MENU_CHUNK_CHARS) -> List[List[int]]:
+    """Indexes of consecutive blocks packed into chunks of at most max_chars"""
+    groups: List[List[int]] = []
+    size = max_chars + 1
+    for index, block in enumerate(blocks):
+        if size + len(block) + 1 > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(index)
+        size += len(block) + 1
+    return groups
+
+
+def split_menu(text: str, max_chars: int = MENU_CHUNK_CHARS) -> List[str]:
+    """Cut menu text into chunks of at most max_chars on section/dish boundaries"""
+    blocks = menu_blocks(text, max_chars)
+    return ['\n'.join(blocks[index] for index in group) for group in pack_blocks(blocks, max_chars)]
+
+
+def batched(items: Sequence[Any], size: int) -> List[Sequence[Any]]:
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+async def gather_bounded(
+    fn: Callable[[Any], Awaitable[Any]], items: Sequence[Any], concurrency: int = MENU_CHUNK_CONCURRENCY
+) -> List[Any]:
+    """fn(item) for every item, at most ``concurrency`` at a time, results in item order.
+
+    A failed item yields its exception instead of failing the others.
+    """
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item):
+        async with limit:
+            return await fn(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
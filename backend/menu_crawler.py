@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# fetch_page(url, is_main_page) -> (menu text pieces, menu links found on the page)
+FetchPage = Callable[[str, bool], Awaitable[Tuple[List[str], List[str]]]]
+
+
+class MenuCrawler:
+    """Fetches a restaurant's main page, then its menu links concurrently.
+
+    Results are reassembled in discovery order (main page first, then each
+    followed link in the order it appeared), so the output matches a
+    sequential crawl. The crawl stops early once ``is_enough`` says the
+    completed prefix already holds as much text as the caller will use, or
+    when the global deadline passes.
+    """
+
+    def __init__(
+        self,
+        fetch_page: FetchPage,
+        max_links: int = None,
+        concurrency: int = None,
+        per_host: int = None,
+        deadline: float = None,
+        is_enough: Optional[Callable[[List[str]], bool]] = None
+    ):
+        self.fetch_page = fetch_page
+        self.max_links = max_links or int(os.environ.get('MENU_CRAWL_MAX_LINKS', '5'))
+        self.concurrency = concurrency or int(os.environ.get('MENU_CRAWL_CONCURRENCY', '5'))
+        # Menu links are same-domain, so this is what actually paces a crawl
+        self.per_host = per_host or int(os.environ.get('MENU_CRAWL_PER_HOST', '2'))
+        self.deadline = deadline or float(os.environ.get('MENU_CRAWL_DEADLINE', '45'))
+        self.is_enough = is_enough or (lambda pieces: False)
+        self._global_limit = asyncio.Semaphore(self.concurrency)
+        self._host_limits = {}
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def _fetch(self, url: str, is_main_page: bool) -> Tuple[List[str], List[str]]:
+        async with self._global_limit, self._host_limit(url):
+            try:
+                return await self.fetch_page(url, is_main_page)
+            except Exception as e:
+                logger.error(f"Error fetching {url}: {str(e)}")
+                return [], []
+
+    async def crawl(self, start_url: str) -> List[str]:
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self.deadline
+
+        try:
+            main_texts, links = await asyncio.wait_for(
+                self._fetch(start_url, True), timeout=self.deadline
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Menu crawl deadline hit on main page {start_url}")
+            return []
+
+        visited = {start_url}
+        frontier = []
+        for link in links[:self.max_links]:
+            if link in visited:
+                continue
+            visited.add(link)
+            frontier.append(link)
+
+        slots: List[Optional[List[str]]] = [main_texts] + [None] * len(frontier)
+        if not frontier or self._prefix_enough(slots):
+            return self._flatten(slots)
+
+        tasks = {
+            asyncio.create_task(self._fetch(link, False)): index + 1
+            for index, link in enumerate(frontier)
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = deadline_at - loop.time()
+                if remaining <= 0:
+                    logger.warning(f"Menu crawl deadline hit with {len(pending)} pages outstanding for {start_url}")
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    slots[tasks[task]] = task.result()[0]
+                if self._prefix_enough(slots):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        return self._flatten(slots)
+
+    def _prefix_enough(self, slots) -> bool:
+        # Only the completed prefix counts: later pages can't displace earlier
+        # text from the front of the combined menu.
+        prefix = []
+        for texts in slots:
+            if texts is None:
+                break
+            prefix.extend(texts)
+        return self.is_enough(prefix)
+
+    @staticmethod
+    def _flatten(slots) -> List[str]:
+        return [text for texts in slots if texts for text in texts]
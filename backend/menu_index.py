@@ -0,0 +1,369 @@
+"""Per-restaurant dish index shared by every user.
+
+Reading a restaurant's menu -- crawling it and having the LLM turn the text
+into dishes with ingredients and allergen tags -- doesn't depend on who is
+asking. That structured index is built once per menu URL and stored in
+MongoDB; each user's request then only evaluates the (much smaller) dish
+list against their own profile.
+
+Entries are served while younger than MENU_INDEX_TTL and kept for
+MENU_INDEX_RETAIN in total (a Mongo TTL index removes them after that).
+A partial build -- some chunks failed to extract -- is only served for
+MENU_INDEX_PARTIAL_TTL, so the next scan after that reads the missing
+blocks again.
+A stale entry is still the snapshot the next crawl is diffed against: it
+records the hash of every menu block (section) and the dishes read from
+it, so only blocks whose text changed go back to the LLM, and dishes in
+unchanged blocks keep their exact entries -- and with them the verdicts of
+earlier scans, which MenuIndex also keeps per (user, menu, profile).
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from allergen_matcher import ALLERGEN_TERMS, MATCHER_STATS, ProfileMatcher, describe_matches
+from page_cache import normalize_url
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ALLERGEN_TAGS = sorted(ALLERGEN_TERMS)
+
+DISH_EXTRACTION_PROMPT = f"""You are a restaurant menu parser. Turn raw menu text into structured data.
+
+For EVERY dish or drink in the text, extract:
+- name: the dish name as printed
+- description: the menu description (empty string if none)
+- section: the menu section it belongs to (e.g. "Starters", "Mains", "Drinks"), or empty string
+- ingredients: ingredients that are listed or that the dish clearly implies (e.g. "carbonara" implies egg, pork, cheese, wheat pasta)
+- allergen_tags: the allergen categories the dish likely contains, chosen ONLY from: {', '.join(ALLERGEN_TAGS)}
+
+Do not judge safety and do not skip dishes. Ignore prices, opening hours and promotional text.
+
+Respond in JSON format:
+{{
+  "restaurant_name": "Restaurant name or empty",
+  "dishes": [
+    {{
+      "name": "Dish name",
+      "description": "Description",
+      "section": "Section",
+      "ingredients": ["ingredient1", "ingredient2"],
+      "allergen_tags": ["milk", "gluten"]
+    }}
+  ]
+}}"""
+
+
+def dish_key(name: str) -> str:
+    """Dish identity across chunks and crawls: lowercase, punctuation and spacing collapsed"""
+    return re.sub(r'[^\w]+', ' ', name.lower()).strip()
+
+
+def dish_hash(dish: dict) -> str:
+    raw = '\x1f'.join((dish_key(dish['name']), dish['description'].strip().lower(), *dish['ingredients']))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def normalize_dishes(raw_dishes) -> List[dict]:
+    """Clean LLM-extracted dishes: required fields, known tags only, one entry per name"""
+    dishes = {}
+    for raw in raw_dishes or []:
+        if not isinstance(raw, dict) or not str(raw.get('name') or '').strip():
+            continue
+        dish = {
+            "name": str(raw['name']).strip(),
+            "description": str(raw.get('description') or '').strip(),
+            "section": str(raw.get('section') or '').strip(),
+            "ingredients": [str(item).strip().lower() for item in raw.get('ingredients') or [] if str(item).strip()],
+            "allergen_tags": sorted({
+                str(tag).strip().lower() for tag in raw.get('allergen_tags') or []
+                if str(tag).strip().lower() in ALLERGEN_TERMS
+            }),
+        }
+        dish["hash"] = dish_hash(dish)
+        key = dish_key(dish["name"])
+        existing = dishes.get(key)
+        # Keep the richer of two entries for the same dish
+        if existing is None or len(dish["description"]) + len(dish["ingredients"]) > \
+                len(existing["description"]) + len(existing["ingredients"]):
+            dishes[key] = dish
+    return list(dishes.values())
+
+
+def block_digest(block: str) -> str:
+    return hashlib.sha1(block.encode('utf-8')).hexdigest()
+
+
+def assign_dishes(blocks: List[Tuple[str, str]], raw_dishes) -> Dict[str, list]:
+    """Block hash -> dishes read from a chunk of (hash, text) blocks
+
+    A dish belongs to the blocks its name appears in; one the model named
+    differently from the menu text goes to every block of the chunk, so
+    reusing any of them can't lose it.
+    """
+    assigned: Dict[str, list] = {block_hash: [] for block_hash, _ in blocks}
+    lowered = [(block_hash, text.lower()) for block_hash, text in blocks]
+    for dish in raw_dishes or []:
+        if not isinstance(dish, dict) or not str(dish.get('name') or '').strip():
+            continue
+        name = str(dish['name']).strip().lower()
+        homes = [block_hash for block_hash, text in lowered if name in text] or list(assigned)
+        for block_hash in homes:
+            assigned[block_hash].append(dish)
+    return assigned
+
+
+def snapshot_block(block_hash: str, raw_dishes) -> dict:
+    """What a snapshot keeps per block: its hash and the dishes read from it"""
+    return {
+        "hash": block_hash,
+        "dish_keys": list(dict.fromkeys(
+            dish_key(str(dish['name'])) for dish in raw_dishes
+            if isinstance(dish, dict) and str(dish.get('name') or '').strip()
+        )),
+    }
+
+
+def _verdict_keys(verdicts: dict) -> set:
+    return {
+        dish_key(dish['name'])
+        for field in ('safe_dishes', 'unsafe_dishes') for dish in verdicts.get(field) or []
+        if isinstance(dish, dict) and dish.get('name')
+    }
+
+
+def verdict_hashes(dishes: List[dict], verdicts: dict) -> dict:
+    """dish key -> hash for the dishes that got a verdict (what the next scan may skip)"""
+    decided = _verdict_keys(verdicts)
+    return {dish_key(dish['name']): dish['hash'] for dish in dishes if dish_key(dish['name']) in decided}
+
+
+def reuse_menu_verdicts(last_scan: Optional[dict], dishes: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """([verdicts carried over from last_scan], dishes that still need evaluating)
+
+    A dish is carried over when the previous scan evaluated the exact same
+    dish (same hash) and has a verdict for it; the verdict list comes in
+    merge_menu_verdicts form.
+    """
+    if not last_scan or not last_scan.get('dish_hashes'):
+        return [], list(dishes)
+    known = last_scan['dish_hashes']
+    decided = _verdict_keys(last_scan)
+    unchanged = set()
+    to_evaluate = []
+    for dish in dishes:
+        key = dish_key(dish['name'])
+        if known.get(key) == dish['hash'] and key in decided:
+            unchanged.add(key)
+        else:
+            to_evaluate.append(dish)
+    if not unchanged:
+        return [], to_evaluate
+
+    def carried(verdicts):
+        return [dish for dish in verdicts or [] if dish_key(dish.get('name', '')) in unchanged]
+
+    return [{
+        "safe_dishes": carried(last_scan.get('safe_dishes')),
+        "unsafe_dishes": carried(last_scan.get('unsafe_dishes')),
+        # Nothing changed: the previous summary still holds
+        "summary": last_scan.get('summary', '') if not to_evaluate else "",
+    }], to_evaluate
+
+
+def dish_text(dish: dict) -> str:
+    text = f"{dish['name']}. {dish['description']}".strip()
+    if dish['ingredients']:
+        text += f" Ingredients: {', '.join(dish['ingredients'])}."
+    return text
+
+
+def split_by_profile(matcher: ProfileMatcher, dishes: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """(MenuDish fields for dishes the profile certainly excludes, dishes left to evaluate)
+
+    A dish is excluded locally when one of its allergen tags is a profile
+    category, or when its name/description/ingredients hit the matcher.
+    Modifications for excluded dishes come from the profile evaluation.
+    """
+    unsafe = []
+    undecided = []
+    for dish in dishes:
+        text = dish_text(dish)
+        matches = matcher.definitive_unsafe(text) or []
+        tagged = [tag for tag in dish['allergen_tags'] if tag in matcher.categories]
+        if not matches and not tagged:
+            undecided.append(dish)
+            continue
+        warnings, _ = describe_matches(matches, text)
+        matched = {match.category for match in matches}
+        warnings += [f"Likely contains {tag}" for tag in tagged if tag not in matched]
+        unsafe.append({
+            "name": dish['name'],
+            "description": dish['description'],
+            "is_safe": False,
+            "allergens": list(dict.fromkeys([match.category for match in matches] + tagged)),
+            "warnings": warnings,
+            "modifications": [],
+        })
+    MATCHER_STATS["local_verdicts"] += len(unsafe)
+    return unsafe, undecided
+
+
+def _combine_unsafe(first: dict, second: dict) -> dict:
+    """One unsafe entry from two verdicts on the same dish (e.g. local match + LLM modifications)"""
+    return {
+        **first,
+        "allergens": list(dict.fromkeys(list(first.get('allergens') or []) + list(second.get('allergens') or []))),
+        "warnings": list(dict.fromkeys(list(first.get('warnings') or []) + list(second.get('warnings') or []))),
+        "modifications": list(first.get('modifications') or []) or list(second.get('modifications') or []),
+    }
+
+
+def merge_menu_verdicts(evaluations: List[dict], local_unsafe: List[dict] = ()) -> dict:
+    """Combine per-batch safe/unsafe answers, one entry per dish ("unsafe" wins)
+
+    local_unsafe (split_by_profile verdicts) always stay unsafe; the LLM
+    answers only add their modifications and extra warnings.
+    """
+    safe = {}
+    unsafe = {dish_key(dish['name']): dish for dish in local_unsafe}
+    for parsed in evaluations:
+        for dish in parsed.get('unsafe_dishes') or []:
+            if isinstance(dish, dict) and dish.get('name'):
+                key = dish_key(dish['name'])
+                unsafe[key] = _combine_unsafe(unsafe[key], dish) if key in unsafe else dish
+        for dish in parsed.get('safe_dishes') or []:
+            if isinstance(dish, dict) and dish.get('name'):
+                safe.setdefault(dish_key(dish['name']), dish)
+    summaries = [parsed['summary'] for parsed in evaluations if parsed.get('summary')]
+    return {
+        "safe_dishes": [dish for key, dish in safe.items() if key not in unsafe],
+        "unsafe_dishes": list(unsafe.values()),
+        # A single batch's summary covers the menu; several are summarised by the caller
+        "summary": summaries[0] if len(evaluations) == 1 and summaries else "",
+    }
+
+
+class MenuIndex:
+    """Dish index per normalized menu URL: in-process LRU over a MongoDB collection."""
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.fresh_ttl = float(os.environ.get('MENU_INDEX_TTL', str(24 * 60 * 60)))
+        self.partial_ttl = float(os.environ.get('MENU_INDEX_PARTIAL_TTL', str(5 * 60)))
+        self.retain = float(os.environ.get('MENU_INDEX_RETAIN', str(7 * 24 * 60 * 60)))
+        self._entries = TTLCache(
+            maxsize=int(os.environ.get('MENU_INDEX_SIZE', '200')),
+            ttl=self.retain
+        )
+        # (user, menu, profile fingerprint) -> verdicts of the last scan
+        self._verdicts = TTLCache(
+            maxsize=int(os.environ.get('MENU_VERDICT_SNAPSHOTS', '5000')),
+            ttl=self.retain
+        )
+        self.fresh_hits = 0
+        self.builds = 0
+        self.partial_builds = 0
+        self.blocks_reused = 0
+        self.blocks_extracted = 0
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index("expire_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"Menu index index error: {str(e)}")
+
+    async def load(self, url: str) -> Optional[dict]:
+        """The stored entry for url, fresh or not"""
+        key = normalize_url(url)
+        entry = self._entries.get(key)
+        if entry is not None or self.collection is None:
+            return entry
+        try:
+            entry = await self.collection.find_one({"_id": key})
+        except Exception as e:
+            logger.error(f"Menu index read error: {str(e)}")
+            return None
+        if entry:
+            self._entries.set(key, entry)
+        return entry
+
+    def record_fresh_hit(self):
+        self.fresh_hits += 1
+
+    def is_fresh(self, entry: Optional[dict]) -> bool:
+        return bool(entry) and time.time() - entry["indexed_at"] < entry.get("fresh_ttl", self.fresh_ttl)
+
+    def diff_blocks(self, previous: Optional[dict], blocks: List[Tuple[str, str]]):
+        """Split (hash, text) blocks into ({hash: dishes} reused from previous, [(hash, text)] to extract)"""
+        known = {block["hash"]: block["dish_keys"] for block in (previous or {}).get("blocks") or []}
+        dishes = {dish_key(dish["name"]): dish for dish in (previous or {}).get("dishes") or []}
+        reused = {}
+        changed = []
+        for block_hash, text in dict(blocks).items():
+            if block_hash in known:
+                reused[block_hash] = [dishes[key] for key in known[block_hash] if key in dishes]
+            else:
+                changed.append((block_hash, text))
+        self.blocks_reused += len(reused)
+        self.blocks_extracted += len(changed)
+        return reused, changed
+
+    @staticmethod
+    def _verdict_key(user_id: str, url: str, fingerprint: str):
+        return user_id, normalize_url(url), fingerprint
+
+    def last_verdicts(self, user_id: str, url: str, fingerprint: str) -> Optional[dict]:
+        """Verdicts (and dish_hashes) of this user's last scan of url with this profile, if kept here"""
+        return self._verdicts.get(self._verdict_key(user_id, url, fingerprint))
+
+    def remember_verdicts(self, user_id: str, url: str, fingerprint: str, verdicts: dict):
+        self._verdicts.set(self._verdict_key(user_id, url, fingerprint), verdicts)
+
+    async def save(self, url: str, restaurant_name: str, dishes: List[dict], partial: bool = False, **extra) -> dict:
+        key = normalize_url(url)
+        content_hash = hashlib.sha256(
+            '\n'.join(sorted(dish["hash"] for dish in dishes)).encode('utf-8')
+        ).hexdigest()
+        entry = {
+            "_id": key,
+            "url": url,
+            "restaurant_name": restaurant_name or '',
+            "dishes": dishes,
+            "content_hash": content_hash,
+            "indexed_at": time.time(),
+            "fresh_ttl": self.partial_ttl if partial else self.fresh_ttl,
+            "partial": partial,
+            "expire_at": datetime.now(timezone.utc) + timedelta(seconds=self.retain),
+            **extra,
+        }
+        self.builds += 1
+        if partial:
+            self.partial_builds += 1
+        self._entries.set(key, entry)
+        if self.collection is not None:
+            try:
+                await self.collection.replace_one({"_id": key}, entry, upsert=True)
+            except Exception as e:
+                logger.error(f"Menu index write error: {str(e)}")
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "memory": self._entries.stats(),
+            "fresh_ttl_seconds": self.fresh_ttl,
+            "fresh_hits": self.fresh_hits,
+            "builds": self.builds,
+            "partial_builds": self.partial_builds,
+            "partial_ttl_seconds": self.partial_ttl,
+            "verdict_snapshots": self._verdicts.stats(),
+            "blocks_reused": self.blocks_reused,
+            "blocks_extracted": self.blocks_extracted,
+        }
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache keys: no fragment, tracking params or default port"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+class PageCache:
+    """Cache of extracted text for fetched pages, keyed by normalized URL.
+
+    Two tiers: an in-process LRU in front of a MongoDB collection shared by
+    all workers. Entries are served without any network I/O while fresh;
+    once stale they are revalidated with a conditional GET (ETag /
+    Last-Modified). When a page does change on the wire but its body hash
+    matches something we already parsed, the parse is skipped too.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.fresh_ttl = float(os.environ.get('PAGE_CACHE_TTL', str(6 * 60 * 60)))
+        self.retain = float(os.environ.get('PAGE_CACHE_RETAIN', str(7 * 24 * 60 * 60)))
+        maxsize = int(os.environ.get('PAGE_CACHE_SIZE', '500'))
+        self._entries = TTLCache(maxsize=maxsize, ttl=self.retain)
+        self._by_hash = TTLCache(maxsize=maxsize, ttl=self.retain)
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.hash_reuses = 0
+        self.parses = 0
+        self.fetch_failures = 0
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index("expire_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"Page cache index error: {str(e)}")
+
+    async def _load(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None or self.collection is None:
+            return entry
+        try:
+            entry = await self.collection.find_one({"_id": key})
+        except Exception as e:
+            logger.error(f"Page cache read error: {str(e)}")
+            return None
+        if entry:
+            self._entries.set(key, entry)
+        return entry
+
+    async def _store(self, entry: dict):
+        self._entries.set(entry["_id"], entry)
+        self._by_hash.set((entry["kind"], entry["content_hash"]), entry["value"])
+        if self.collection is None:
+            return
+        try:
+            await self.collection.replace_one({"_id": entry["_id"]}, entry, upsert=True)
+        except Exception as e:
+            logger.error(f"Page cache write error: {str(e)}")
+
+    async def fetch(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        kind: str,
+        parse: Callable[[httpx.Response], Awaitable[Any]]
+    ) -> Optional[Any]:
+        """Return parse(response) for url, or the cached result; None if the fetch fails"""
+        key = f"{kind}:{normalize_url(url)}"
+        entry = await self._load(key)
+        now = time.time()
+
+        if entry and now - entry["fetched_at"] < self.fresh_ttl:
+            self.fresh_hits += 1
+            return entry["value"]
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = await client.get(url, headers=headers)
+
+        if response.status_code == 304 and entry:
+            self.revalidated += 1
+            entry = {**entry, "fetched_at": now, "expire_at": self._expire_at()}
+            await self._store(entry)
+            return entry["value"]
+
+        if response.status_code != 200:
+            self.fetch_failures += 1
+            return None
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if entry and entry["content_hash"] == content_hash:
+            value = entry["value"]
+            self.hash_reuses += 1
+        else:
+            value = self._by_hash.get((kind, content_hash))
+            if value is not None:
+                self.hash_reuses += 1
+            else:
+                value = await parse(response)
+                self.parses += 1
+
+        await self._store({
+            "_id": key,
+            "url": url,
+            "kind": kind,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "content_hash": content_hash,
+            "value": value,
+            "fetched_at": now,
+            "expire_at": self._expire_at()
+        })
+        return value
+
+    def _expire_at(self) -> datetime:
+        # Read by the TTL index on page_cache.expire_at
+        return datetime.now(timezone.utc) + timedelta(seconds=self.retain)
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._entries.stats(),
+            "fresh_hits": self.fresh_hits,
+            "revalidated": self.revalidated,
+            "hash_reuses": self.hash_reuses,
+            "parses": self.parses,
+            "fetch_failures": self.fetch_failures,
+        }
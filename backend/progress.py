@@ -0,0 +1,96 @@
+"""Server-Sent Events streaming for the analysis endpoints.
+
+Handlers call ``report_progress(stage, **data)`` at interesting points. When
+the request opted into streaming (``?stream=1`` or ``Accept:
+text/event-stream``) those calls become SSE events, followed by a final
+``result`` (or ``error``) event; otherwise they are no-ops.
+"""
+import asyncio
+import json
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+
+_progress_queue: ContextVar[Optional[asyncio.Queue]] = ContextVar('progress_queue', default=None)
+
+
+def report_progress(stage: str, **data):
+    queue = _progress_queue.get()
+    if queue is not None:
+        queue.put_nowait((stage, data))
+
+
+def wants_event_stream(request: Request) -> bool:
+    if request.query_params.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('accept', '').lower()
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def _error_payload(exc: Exception) -> dict:
+    if isinstance(exc, HTTPException):
+        return {"status_code": exc.status_code, "detail": exc.detail}
+    retry_after = getattr(exc, 'retry_after', None)
+    if retry_after is not None:
+        return {"status_code": 503, "detail": str(exc), "retry_after": retry_after}
+    logger.error(f"Streaming request failed: {str(exc)}")
+    return {"status_code": 500, "detail": str(exc)}
+
+
+def event_stream_response(run: Callable[[], Awaitable[Any]]) -> StreamingResponse:
+    """Run ``run()`` in the background, streaming its progress and final result as SSE"""
+
+    async def events():
+        queue = asyncio.Queue()
+        token = _progress_queue.set(queue)
+        try:
+            task = asyncio.create_task(run())  # inherits the progress queue
+        finally:
+            _progress_queue.reset(token)
+
+        try:
+            yield _sse("started", {})
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, task}, timeout=HEARTBEAT_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    stage, data = getter.result()
+                    yield _sse(stage, data)
+                    continue
+                getter.cancel()
+                if task in done:
+                    break
+                yield ": keep-alive\n\n"
+
+            # Drain anything reported just before the task finished
+            while not queue.empty():
+                stage, data = queue.get_nowait()
+                yield _sse(stage, data)
+
+            try:
+                yield _sse("result", task.result())
+            except Exception as e:
+                yield _sse("error", _error_payload(e))
+        finally:
+            # If the client went away, let the analysis finish so it still
+            # lands in history, just as a non-streaming request would
+            if not task.done():
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,130 @@
+"""Pool of generated recipes per (food item, profile fingerprint).
+
+The recipe finder shows three recipes and lets the user ask for different
+ones, passing back the names already shown. Instead of a fresh LLM call
+per reroll, every answer goes into a pool shared by all users with the
+same profile lists, and a background task tops the pool up with more
+variations while the user reads the first ones. Rerolls are then served
+from the pool (minus the excluded names) until it runs dry.
+
+Pools hold at most RECIPE_POOL_MAX_RECIPES recipes, at most
+RECIPE_POOL_SIZE pools are kept (LRU) and each lives RECIPE_POOL_TTL.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from llm_cache import normalize_query
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RECIPES_PER_ANSWER = 3
+
+# generate(names to avoid) -> (recipes, summary)
+GenerateRecipes = Callable[[List[str]], Awaitable[Tuple[List[dict], str]]]
+
+
+def _name(recipe: dict) -> str:
+    return normalize_query(recipe.get('name') or '')
+
+
+class _Pool:
+    __slots__ = ("recipes", "summary")
+
+    def __init__(self):
+        self.recipes: List[dict] = []
+        self.summary = ""
+
+
+class RecipePool:
+    def __init__(self):
+        self.max_recipes = int(os.environ.get('RECIPE_POOL_MAX_RECIPES', '12'))
+        self._pools = TTLCache(
+            maxsize=int(os.environ.get('RECIPE_POOL_SIZE', '500')),
+            ttl=float(os.environ.get('RECIPE_POOL_TTL', str(6 * 60 * 60)))
+        )
+        self._refills: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.prefetch_failures = 0
+        self.recipes_added = 0
+
+    @staticmethod
+    def key(food_item: str, fingerprint: str) -> Tuple[str, str]:
+        return normalize_query(food_item), fingerprint
+
+    def take(self, key, exclude: Iterable[str] = (), count: int = RECIPES_PER_ANSWER) -> Optional[Tuple[List[dict], str]]:
+        """(count recipes not in exclude, summary) from the pool, or None if it can't fill an answer"""
+        pool = self._pools.get(key)
+        excluded = {normalize_query(name) for name in exclude or []}
+        available = [recipe for recipe in pool.recipes if _name(recipe) not in excluded] if pool else []
+        if len(available) < count:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return available[:count], pool.summary
+
+    def add(self, key, recipes: List[dict], summary: str = ""):
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = _Pool()
+            self._pools.set(key, pool)
+        known = {_name(recipe) for recipe in pool.recipes}
+        for recipe in recipes:
+            if len(pool.recipes) >= self.max_recipes:
+                break
+            if _name(recipe) and _name(recipe) not in known:
+                known.add(_name(recipe))
+                pool.recipes.append(recipe)
+                self.recipes_added += 1
+        pool.summary = pool.summary or summary
+
+    def prefetch(self, key, generate: GenerateRecipes, exclude: Iterable[str] = ()):
+        """Top the pool up in the background (one refill per pool at a time)"""
+        pool = self._pools.get(key)
+        if key in self._refills or (pool is not None and len(pool.recipes) >= self.max_recipes):
+            return
+        avoid = list(dict.fromkeys(
+            [recipe['name'] for recipe in (pool.recipes if pool else [])] + list(exclude or [])
+        ))
+
+        async def refill():
+            try:
+                recipes, summary = await generate(avoid)
+                self.add(key, recipes, summary)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.prefetch_failures += 1
+                logger.warning(f"Recipe prefetch failed: {str(e)}")
+
+        task = asyncio.create_task(refill())
+        self._refills[key] = task
+        task.add_done_callback(lambda _task, key=key: self._refills.pop(key, None))
+        self.prefetches += 1
+
+    async def close(self):
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            **self._pools.stats(),
+            "max_recipes": self.max_recipes,
+            "served_from_pool": self.hits,
+            "pool_dry": self.misses,
+            "served_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "refills_in_flight": len(self._refills),
+            "prefetches": self.prefetches,
+            "prefetch_failures": self.prefetch_failures,
+            "recipes_added": self.recipes_added,
+        }
+
+
+recipe_pool = RecipePool()
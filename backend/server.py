@@ -3,16 +3,48 @@ from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 import httpx
 from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContent
 import base64
+import hashlib
+import json
+import time
+from ttl_cache import TTLCache
+from http_clients import http_pools
+from menu_crawler import MenuCrawler
+from worker_pool import doc_workers
+from image_prep import image_preprocessor
+from label_index import label_index
+from recipe_pool import recipe_pool
+from uploads import UploadSizeLimitMiddleware, read_image_upload, upload_stats
+from page_cache import PageCache, normalize_url
+from menu_index import (
+    MenuIndex, DISH_EXTRACTION_PROMPT, assign_dishes, block_digest, dish_key, dish_text, merge_menu_verdicts,
+    normalize_dishes, reuse_menu_verdicts, snapshot_block, split_by_profile, verdict_hashes
+)
+from menu_chunks import (
+    MENU_CHUNK_CHARS, MENU_EVAL_BATCH, MENU_MAX_CHUNKS, batched, gather_bounded, menu_blocks, pack_blocks
+)
+from llm_cache import LLMResponseCache, normalize_query
+from llm_json import parse_llm_json
+from batch_analysis import match_answers, query_groups, unique_queries
+from single_flight import SingleFlight
+from llm_scheduler import LLMScheduler, SchedulerOverloaded
+from progress import report_progress, wants_event_stream, event_stream_response
+from extractors import extract_product_text, extract_menu_page, filter_menu_content
+from compiled_profile import CompiledProfileCache
+from indexes import ensure_indexes
+from history_pages import HISTORY_SORT, fetch_history_page, fetch_activity_page
+from history_writer import HistoryWriter
+from allergen_matcher import ProfileMatcher, MATCHER_STATS, describe_matches, ingredient_section
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -22,6 +54,30 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Extracted text of fetched product/menu pages, shared across workers
+page_cache = PageCache(db.page_cache)
+
+# Per-restaurant dish index, extracted once and evaluated per profile
+menu_index = MenuIndex(db.menu_dish_index)
+
+# Raw LLM answers keyed by profile fingerprint + normalized query
+llm_cache = LLMResponseCache(db.llm_cache)
+
+# Concurrent identical LLM calls coalesced into one upstream request
+llm_flights = SingleFlight()
+
+# Global cap on concurrent Gemini calls, with priority queueing
+llm_scheduler = LLMScheduler()
+
+# History inserts are batched off the request path
+history_writer = HistoryWriter(db)
+
+# Compiled allergy profiles (matcher + prompt header) by profile fingerprint
+compiled_profiles = CompiledProfileCache()
+
+LLM_PROVIDER = "gemini"
+LLM_MODEL = "gemini-2.0-flash-exp"
+
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -62,6 +118,9 @@ class AllergyProfileCreate(BaseModel):
 class AnalysisRequest(BaseModel):
     query: str
 
+class BatchAnalysisRequest(BaseModel):
+    queries: List[str]
+
 class AnalysisResult(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -74,6 +133,9 @@ class AnalysisResult(BaseModel):
     alternatives: List[str]
     timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class BatchAnalysisResult(BaseModel):
+    results: List[AnalysisResult]
+
 class ImageAnalysisResult(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -135,33 +197,114 @@ class RecipeFinderResult(BaseModel):
     summary: str
     timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
-# Authentication helper
-async def get_current_user(request: Request) -> str:
+# Session cache: token -> (user_id, parsed expiry). Entries never outlive the
+# session itself and are capped at SESSION_CACHE_TTL so a logout handled by
+# another worker is picked up within that window.
+session_cache = TTLCache(
+    maxsize=int(os.environ.get('SESSION_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('SESSION_CACHE_TTL', '60'))
+)
+
+# Allergy profiles read by the analysis endpoints: user_id -> profile doc.
+# Writes through this worker update it; PROFILE_READ_CACHE_TTL bounds how
+# long another worker's write can go unseen.
+profile_cache = TTLCache(
+    maxsize=int(os.environ.get('PROFILE_READ_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('PROFILE_READ_CACHE_TTL', '60'))
+)
+
+def get_session_token(request: Request) -> Optional[str]:
     session_token = request.cookies.get('session_token')
     if not session_token:
         auth_header = request.headers.get('Authorization')
         if auth_header and auth_header.startswith('Bearer '):
             session_token = auth_header.split(' ')[1]
+    return session_token
+
+# Authentication helper
+async def get_current_user(request: Request) -> str:
+    session_token = get_session_token(request)
     
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    now = datetime.now(timezone.utc)
+    cached = session_cache.get(session_token)
+    if cached:
+        user_id, expires_at = cached
+        if expires_at >= now:
+            return user_id
+        session_cache.pop(session_token)
+    
     session = await db.sessions.find_one({"session_token": session_token})
     if not session:
         raise HTTPException(status_code=401, detail="Invalid session")
     
     expires_at = datetime.fromisoformat(session['expires_at'])
-    if expires_at < datetime.now(timezone.utc):
+    if expires_at < now:
         await db.sessions.delete_one({"session_token": session_token})
         raise HTTPException(status_code=401, detail="Session expired")
     
+    session_cache.set(
+        session_token,
+        (session['user_id'], expires_at),
+        ttl=(expires_at - now).total_seconds()
+    )
     return session['user_id']
 
+async def send_llm_message(
+    priority_class: str, session_prefix: str, user_id: str, system_message: str, message: UserMessage
+) -> str:
+    # Initialize Gemini chat - Using your free Google API key
+    chat = LlmChat(
+        api_key=os.environ.get('GOOGLE_API_KEY', os.environ['EMERGENT_LLM_KEY']),
+        session_id=f"{session_prefix}_{user_id}_{uuid.uuid4()}",
+        system_message=system_message
+    ).with_model(LLM_PROVIDER, LLM_MODEL)
+    # Every Gemini call waits for a slot in the global scheduler
+    return await llm_scheduler.run(priority_class, lambda: chat.send_message(message))
+
 # Health check endpoint
 @api_router.get("/")
 async def root():
     return {"status": "ok", "message": "ClarifyAI API"}
 
+# Internal counters are only shown to the accounts listed in METRICS_ADMIN_EMAILS
+METRICS_ADMIN_EMAILS = frozenset(
+    email.strip().lower() for email in os.environ.get('METRICS_ADMIN_EMAILS', '').split(',') if email.strip()
+)
+
+async def require_metrics_admin(user_id: str = Depends(get_current_user)) -> str:
+    if not METRICS_ADMIN_EMAILS:
+        # Disabled unless configured
+        raise HTTPException(status_code=404, detail="Not Found")
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
+    if not user or str(user.get('email', '')).lower() not in METRICS_ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return user_id
+
+# Internal cache/pool counters
+@api_router.get("/metrics")
+async def get_metrics(user_id: str = Depends(require_metrics_admin)):
+    return {
+        "session_cache": session_cache.stats(),
+        "http_pools": http_pools.stats(),
+        "doc_workers": doc_workers.stats(),
+        "image_preprocessor": image_preprocessor.stats(),
+        "uploads": upload_stats.stats(),
+        "label_index": label_index.stats(),
+        "page_cache": page_cache.stats(),
+        "menu_index": menu_index.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_single_flight": llm_flights.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "allergen_matcher": dict(MATCHER_STATS),
+        "profile_cache": profile_cache.stats(),
+        "compiled_profiles": compiled_profiles.stats(),
+        "recipe_pool": recipe_pool.stats(),
+        "history_writer": history_writer.stats()
+    }
+
 # Auth endpoints
 @api_router.post("/auth/session")
 async def create_session(request: Request, response: Response):
@@ -169,18 +312,17 @@ async def create_session(request: Request, response: Response):
     if not session_id:
         raise HTTPException(status_code=400, detail="Session ID required")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            api_response = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            )
-            if api_response.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid session")
-            
-            session_data = api_response.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Auth service error: {str(e)}")
+    try:
+        api_response = await http_pools.get("auth").get(
+            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+            headers={"X-Session-ID": session_id}
+        )
+        if api_response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid session")
+        
+        session_data = api_response.json()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Auth service error: {str(e)}")
     
     # Create or get user
     user_email = session_data['email']
@@ -206,7 +348,12 @@ async def create_session(request: Request, response: Response):
         user_id=user_id,
         expires_at=expires_at.isoformat()
     )
-    await db.sessions.insert_one(session.model_dump())
+    # Upsert: retrying the same auth session must not trip the unique token index
+    await db.sessions.replace_one(
+        {"session_token": session_token},
+        {**session.model_dump(), "expires_at_dt": expires_at},
+        upsert=True
+    )
     
     # Set cookie
     response.set_cookie(
@@ -232,8 +379,9 @@ async def get_me(user_id: str = Depends(get_current_user)):
 
 @api_router.post("/auth/logout")
 async def logout(response: Response, user_id: str = Depends(get_current_user), request: Request = None):
-    session_token = request.cookies.get('session_token')
+    session_token = get_session_token(request)
     if session_token:
+        session_cache.pop(session_token)
         await db.sessions.delete_one({"session_token": session_token})
     
     response.delete_cookie(key="session_token", path="/")
@@ -242,14 +390,18 @@ async def logout(response: Response, user_id: str = Depends(get_current_user), r
 # Allergy Profile endpoints
 @api_router.post("/profile/allergy", response_model=AllergyProfile)
 async def create_allergy_profile(profile: AllergyProfileCreate, user_id: str = Depends(get_current_user)):
-    # Delete existing profile
-    await db.allergy_profiles.delete_many({"user_id": user_id})
-    
     allergy_profile = AllergyProfile(
         user_id=user_id,
         **profile.model_dump()
     )
-    await db.allergy_profiles.insert_one(allergy_profile.model_dump())
+    # Replace any existing profile in one write
+    await db.allergy_profiles.replace_one(
+        {"user_id": user_id},
+        allergy_profile.model_dump(),
+        upsert=True
+    )
+    profile_cache.set(user_id, allergy_profile.model_dump())
+    compiled_profiles.invalidate_user(user_id)
     return allergy_profile
 
 @api_router.get("/profile/allergy", response_model=AllergyProfile)
@@ -261,33 +413,80 @@ async def get_allergy_profile(user_id: str = Depends(get_current_user)):
 
 @api_router.put("/profile/allergy", response_model=AllergyProfile)
 async def update_allergy_profile(profile: AllergyProfileCreate, user_id: str = Depends(get_current_user)):
-    existing = await db.allergy_profiles.find_one({"user_id": user_id})
-    if not existing:
+    updated = await db.allergy_profiles.find_one_and_update(
+        {"user_id": user_id},
+        {"$set": {**profile.model_dump(), "updated_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
         raise HTTPException(status_code=404, detail="Profile not found")
     
-    updated_profile = AllergyProfile(
-        id=existing['id'],
-        user_id=user_id,
-        **profile.model_dump()
+    profile_cache.set(user_id, updated)
+    compiled_profiles.invalidate_user(user_id)
+    return AllergyProfile(**updated)
+
+async def load_allergy_profile(user_id: str) -> dict:
+    """The user's profile for an analysis, from profile_cache when possible"""
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        profile = await db.allergy_profiles.find_one({"user_id": user_id}, {"_id": 0})
+        if not profile:
+            raise HTTPException(status_code=400, detail="Please set up your allergy profile first")
+        profile_cache.set(user_id, profile)
+    return profile
+
+PRODUCT_CONTENT_LIMIT = 15000
+
+def local_analysis(compiled, text: Optional[str], query: str, analysis_type: str, user_id: str) -> Optional[AnalysisResult]:
+    """An "unsafe" result if text certainly contains something the profile excludes, else None"""
+    matches = compiled.matcher.definitive_unsafe(text) if text else None
+    if not matches:
+        return None
+    MATCHER_STATS["local_verdicts"] += 1
+    warnings, alternatives = describe_matches(matches, text)
+    report_progress("local_match", matches=[text[m.start:m.end] for m in matches])
+    found = "; ".join(
+        f"'{text[m.start:m.end]}' ({m.category}, characters {m.start}-{m.end})" for m in matches
     )
-    await db.allergy_profiles.update_one(
-        {"user_id": user_id},
-        {"$set": updated_profile.model_dump()}
+    return AnalysisResult(
+        user_id=user_id,
+        query=query,
+        analysis_type=analysis_type,
+        result=f"Not safe for your profile. The ingredients contain: {found}.",
+        is_safe=False,
+        warnings=warnings,
+        alternatives=alternatives
     )
-    return updated_profile
+
+def text_analysis_system_message(compiled) -> str:
+    return f"""You are an expert allergy assistant. Analyze products, ingredients, foods, perfumes, and fragrances for allergy safety.
+    
+{compiled.prompt_header}
+    
+Provide a thorough analysis including:
+1. Safety assessment (safe/warning/danger) - Focus on ACTUAL INGREDIENTS only
+2. Specific concerns related to user's allergies based on listed ingredients
+3. Check against religious dietary laws (Halal, Kosher, Hindu vegetarian, etc.)
+4. For perfumes/fragrances: identify common allergen compounds (linalool, limonene, citronellol, geraniol, etc.)
+5. Alternative suggestions if unsafe - MUST provide 3-5 specific alternatives when item is unsafe
+6. Emergency advice if needed
+
+IMPORTANT: Focus on actual ingredients present in the item. Do NOT emphasize cross-contamination warnings as these are often standard disclaimers. Only mention cross-contamination if it's a severe allergy and truly critical."""
 
 # AI Analysis endpoint
 @api_router.post("/analyze", response_model=AnalysisResult)
-async def analyze_item(request: AnalysisRequest, user_id: str = Depends(get_current_user)):
+async def analyze_item(request: AnalysisRequest, http_request: Request, user_id: str = Depends(get_current_user)):
+    if wants_event_stream(http_request):
+        return event_stream_response(lambda: run_analyze_item(request, user_id))
+    return await run_analyze_item(request, user_id)
+
+async def run_analyze_item(request: AnalysisRequest, user_id: str) -> AnalysisResult:
     # Get user's allergy profile
-    profile = await db.allergy_profiles.find_one({"user_id": user_id})
-    if not profile:
-        raise HTTPException(status_code=400, detail="Please set up your allergy profile first")
+    profile = await load_allergy_profile(user_id)
     
-    allergies = profile.get('allergies', [])
-    dietary_restrictions = profile.get('dietary_restrictions', [])
-    religion_restrictions = profile.get('religion_restrictions', [])
-    skin_sensitivities = profile.get('skin_sensitivities', [])
+    # Matcher and prompt header, shared by every user with the same profile
+    compiled = compiled_profiles.get(profile)
     
     # Check if query is a URL
     is_url = request.query.strip().startswith(('http://', 'https://'))
@@ -296,89 +495,44 @@ async def analyze_item(request: AnalysisRequest, user_id: str = Depends(get_curr
     if is_url:
         # Fetch and extract product information from URL
         try:
-            from bs4 import BeautifulSoup
-            import io
-            from PyPDF2 import PdfReader
-            from docx import Document
-            import openpyxl
-            
-            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-                response = await client.get(request.query)
-                if response.status_code != 200:
-                    raise HTTPException(status_code=400, detail="Unable to fetch product page")
-                
+            async def parse_product_page(response):
+                # Extract (at most PRODUCT_CONTENT_LIMIT chars) in the document worker pool
                 content_type = response.headers.get('content-type', '').lower()
-                
-                # Try to extract from different file formats
-                extracted_text = None
-                
-                # PDF files
-                if 'pdf' in content_type:
-                    pdf_reader = PdfReader(io.BytesIO(response.content))
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-                    extracted_text = text
-                
-                # Word documents
-                elif 'word' in content_type or 'document' in content_type:
-                    doc = Document(io.BytesIO(response.content))
-                    text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                    extracted_text = text
-                
-                # Plain text or HTML
-                else:
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    
-                    # Remove unwanted elements
-                    for element in soup(["script", "style", "nav", "header", "footer", "iframe", "noscript"]):
-                        element.decompose()
-                    
-                    # Try to find product-related content
-                    product_sections = soup.find_all(['div', 'section', 'article'], class_=lambda x: x and any(
-                        keyword in str(x).lower() for keyword in ['product', 'item', 'detail', 'description', 'ingredient', 'content', 'info']
-                    ))
-                    
-                    if product_sections:
-                        for section in product_sections:
-                            text = section.get_text()
-                            lines = (line.strip() for line in text.splitlines())
-                            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                            clean_text = '\n'.join(chunk for chunk in chunks if chunk and len(chunk) > 5)
-                            if clean_text:
-                                product_info += clean_text + "\n\n"
-                    
-                    # If no specific sections found, get all visible text
-                    if not product_info:
-                        text = soup.get_text()
-                        lines = (line.strip() for line in text.splitlines())
-                        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                        product_info = '\n'.join(chunk for chunk in chunks if chunk and len(chunk) > 5)
-                
-                if extracted_text:
-                    product_info = extracted_text
-                
-                # Limit content size
-                product_info = product_info[:15000]
-                
-                if not product_info or len(product_info) < 50:
-                    raise HTTPException(status_code=400, detail="Could not extract product information from URL")
-                
+                return await doc_workers.run(
+                    extract_product_text, response.content, response.encoding,
+                    content_type, PRODUCT_CONTENT_LIMIT
+                )
+            
+            product_info = await page_cache.fetch(
+                http_pools.get("product"), request.query, "product", parse_product_page
+            )
+            if product_info is None:
+                raise HTTPException(status_code=400, detail="Unable to fetch product page")
+            report_progress("extraction_done", characters=len(product_info))
+            
+            if not product_info or len(product_info) < 50:
+                raise HTTPException(status_code=400, detail="Could not extract product information from URL")
+            
         except httpx.RequestError as e:
             logging.error(f"URL fetch error: {str(e)}")
             raise HTTPException(status_code=400, detail=f"Unable to fetch product page: {str(e)}")
         except Exception as e:
             logging.error(f"URL processing error: {str(e)}")
             raise HTTPException(status_code=400, detail=f"Error processing URL: {str(e)}")
-    
+
+    # An unqualified hit on the profile's allergen dictionary is a definite
+    # "unsafe" -- answer it locally. For pages, only trust the ingredient list.
+    local_text = ingredient_section(product_info) if is_url else request.query
+    result = local_analysis(compiled, local_text, request.query, "url" if is_url else "text", user_id)
+    if result is not None:
+        await history_writer.add("analysis_history", result.model_dump())
+        return result
+
     # Create AI prompt
     if is_url:
         system_message = f"""You are an expert allergy assistant. Analyze product information extracted from a website for allergy safety.
     
-User's allergies: {', '.join(allergies) if allergies else 'None'}
-Dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
-Religion restrictions: {', '.join(religion_restrictions) if religion_restrictions else 'None'}
-Skin sensitivities: {', '.join(skin_sensitivities) if skin_sensitivities else 'None'}
+{compiled.prompt_header}
     
 Provide a thorough analysis including:
 1. Identify the product name and type
@@ -407,22 +561,7 @@ Provide your response in this JSON format:
 
 IMPORTANT: If is_safe is false, you MUST provide 3-5 safe alternatives that the user can use instead."""
     else:
-        system_message = f"""You are an expert allergy assistant. Analyze products, ingredients, foods, perfumes, and fragrances for allergy safety.
-    
-User's allergies: {', '.join(allergies) if allergies else 'None'}
-Dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
-Religion restrictions: {', '.join(religion_restrictions) if religion_restrictions else 'None'}
-Skin sensitivities: {', '.join(skin_sensitivities) if skin_sensitivities else 'None'}
-    
-Provide a thorough analysis including:
-1. Safety assessment (safe/warning/danger) - Focus on ACTUAL INGREDIENTS only
-2. Specific concerns related to user's allergies based on listed ingredients
-3. Check against religious dietary laws (Halal, Kosher, Hindu vegetarian, etc.)
-4. For perfumes/fragrances: identify common allergen compounds (linalool, limonene, citronellol, geraniol, etc.)
-5. Alternative suggestions if unsafe - MUST provide 3-5 specific alternatives when item is unsafe
-6. Emergency advice if needed
-
-IMPORTANT: Focus on actual ingredients present in the item. Do NOT emphasize cross-contamination warnings as these are often standard disclaimers. Only mention cross-contamination if it's a severe allergy and truly critical."""
+        system_message = text_analysis_system_message(compiled)
         
         user_message = f"""Analyze this product: {request.query}
     
@@ -437,16 +576,30 @@ Provide your response in this JSON format:
 
 IMPORTANT: If is_safe is false, you MUST provide 3-5 safe alternatives that the user can use instead. These should be specific product names or ingredients that are safe for their allergies."""
     
+    # Same profile lists + same query (+ same page content for URLs) => same answer
+    cache_query = f"{request.query}\n{hashlib.sha256(product_info.encode('utf-8')).hexdigest()}" if is_url else request.query
+    cache_key = llm_cache.make_key(
+        "analyze-url" if is_url else "analyze-text",
+        compiled.fingerprint,
+        cache_query,
+        LLM_MODEL
+    )
+    
     try:
-        # Initialize Gemini chat - Using your free Google API key
-        chat = LlmChat(
-            api_key=os.environ.get('GOOGLE_API_KEY', os.environ['EMERGENT_LLM_KEY']),
-            session_id=f"analysis_{user_id}_{uuid.uuid4()}",
-            system_message=system_message
-        ).with_model("gemini", "gemini-2.0-flash-exp")
-        
-        message = UserMessage(text=user_message)
-        ai_response = await chat.send_message(message)
+        ai_response = await llm_cache.get(cache_key)
+        if ai_response is None:
+            report_progress("llm_started")
+            llm_started = time.perf_counter()
+            # Identical in-flight requests share one Gemini call
+            ai_response = await llm_flights.do(
+                cache_key,
+                lambda: send_llm_message("analyze", "analysis", user_id, system_message, UserMessage(text=user_message))
+            )
+            llm_latency = time.perf_counter() - llm_started
+            report_progress("llm_done", seconds=round(llm_latency, 3))
+        else:
+            llm_latency = None
+            report_progress("llm_cache_hit")
         
         # Parse AI response
         import json
@@ -459,6 +612,9 @@ IMPORTANT: If is_safe is false, you MUST provide 3-5 safe alternatives that the
         
         try:
             parsed = json.loads(response_text)
+            # Only well-formed answers are worth replaying
+            if llm_latency is not None:
+                await llm_cache.set(cache_key, ai_response, llm_latency)
         except:
             # Fallback if JSON parsing fails
             parsed = {
@@ -480,57 +636,248 @@ IMPORTANT: If is_safe is false, you MUST provide 3-5 safe alternatives that the
         )
         
         # Save to history
-        await db.analysis_history.insert_one(result.model_dump())
+        await history_writer.add("analysis_history", result.model_dump())
         
         return result
     
+    except SchedulerOverloaded:
+        raise
     except Exception as e:
         logging.error(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+ANALYZE_BATCH_MAX_ITEMS = int(os.environ.get('ANALYZE_BATCH_MAX_ITEMS', '50'))
+ANALYZE_BATCH_ITEMS_PER_PROMPT = int(os.environ.get('ANALYZE_BATCH_ITEMS_PER_PROMPT', '10'))
+# Multi-item prompts in flight per batch request
+ANALYZE_BATCH_CONCURRENCY = int(os.environ.get('ANALYZE_BATCH_CONCURRENCY', '2'))
+
+def analysis_from_answer(answer: dict, query: str, user_id: str) -> AnalysisResult:
+    return AnalysisResult(
+        user_id=user_id,
+        query=query,
+        analysis_type="text",
+        result=answer.get('detailed_analysis') or answer.get('summary', ''),
+        is_safe=answer.get('is_safe', False),
+        warnings=answer.get('warnings', []),
+        alternatives=answer.get('alternatives', [])
+    )
+
+async def analyze_query_group(compiled, queries: List[str], user_id: str) -> List[Optional[dict]]:
+    """One LLM call for several items; the answer for each query, in order (None if missing)"""
+    items = '\n'.join(f"{number}. {query}" for number, query in enumerate(queries, 1))
+    user_message = f"""Analyze each of these {len(queries)} products separately:
+
+{items}
+
+Provide your response in this JSON format, with one entry per product in the same order:
+{{
+  "items": [
+    {{
+      "item": "the product exactly as given",
+      "is_safe": true/false,
+      "summary": "Brief safety summary",
+      "warnings": ["warning1", "warning2"],
+      "alternatives": ["alternative1", "alternative2", "alternative3"],
+      "detailed_analysis": "Detailed explanation"
+    }}
+  ]
+}}
+
+IMPORTANT: If is_safe is false for a product, you MUST provide 3-5 safe alternatives for it."""
+    
+    group_key = llm_cache.make_key("analyze-batch", compiled.fingerprint, '\n'.join(queries), LLM_MODEL)
+    llm_started = time.perf_counter()
+    ai_response = await llm_flights.do(
+        group_key,
+        lambda: send_llm_message(
+            "analyze", "analysis_batch", user_id, text_analysis_system_message(compiled), UserMessage(text=user_message)
+        )
+    )
+    llm_latency = time.perf_counter() - llm_started
+    
+    answers = [answer for answer in (parse_llm_json(ai_response) or {}).get('items') or [] if isinstance(answer, dict)]
+    results = []
+    for query, (answer, by_name) in zip(queries, match_answers(queries, answers)):
+        if by_name:
+            # Later single-item requests for the same product are served from the cache
+            await llm_cache.set(
+                llm_cache.make_key("analyze-text", compiled.fingerprint, query, LLM_MODEL),
+                json.dumps(answer), llm_latency / len(queries)
+            )
+        results.append(answer)
+    return results
+
+# Batch analysis endpoint (e.g. a shopping list)
+@api_router.post("/analyze/batch", response_model=BatchAnalysisResult)
+async def analyze_batch(request: BatchAnalysisRequest, http_request: Request, user_id: str = Depends(get_current_user)):
+    if wants_event_stream(http_request):
+        return event_stream_response(lambda: run_analyze_batch(request, user_id))
+    return await run_analyze_batch(request, user_id)
+
+async def run_analyze_batch(request: BatchAnalysisRequest, user_id: str) -> BatchAnalysisResult:
+    queries = [query.strip() for query in request.queries if query.strip()]
+    if not queries:
+        raise HTTPException(status_code=400, detail="Please provide at least one item to analyze")
+    if len(queries) > ANALYZE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {ANALYZE_BATCH_MAX_ITEMS} items can be analyzed at once")
+    if any(query.startswith(('http://', 'https://')) for query in queries):
+        raise HTTPException(status_code=400, detail="Batch analysis takes product names or ingredients; analyze URLs one at a time")
+    
+    # One profile read and one compiled matcher for the whole list
+    profile = await load_allergy_profile(user_id)
+    compiled = compiled_profiles.get(profile)
+    
+    # Repeated items are analyzed once
+    answers = {}
+    failed = set()
+    pending = []
+    for query in unique_queries(queries):
+        key = normalize_query(query)
+        local = local_analysis(compiled, query, query, "text", user_id)
+        if local is not None:
+            answers[key] = local
+            continue
+        cached = await llm_cache.get(llm_cache.make_key("analyze-text", compiled.fingerprint, query, LLM_MODEL))
+        parsed = parse_llm_json(cached) if cached is not None else None
+        if parsed is not None:
+            answers[key] = analysis_from_answer(parsed, query, user_id)
+        else:
+            pending.append(query)
+    report_progress("batch_answered", items=len(answers), pending=len(pending))
+    
+    try:
+        # The rest goes out as a few multi-item prompts, concurrently
+        groups = query_groups(pending, ANALYZE_BATCH_ITEMS_PER_PROMPT)
+        if groups:
+            report_progress("llm_started", prompts=len(groups))
+            group_answers = await gather_bounded(
+                lambda group: analyze_query_group(compiled, group, user_id), groups, ANALYZE_BATCH_CONCURRENCY
+            )
+            report_progress("llm_done")
+            for group, group_result in zip(groups, group_answers):
+                if isinstance(group_result, SchedulerOverloaded):
+                    raise group_result
+                if isinstance(group_result, BaseException):
+                    logging.error(f"Batch analysis group failed: {str(group_result)}")
+                    group_result = [None] * len(group)
+                for query, answer in zip(group, group_result):
+                    if not answer:
+                        failed.add(normalize_query(query))
+                    answers[normalize_query(query)] = analysis_from_answer(answer, query, user_id) if answer else AnalysisResult(
+                        user_id=user_id,
+                        query=query,
+                        analysis_type="text",
+                        result="This item could not be analyzed as part of the list. Please analyze it on its own.",
+                        is_safe=False,
+                        warnings=["Please review this item individually"],
+                        alternatives=[]
+                    )
+        
+        # Every analyzed occurrence gets its own history entry; placeholders for failed items don't
+        results = [
+            answers[normalize_query(query)].model_copy(update={"id": str(uuid.uuid4()), "query": query})
+            for query in queries
+        ]
+        await history_writer.add_many("analysis_history", [
+            result.model_dump() for query, result in zip(queries, results) if normalize_query(query) not in failed
+        ])
+        return BatchAnalysisResult(results=results)
+    
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        logging.error(f"Batch analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch analysis failed: {str(e)}")
+
+async def history_page_response(collection, user_id: str, response: Response, before, limit, fields):
+    """A page of history; the cursor for the next one goes in X-Next-Cursor"""
+    # Read-your-writes: anything still queued for this collection goes first
+    await history_writer.flush(collection.name)
+    docs, next_cursor = await fetch_history_page(collection, user_id, before, limit, fields)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if fields == 'summary':
+        # Summary rows don't fit the full response model
+        return JSONResponse(content=docs, headers=headers)
+    response.headers.update(headers)
+    return docs
+
+# Activity feed: the four histories merged into one timeline of summary rows
+@api_router.get("/activity")
+async def get_activity(
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+    user_id: str = Depends(get_current_user)
+):
+    await history_writer.flush()
+    docs, next_cursor = await fetch_activity_page(db, user_id, before, limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(content=docs, headers=headers)
+
 # History endpoint
 @api_router.get("/history", response_model=List[AnalysisResult])
-async def get_history(user_id: str = Depends(get_current_user)):
-    history = await db.analysis_history.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(20).to_list(20)
-    return history
+async def get_history(
+    response: Response,
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    return await history_page_response(db.analysis_history, user_id, response, before, limit, fields)
 
 # Clear history endpoint
 @api_router.delete("/history")
 async def clear_history(user_id: str = Depends(get_current_user)):
+    # Queued entries would otherwise land after the delete
+    await history_writer.flush("analysis_history")
     result = await db.analysis_history.delete_many({"user_id": user_id})
     return {"message": f"Cleared {result.deleted_count} history items", "deleted_count": result.deleted_count}
 
 # Image Analysis endpoint - Updated for all product types
 @api_router.post("/analyze-image", response_model=ImageAnalysisResult)
 async def analyze_image(
+    http_request: Request,
     file: UploadFile = File(...),
     user_id: str = Depends(get_current_user)
 ):
+    # Read the upload now: the form file is closed once this handler returns
+    image_bytes, image_type = await read_image_upload(file)
+    if wants_event_stream(http_request):
+        return event_stream_response(lambda: run_analyze_image(image_bytes, image_type, user_id))
+    return await run_analyze_image(image_bytes, image_type, user_id)
+
+async def run_analyze_image(image_bytes: bytes, image_type: str, user_id: str) -> ImageAnalysisResult:
     # Get user's allergy profile
-    profile = await db.allergy_profiles.find_one({"user_id": user_id})
-    if not profile:
-        raise HTTPException(status_code=400, detail="Please set up your allergy profile first")
+    profile = await load_allergy_profile(user_id)
     
-    allergies = profile.get('allergies', [])
-    dietary_restrictions = profile.get('dietary_restrictions', [])
-    religion_restrictions = profile.get('religion_restrictions', [])
-    skin_sensitivities = profile.get('skin_sensitivities', [])
+    # Matcher and prompt header, shared by every user with the same profile
+    compiled = compiled_profiles.get(profile)
     
     try:
-        # Read image file
-        image_bytes = await file.read()
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        report_progress("upload_received", bytes=len(image_bytes))
+        # Downscaled, re-encoded copy for the model
+        upload_bytes, upload_type = await image_preprocessor.prepare(image_bytes, image_type, label=True)
+        image_base64 = base64.b64encode(upload_bytes).decode('utf-8')
+        upload_stats.record_peak(len(image_bytes) + len(upload_bytes) + len(image_base64))
+        report_progress("image_prepared", bytes=len(upload_bytes))
+        
+        # Has (nearly) this label been read before? Only the very same photo skips reading it
+        label_hash = None
+        known_label = label_index.find_same_photo(image_bytes)
+        same_photo = known_label is not None
+        if not same_photo:
+            label_hash = await label_index.hash_image(upload_bytes)
+            known_label = label_index.lookup(label_hash)
+        known_matches = None
+        if known_label:
+            report_progress("label_match", distance=known_label.distance, same_photo=same_photo)
+        if same_photo:
+            known_ingredients = ", ".join(known_label.ingredients)
+            known_matches = compiled.matcher.definitive_unsafe(known_ingredients)
         
         # Create AI prompt for all product types
         system_message = f"""You are an expert product label analyzer for ALL types of products including food, skincare, cosmetics, fragrances, and personal care products.
 
-User's allergies: {', '.join(allergies) if allergies else 'None'}
-Dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
-Religion restrictions: {', '.join(religion_restrictions) if religion_restrictions else 'None'}
-Skin sensitivities: {', '.join(skin_sensitivities) if skin_sensitivities else 'None'}
+{compiled.prompt_header}
 
 Your task:
 1. Identify the product type (food, skincare, cosmetic, perfume, cologne, fragrance, etc.)
@@ -566,49 +913,106 @@ Respond in JSON format:
 
 CRITICAL: If the product is unsafe (is_safe = false or safety_rating < 75), you MUST provide 3-5 specific safe alternative products in the "alternatives" array. These should be real product names or categories that are safe for the user's allergies."""
         
-        user_message = "Analyze this product label image. Identify the product type, extract all ingredients, and identify any allergens or irritants based on the user's profile."
-        
-        # Initialize Gemini chat with vision using FileContent - Using your free Google API key
-        chat = LlmChat(
-            api_key=os.environ.get('GOOGLE_API_KEY', os.environ['EMERGENT_LLM_KEY']),
-            session_id=f"image_analysis_{user_id}_{uuid.uuid4()}",
-            system_message=system_message
-        ).with_model("gemini", "gemini-2.0-flash-exp")
-        
-        # Create FileContent for the image
-        file_content = FileContent(
-            content_type="image/jpeg",
-            file_content_base64=image_base64
-        )
-        
-        message = UserMessage(
-            text=user_message,
-            file_contents=[file_content]
-        )
-        ai_response = await chat.send_message(message)
-        
-        # Parse AI response
-        import json
-        response_text = ai_response
-        if '```json' in response_text:
-            response_text = response_text.split('```json')[1].split('```')[0].strip()
-        elif '```' in response_text:
-            response_text = response_text.split('```')[1].split('```')[0].strip()
-        
-        try:
-            parsed = json.loads(response_text)
-        except:
+        if known_matches:
+            # The earlier ingredients already rule this product out
+            MATCHER_STATS["local_verdicts"] += 1
+            warnings, alternatives = describe_matches(known_matches, known_ingredients)
+            found = ", ".join(known_ingredients[m.start:m.end] for m in known_matches)
             parsed = {
-                "product_name": "Unknown Product",
-                "ingredients": [],
-                "detected_allergens": [],
+                "product_name": known_label.product_name,
+                "ingredients": known_label.ingredients,
+                "detected_allergens": list(dict.fromkeys(m.category for m in known_matches)),
                 "is_safe": False,
                 "safety_rating": 0,
-                "warnings": ["Unable to parse label completely. Please review manually."],
-                "alternatives": [],
-                "detailed_analysis": response_text
+                "warnings": warnings,
+                "alternatives": alternatives,
+                "detailed_analysis": f"This photo was analyzed before. The product's ingredients contain {found}, which your profile excludes."
             }
+        else:
+            if same_photo:
+                # Same photo read before: reuse its extraction, redo only the verdict (text-only call)
+                label_index.record_reuse()
+                user_message = f"""The label of this product has already been read.
+
+Product name: {known_label.product_name or 'Unknown'}
+Ingredients: {known_ingredients}
+
+Evaluate these ingredients against the user's profile. Keep the product name and ingredients exactly as given and respond in the JSON format specified."""
+                message = UserMessage(text=user_message)
+                flight_key = llm_cache.make_key(
+                    "analyze-label", compiled.fingerprint, f"{known_label.product_name}\n{known_ingredients}", LLM_MODEL
+                )
+            else:
+                user_message = "Analyze this product label image. Identify the product type, extract all ingredients, and identify any allergens or irritants based on the user's profile."
+        
+                # Create FileContent for the image
+                file_content = FileContent(
+                    content_type=upload_type,
+                    file_content_base64=image_base64
+                )
+        
+                message = UserMessage(
+                    text=user_message,
+                    file_contents=[file_content]
+                )
+        
+                # Double-taps and identical photos against the same profile share one Gemini call
+                flight_key = llm_cache.make_key(
+                    "analyze-image", compiled.fingerprint, hashlib.sha256(image_bytes).hexdigest(), LLM_MODEL
+                )
+            report_progress("llm_started")
+            ai_response = await llm_flights.do(
+                flight_key,
+                lambda: send_llm_message("image", "image_analysis", user_id, system_message, message)
+            )
+            report_progress("llm_done")
+            
+            # Parse AI response
+            import json
+            response_text = ai_response
+            if '```json' in response_text:
+                response_text = response_text.split('```json')[1].split('```')[0].strip()
+            elif '```' in response_text:
+                response_text = response_text.split('```')[1].split('```')[0].strip()
+            
+            try:
+                parsed = json.loads(response_text)
+            except:
+                parsed = {
+                    "product_name": "Unknown Product",
+                    "ingredients": [],
+                    "detected_allergens": [],
+                    "is_safe": False,
+                    "safety_rating": 0,
+                    "warnings": ["Unable to parse label completely. Please review manually."],
+                    "alternatives": [],
+                    "detailed_analysis": response_text
+                }
         
+            if same_photo:
+                parsed['product_name'] = known_label.product_name
+                parsed['ingredients'] = known_label.ingredients
+            else:
+                if known_label:
+                    # A near match was read again: did it really show the same ingredients?
+                    label_index.record_near_match(known_label, parsed.get('ingredients') or [])
+                label_index.add(label_hash, image_bytes, parsed.get('product_name', ''), parsed.get('ingredients') or [])
+
+        # Safety net: never report "safe" for a label whose ingredients hit the profile
+        ingredients_text = ", ".join(str(item) for item in parsed.get('ingredients') or [])
+        matches = compiled.matcher.definitive_unsafe(ingredients_text)
+        if matches and parsed.get('is_safe'):
+            MATCHER_STATS["llm_overrides"] += 1
+            warnings, alternatives = describe_matches(matches, ingredients_text)
+            parsed['is_safe'] = False
+            parsed['safety_rating'] = min(parsed.get('safety_rating', 0), 24)
+            parsed['warnings'] = warnings + list(parsed.get('warnings') or [])
+            parsed['detected_allergens'] = list(dict.fromkeys(
+                list(parsed.get('detected_allergens') or []) + [m.category for m in matches]
+            ))
+            if not parsed.get('alternatives'):
+                parsed['alternatives'] = alternatives
+
         result = ImageAnalysisResult(
             user_id=user_id,
             product_name=parsed.get('product_name', ''),
@@ -622,10 +1026,12 @@ CRITICAL: If the product is unsafe (is_safe = false or safety_rating < 75), you
         )
         
         # Save to history
-        await db.image_analysis_history.insert_one(result.model_dump())
+        await history_writer.add("image_analysis_history", result.model_dump())
         
         return result
     
+    except SchedulerOverloaded:
+        raise
     except Exception as e:
         error_msg = str(e)
         logging.error(f"Image analysis error: {error_msg}")
@@ -641,212 +1047,183 @@ CRITICAL: If the product is unsafe (is_safe = false or safety_rating < 75), you
 
 # Image History endpoint
 @api_router.get("/image-history", response_model=List[ImageAnalysisResult])
-async def get_image_history(user_id: str = Depends(get_current_user)):
-    history = await db.image_analysis_history.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(20).to_list(20)
-    return history
+async def get_image_history(
+    response: Response,
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    return await history_page_response(db.image_analysis_history, user_id, response, before, limit, fields)
 
 # Clear image history endpoint
 @api_router.delete("/image-history")
 async def clear_image_history(user_id: str = Depends(get_current_user)):
+    # Queued entries would otherwise land after the delete
+    await history_writer.flush("image_analysis_history")
     result = await db.image_analysis_history.delete_many({"user_id": user_id})
     return {"message": f"Cleared {result.deleted_count} image history items", "deleted_count": result.deleted_count}
 
+# Crawled menu text is read in up to MENU_MAX_CHUNKS parallel chunks
+MENU_CONTENT_LIMIT = MENU_CHUNK_CHARS * MENU_MAX_CHUNKS
+
+def successful_chunks(results: list, what: str) -> list:
+    """Results of gather_bounded minus failed items; fails only if every item failed"""
+    succeeded = []
+    errors = []
+    for result in results:
+        if isinstance(result, BaseException):
+            if isinstance(result, SchedulerOverloaded):
+                raise result
+            logging.error(f"{what} failed: {str(result)}")
+            errors.append(result)
+        else:
+            succeeded.append(result)
+    if errors and not succeeded:
+        raise errors[0]
+    return succeeded
+
 # Menu URL Analysis endpoint
 @api_router.post("/analyze-menu-url", response_model=MenuAnalysisResult)
 async def analyze_menu_url(
     request: MenuURLRequest,
+    http_request: Request,
     user_id: str = Depends(get_current_user)
 ):
-    # Get user's allergy profile
-    profile = await db.allergy_profiles.find_one({"user_id": user_id})
-    if not profile:
-        raise HTTPException(status_code=400, detail="Please set up your allergy profile first")
+    if wants_event_stream(http_request):
+        return event_stream_response(lambda: run_analyze_menu_url(request, user_id))
+    return await run_analyze_menu_url(request, user_id)
+
+def recheck_safe_dishes(matcher: ProfileMatcher, parsed: dict):
+    """Move "safe" dishes whose name/description hit the profile into unsafe_dishes"""
+    still_safe = []
+    unsafe = list(parsed.get('unsafe_dishes') or [])
+    for dish in parsed.get('safe_dishes') or []:
+        text = f"{dish.get('name', '')}. {dish.get('description') or ''}"
+        matches = matcher.definitive_unsafe(text)
+        if not matches:
+            still_safe.append(dish)
+            continue
+        MATCHER_STATS["llm_overrides"] += 1
+        warnings, _ = describe_matches(matches, text)
+        unsafe.append({
+            **dish,
+            "is_safe": False,
+            "allergens": list(dict.fromkeys(list(dish.get('allergens') or []) + [m.category for m in matches])),
+            "warnings": warnings + list(dish.get('warnings') or []),
+        })
+    parsed['safe_dishes'] = still_safe
+    parsed['unsafe_dishes'] = unsafe
+
+async def build_menu_index(base_url: str, user_id: str, previous: Optional[dict] = None) -> dict:
+    """Crawl a restaurant's menu and extract its dishes (profile-independent).
+
+    Blocks (menu sections) whose text is unchanged since the previous
+    snapshot keep their dishes; only new or changed blocks are packed into
+    chunks and sent to the LLM.
+    """
+    async def fetch_menu_page(url, is_main_page=False):
+        """Fetch one page and return (menu text pieces, menu links to follow)"""
+        async def parse_menu_page(response):
+            # File formats and HTML are parsed in the document worker pool
+            content_type = response.headers.get('content-type', '').lower()
+            return await doc_workers.run(
+                extract_menu_page, response.content, response.encoding,
+                content_type, url, base_url, is_main_page, MENU_CONTENT_LIMIT
+            )
+        
+        page = await page_cache.fetch(
+            http_pools.get("menu"), url, "menu-main" if is_main_page else "menu", parse_menu_page
+        )
+        if page is None:
+            return [], []
+        report_progress("fetch_done", url=url, sections=len(page[0]))
+        return page
     
-    allergies = profile.get('allergies', [])
-    dietary_restrictions = profile.get('dietary_restrictions', [])
-    religion_restrictions = profile.get('religion_restrictions', [])
+    # Crawl the main URL, then up to 5 menu links concurrently
+    crawler = MenuCrawler(
+        fetch_menu_page,
+        is_enough=lambda pieces: len(filter_menu_content(pieces)) >= MENU_CONTENT_LIMIT
+    )
+    all_menu_content = await crawler.crawl(base_url)
     
-    try:
-        from bs4 import BeautifulSoup
-        from urllib.parse import urljoin, urlparse
-        import io
-        from PyPDF2 import PdfReader
-        from docx import Document
-        import openpyxl
-        
-        all_menu_content = []
-        visited_urls = set()
-        base_url = request.url
-        
-        async def extract_content_from_file(content, content_type, filename=""):
-            """Extract text from various file formats"""
-            try:
-                # PDF files
-                if 'pdf' in content_type.lower() or filename.endswith('.pdf'):
-                    pdf_reader = PdfReader(io.BytesIO(content))
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-                    return text
-                
-                # Word documents
-                elif 'word' in content_type.lower() or filename.endswith(('.doc', '.docx')):
-                    doc = Document(io.BytesIO(content))
-                    text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                    return text
-                
-                # Excel files
-                elif 'excel' in content_type.lower() or 'spreadsheet' in content_type.lower() or filename.endswith(('.xls', '.xlsx')):
-                    wb = openpyxl.load_workbook(io.BytesIO(content))
-                    text = ""
-                    for sheet in wb.worksheets:
-                        for row in sheet.iter_rows(values_only=True):
-                            row_text = " | ".join([str(cell) if cell else "" for cell in row])
-                            if row_text.strip():
-                                text += row_text + "\n"
-                    return text
-                
-                # JSON files
-                elif 'json' in content_type.lower() or filename.endswith('.json'):
-                    import json
-                    data = json.loads(content.decode('utf-8'))
-                    return json.dumps(data, indent=2)
-                
-                # CSV files
-                elif 'csv' in content_type.lower() or filename.endswith('.csv'):
-                    import csv
-                    text = ""
-                    csv_file = io.StringIO(content.decode('utf-8'))
-                    reader = csv.reader(csv_file)
-                    for row in reader:
-                        text += " | ".join(row) + "\n"
-                    return text
-                
-                # Plain text
-                elif 'text' in content_type.lower() or filename.endswith('.txt'):
-                    return content.decode('utf-8')
-                
-                # HTML (existing logic)
-                elif 'html' in content_type.lower():
-                    return None  # Will be handled by existing HTML logic
-                
-                # Try to decode as text for unknown formats
-                else:
-                    try:
-                        return content.decode('utf-8')
-                    except:
-                        return None
-                        
-            except Exception as e:
-                logging.error(f"Error extracting content from {content_type}: {str(e)}")
-                return None
-        
-        async def fetch_and_extract(url, is_main_page=False):
-            if url in visited_urls or len(visited_urls) > 10:
-                return
-            
-            visited_urls.add(url)
-            
-            try:
-                async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-                    response = await client.get(url)
-                    if response.status_code != 200:
-                        return
-                    
-                    content_type = response.headers.get('content-type', '').lower()
-                    
-                    # Try to extract from file formats first
-                    extracted_text = await extract_content_from_file(response.content, content_type, url)
-                    
-                    if extracted_text:
-                        all_menu_content.append(extracted_text)
-                        return
-                    
-                    # If not a file format or extraction failed, treat as HTML
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    
-                    # Remove unwanted elements
-                    for element in soup(["script", "style", "nav", "header", "footer", "iframe", "noscript"]):
-                        element.decompose()
-                    
-                    # Extract menu content
-                    menu_sections = soup.find_all(['main', 'article', 'section', 'div'], class_=lambda x: x and any(
-                        keyword in str(x).lower() for keyword in ['menu', 'food', 'dish', 'item', 'product', 'category']
-                    ))
-                    
-                    if menu_sections:
-                        for section in menu_sections:
-                            text = section.get_text()
-                            lines = (line.strip() for line in text.splitlines())
-                            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                            clean_text = '\n'.join(chunk for chunk in chunks if chunk and len(chunk) > 10)
-                            if clean_text:
-                                all_menu_content.append(clean_text)
-                    
-                    # If this is the main page, find menu-related links to explore
-                    if is_main_page and len(visited_urls) < 10:
-                        menu_links = []
-                        for link in soup.find_all('a', href=True):
-                            href = link.get('href')
-                            link_text = link.get_text().lower()
-                            
-                            # Check if link is menu-related
-                            menu_keywords = ['menu', 'food', 'dish', 'category', 'breakfast', 'lunch', 'dinner', 
-                                           'drink', 'beverage', 'appetizer', 'entree', 'dessert', 'sandwich', 'salad']
-                            
-                            if any(keyword in link_text or keyword in href.lower() for keyword in menu_keywords):
-                                full_url = urljoin(base_url, href)
-                                # Only follow links from the same domain
-                                if urlparse(full_url).netloc == urlparse(base_url).netloc:
-                                    menu_links.append(full_url)
-                        
-                        # Follow up to 5 menu links
-                        for menu_link in menu_links[:5]:
-                            await fetch_and_extract(menu_link, is_main_page=False)
-                            
-            except Exception as e:
-                logging.error(f"Error fetching {url}: {str(e)}")
-        
-        # Start with the main URL
-        await fetch_and_extract(base_url, is_main_page=True)
-        
-        # Combine all menu content
-        combined_menu = '\n\n=== MENU SECTION ===\n\n'.join(all_menu_content)
-        
-        # Filter out promotional content
-        filtered_lines = []
-        skip_phrases = ['sign in', 'account', 'rewards', 'join', 'login', 'register', 'newsletter', 'subscribe', 'cart', 'checkout']
-        for line in combined_menu.split('\n'):
-            if len(line) > 10 and not any(phrase in line.lower() for phrase in skip_phrases):
-                filtered_lines.append(line)
-        
-        menu_content = '\n'.join(filtered_lines)[:20000]  # Increased limit for more content
-        
-        if not menu_content or len(menu_content) < 100:
-            raise HTTPException(status_code=400, detail="Could not extract menu content from the website")
-        
-        # Create AI prompt
-        system_message = f"""You are an expert restaurant menu analyzer. You've explored the entire menu across multiple pages.
+    menu_content = filter_menu_content(all_menu_content)
+    truncated = len(menu_content) > MENU_CONTENT_LIMIT
+    menu_content = menu_content[:MENU_CONTENT_LIMIT]
+    report_progress("extraction_done", characters=len(menu_content))
+    
+    if not menu_content or len(menu_content) < 100:
+        raise HTTPException(status_code=400, detail="Could not extract menu content from the website")
+    
+    async def extract_chunk(chunk_blocks):
+        chunk = '\n'.join(text for _, text in chunk_blocks)
+        user_message = f"""Here is part of the menu content crawled from this restaurant's website:
 
-User's allergies: {', '.join(allergies) if allergies else 'None'}
-Dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
-Religion restrictions: {', '.join(religion_restrictions) if religion_restrictions else 'None'}
+{chunk}
 
-Your task:
-1. Review ALL menu items from all sections (appetizers, entrees, desserts, drinks, etc.)
-2. Identify the BEST and SAFEST options for this user across the entire menu
-3. Focus on dishes that are completely safe based on listed ingredients
-4. For potentially unsafe dishes, suggest modifications to make them safe
-5. Provide a curated list of recommended items, not everything on the menu
+Extract every dish and drink in the JSON format specified."""
+        ai_response = await send_llm_message(
+            "menu_url", "menu_index", user_id, DISH_EXTRACTION_PROMPT, UserMessage(text=user_message)
+        )
+        parsed = parse_llm_json(ai_response) or {}
+        return parsed, assign_dishes(chunk_blocks, parsed.get('dishes'))
+    
+    texts = menu_blocks(menu_content)
+    groups = pack_blocks(texts)
+    truncated = truncated or len(groups) > MENU_MAX_CHUNKS
+    blocks = [(block_digest(texts[index]), texts[index]) for group in groups[:MENU_MAX_CHUNKS] for index in group]
+    reused, changed = menu_index.diff_blocks(previous, blocks)
+    chunks = [[changed[index] for index in group] for group in pack_blocks([text for _, text in changed])]
+    report_progress("menu_diff", blocks=len(blocks), changed=len(changed), chunks=len(chunks))
+    
+    # Map: chunks of changed blocks are read concurrently; reduce: dishes merged by name
+    extractions = []
+    if chunks:
+        report_progress("llm_started", chunks=len(chunks))
+        extractions = successful_chunks(await gather_bounded(extract_chunk, chunks), "Menu chunk extraction")
+        report_progress("llm_done")
+    
+    block_dishes = dict(reused)
+    for _, assigned in extractions:
+        block_dishes.update(assigned)
+    dishes = normalize_dishes([dish for block_hash, _ in blocks for dish in block_dishes.get(block_hash, [])])
+    if not dishes:
+        # Nothing worth sharing; the next request tries again
+        return {"restaurant_name": "", "dishes": [], "content_hash": ""}
+    restaurant_name = next(
+        (parsed['restaurant_name'] for parsed, _ in extractions if parsed.get('restaurant_name')),
+        (previous or {}).get('restaurant_name', '')
+    )
+    # Blocks of a failed chunk aren't in the snapshot; a partial index is only served
+    # briefly, so the next build after that reads them again
+    partial = len(extractions) < len(chunks)
+    entry = await menu_index.save(
+        base_url, restaurant_name, dishes, partial=partial, truncated=truncated,
+        blocks=[snapshot_block(block_hash, found) for block_hash, found in block_dishes.items()]
+    )
+    report_progress("menu_index_built", dishes=len(dishes), partial=partial, truncated=truncated)
+    return entry
+
+async def evaluate_menu_dishes(compiled, dishes: List[dict], known_unsafe: Dict[str, List[str]], user_id: str) -> dict:
+    """Ask the LLM about dishes for this profile; returns the parsed answer
+
+    known_unsafe maps dish keys the local matcher already excluded to their
+    allergens: those only need modifications.
+    """
+    system_message = f"""You are an expert restaurant menu analyzer.
+
+{compiled.menu_prompt_header}
+
+You will get a restaurant's dishes with their known ingredients. Your task:
+1. Decide for each dish whether it is safe for this user
+2. For potentially unsafe dishes, suggest modifications to make them safe
+3. Dishes marked "KNOWN UNSAFE" contain the listed allergens: always put them in unsafe_dishes, with modifications
+4. Use the dish names exactly as given
 
-IMPORTANT: Focus on actual ingredients in menu descriptions. Do NOT be overly concerned with cross-contamination as this is typically unavoidable in restaurant kitchens. Only mention if absolutely critical for severe allergies.
+IMPORTANT: Focus on actual ingredients. Do NOT be overly concerned with cross-contamination as this is typically unavoidable in restaurant kitchens. Only mention if absolutely critical for severe allergies.
 
 Respond in JSON format:
 {{
-  "restaurant_name": "Restaurant name or empty",
   "safe_dishes": [
     {{
       "name": "Dish name",
@@ -859,7 +1236,7 @@ Respond in JSON format:
   ],
   "unsafe_dishes": [
     {{
-      "name": "Dish name (only include if popular/notable)",
+      "name": "Dish name",
       "description": "Description",
       "is_safe": false,
       "allergens": ["allergen1"],
@@ -867,52 +1244,117 @@ Respond in JSON format:
       "modifications": ["Order without X", "Ask for Y on the side"]
     }}
   ],
-  "summary": "Summary of the best options found across the entire menu for this user's dietary needs"
+  "summary": "Summary of the best options on this menu for this user's dietary needs"
 }}"""
-        
-        user_message = f"""I've crawled this restaurant's website and found menu content from multiple pages:
+    
+    def known(dish):
+        allergens = known_unsafe.get(dish_key(dish['name']))
+        return f" KNOWN UNSAFE: {', '.join(allergens)}" if allergens else ''
 
-{menu_content}
+    dish_lines = '\n'.join(
+        f"- {dish_text(dish)}" + (f" [{dish['section']}]" if dish['section'] else '') + known(dish)
+        for dish in dishes
+    )
+    user_message = f"""Dishes on this menu:
 
-Based on ALL the menu items above, identify the BEST options for this user. Focus on:
-- Completely safe dishes (top priority)
-- Popular items that can be modified to be safe
-- Best drinks and beverages that fit their needs
-- Any standout options across all categories
+{dish_lines}
 
 Provide your analysis in the JSON format specified."""
+    
+    # Same profile + same dishes => same answer, whichever user asks
+    cache_key = llm_cache.make_key(
+        "menu-eval", compiled.fingerprint, '\n'.join(dish['hash'] + known(dish) for dish in dishes), LLM_MODEL
+    )
+    ai_response = await llm_cache.get(cache_key)
+    if ai_response is not None:
+        report_progress("llm_cache_hit")
+        return parse_llm_json(ai_response) or {}
+    
+    report_progress("llm_started")
+    llm_started = time.perf_counter()
+    ai_response = await llm_flights.do(
+        cache_key,
+        lambda: send_llm_message("menu_url", "menu_url", user_id, system_message, UserMessage(text=user_message))
+    )
+    llm_latency = time.perf_counter() - llm_started
+    report_progress("llm_done", seconds=round(llm_latency, 3))
+    
+    parsed = parse_llm_json(ai_response)
+    if parsed is None:
+        return {}
+    await llm_cache.set(cache_key, ai_response, llm_latency)
+    return parsed
+
+async def run_analyze_menu_url(request: MenuURLRequest, user_id: str) -> MenuAnalysisResult:
+    # Get user's allergy profile
+    profile = await load_allergy_profile(user_id)
+    
+    # Matcher and prompt header, shared by every user with the same profile
+    compiled = compiled_profiles.get(profile)
+    
+    try:
+        # Phase 1: the restaurant's dish index, shared by every user
+        entry = await menu_index.load(request.url)
+        if menu_index.is_fresh(entry):
+            menu_index.record_fresh_hit()
+            report_progress("menu_index_hit", dishes=len(entry["dishes"]))
+        else:
+            # Concurrent scans of the same restaurant rebuild it once, diffed against the old snapshot
+            previous = entry
+            entry = await llm_flights.do(
+                "menu-index:" + normalize_url(request.url),
+                lambda: build_menu_index(request.url, user_id, previous)
+            )
+        dishes = entry["dishes"]
         
-        # Initialize Gemini chat - Using your free Google API key
-        chat = LlmChat(
-            api_key=os.environ.get('GOOGLE_API_KEY', os.environ['EMERGENT_LLM_KEY']),
-            session_id=f"menu_url_{user_id}_{uuid.uuid4()}",
-            system_message=system_message
-        ).with_model("gemini", "gemini-2.0-flash-exp")
-        
-        message = UserMessage(text=user_message)
-        ai_response = await chat.send_message(message)
-        
-        # Parse AI response
-        import json
-        response_text = ai_response
-        if '```json' in response_text:
-            response_text = response_text.split('```json')[1].split('```')[0].strip()
-        elif '```' in response_text:
-            response_text = response_text.split('```')[1].split('```')[0].strip()
-        
-        try:
-            parsed = json.loads(response_text)
-        except:
+        # Phase 2: this profile against the index
+        unsafe_dishes, undecided = split_by_profile(compiled.matcher, dishes)
+        report_progress("local_match", unsafe=len(unsafe_dishes), undecided=len(undecided))
+        if not dishes:
             parsed = {
-                "restaurant_name": "",
                 "safe_dishes": [],
                 "unsafe_dishes": [],
                 "summary": "Unable to parse menu. Please try a different URL or upload a photo."
             }
+        else:
+            # Locally excluded dishes still go to the evaluation, for their modifications
+            known_unsafe = {dish_key(dish['name']): dish['allergens'] for dish in unsafe_dishes}
+            # Unchanged dishes keep the verdicts of this user's last scan with the same profile:
+            # kept in memory, else whatever history has written so far (no flush on the request path)
+            last_scan = menu_index.last_verdicts(user_id, request.url, compiled.fingerprint)
+            if last_scan is None:
+                last_scan = await db.menu_analysis_history.find_one(
+                    {"user_id": user_id, "source": "url", "source_data": request.url,
+                     "profile_fingerprint": compiled.fingerprint},
+                    {"_id": 0, "safe_dishes": 1, "unsafe_dishes": 1, "summary": 1, "dish_hashes": 1},
+                    sort=HISTORY_SORT
+                )
+            evaluations, to_evaluate = reuse_menu_verdicts(last_scan, dishes)
+            report_progress("menu_verdicts_reused", dishes=len(dishes) - len(to_evaluate))
+            # Large menus are evaluated in concurrent batches and merged
+            if to_evaluate:
+                evaluations += successful_chunks(await gather_bounded(
+                    lambda batch: evaluate_menu_dishes(compiled, batch, known_unsafe, user_id),
+                    batched(to_evaluate, MENU_EVAL_BATCH)
+                ), "Menu evaluation batch")
+            parsed = merge_menu_verdicts(evaluations, unsafe_dishes)
         
+        recheck_safe_dishes(compiled.matcher, parsed)
+        if not parsed.get('summary'):
+            parsed['summary'] = (
+                f"{len(parsed['safe_dishes'])} of {len(dishes)} dishes on this menu fit your profile."
+            )
+        # Say so when dishes of this menu were never read
+        if entry.get('truncated'):
+            parsed['summary'] += (
+                f" This menu is longer than we can read at once: only its first {len(dishes)} dishes were checked."
+            )
+        if entry.get('partial'):
+            parsed['summary'] += " Part of this menu could not be read; scan it again in a few minutes for the rest."
+
         result = MenuAnalysisResult(
             user_id=user_id,
-            restaurant_name=parsed.get('restaurant_name', ''),
+            restaurant_name=entry.get('restaurant_name', ''),
             source='url',
             source_data=request.url,
             safe_dishes=[MenuDish(**dish) for dish in parsed.get('safe_dishes', [])],
@@ -920,11 +1362,27 @@ Provide your analysis in the JSON format specified."""
             summary=parsed.get('summary', '')
         )
         
-        # Save to history
-        await db.menu_analysis_history.insert_one(result.model_dump())
+        # Save to history, with what the next scan needs to skip unchanged dishes
+        dish_hashes = verdict_hashes(dishes, parsed)
+        if dishes:
+            menu_index.remember_verdicts(user_id, request.url, compiled.fingerprint, {
+                "safe_dishes": parsed['safe_dishes'],
+                "unsafe_dishes": parsed['unsafe_dishes'],
+                "summary": parsed['summary'],
+                "dish_hashes": dish_hashes,
+            })
+        await history_writer.add("menu_analysis_history", {
+            **result.model_dump(),
+            "profile_fingerprint": compiled.fingerprint,
+            "dish_hashes": dish_hashes,
+        })
         
         return result
     
+    except SchedulerOverloaded:
+        raise
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logging.error(f"Menu URL fetch error: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Unable to fetch menu: {str(e)}")
@@ -939,25 +1397,23 @@ async def analyze_menu_photo(
     user_id: str = Depends(get_current_user)
 ):
     # Get user's allergy profile
-    profile = await db.allergy_profiles.find_one({"user_id": user_id})
-    if not profile:
-        raise HTTPException(status_code=400, detail="Please set up your allergy profile first")
+    profile = await load_allergy_profile(user_id)
+    
+    # Matcher and prompt header, shared by every user with the same profile
+    compiled = compiled_profiles.get(profile)
     
-    allergies = profile.get('allergies', [])
-    dietary_restrictions = profile.get('dietary_restrictions', [])
-    religion_restrictions = profile.get('religion_restrictions', [])
+    # Read the upload (size-capped) before the try so 413/415 pass through
+    image_bytes, image_type = await read_image_upload(file)
     
     try:
-        # Read image file
-        image_bytes = await file.read()
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        upload_bytes, upload_type = await image_preprocessor.prepare(image_bytes, image_type)
+        image_base64 = base64.b64encode(upload_bytes).decode('utf-8')
+        upload_stats.record_peak(len(image_bytes) + len(upload_bytes) + len(image_base64))
         
         # Create AI prompt
         system_message = f"""You are an expert restaurant menu analyzer. Analyze menu items for allergen safety.
 
-User's allergies: {', '.join(allergies) if allergies else 'None'}
-Dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
-Religion restrictions: {', '.join(religion_restrictions) if religion_restrictions else 'None'}
+{compiled.menu_prompt_header}
 
 Your task:
 1. Read all text from the menu photo
@@ -995,16 +1451,9 @@ Respond in JSON format:
         
         user_message = "Analyze this restaurant menu photo. Extract all menu items and provide allergen safety analysis."
         
-        # Initialize Gemini chat - Using your free Google API key
-        chat = LlmChat(
-            api_key=os.environ.get('GOOGLE_API_KEY', os.environ['EMERGENT_LLM_KEY']),
-            session_id=f"menu_photo_{user_id}_{uuid.uuid4()}",
-            system_message=system_message
-        ).with_model("gemini", "gemini-2.0-flash-exp")
-        
         # Create FileContent for the image
         file_content = FileContent(
-            content_type="image/jpeg",
+            content_type=upload_type,
             file_content_base64=image_base64
         )
         
@@ -1012,7 +1461,7 @@ Respond in JSON format:
             text=user_message,
             file_contents=[file_content]
         )
-        ai_response = await chat.send_message(message)
+        ai_response = await send_llm_message("menu_photo", "menu_photo", user_id, system_message, message)
         
         # Parse AI response
         import json
@@ -1043,26 +1492,32 @@ Respond in JSON format:
         )
         
         # Save to history
-        await db.menu_analysis_history.insert_one(result.model_dump())
+        await history_writer.add("menu_analysis_history", result.model_dump())
         
         return result
     
+    except SchedulerOverloaded:
+        raise
     except Exception as e:
         logging.error(f"Menu photo analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Menu analysis failed: {str(e)}")
 
 # Menu History endpoint
 @api_router.get("/menu-history", response_model=List[MenuAnalysisResult])
-async def get_menu_history(user_id: str = Depends(get_current_user)):
-    history = await db.menu_analysis_history.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(20).to_list(20)
-    return history
+async def get_menu_history(
+    response: Response,
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    return await history_page_response(db.menu_analysis_history, user_id, response, before, limit, fields)
 
 # Clear menu history endpoint
 @api_router.delete("/menu-history")
 async def clear_menu_history(user_id: str = Depends(get_current_user)):
+    # Queued entries would otherwise land after the delete
+    await history_writer.flush("menu_analysis_history")
     result = await db.menu_analysis_history.delete_many({"user_id": user_id})
     return {"message": f"Cleared {result.deleted_count} menu history items", "deleted_count": result.deleted_count}
 
@@ -1070,26 +1525,19 @@ async def clear_menu_history(user_id: str = Depends(get_current_user)):
 @api_router.post("/recipe-finder", response_model=RecipeFinderResult)
 async def find_recipes(
     request: RecipeRequest,
+    http_request: Request,
     user_id: str = Depends(get_current_user)
 ):
-    # Get user's allergy profile
-    profile = await db.allergy_profiles.find_one({"user_id": user_id})
-    if not profile:
-        raise HTTPException(status_code=400, detail="Please set up your allergy profile first")
-    
-    allergies = profile.get('allergies', [])
-    dietary_restrictions = profile.get('dietary_restrictions', [])
-    religion_restrictions = profile.get('religion_restrictions', [])
-    skin_sensitivities = profile.get('skin_sensitivities', [])
-    
-    try:
-        # Create AI prompt for recipe generation
-        system_message = f"""You are an expert chef and nutritionist specializing in allergy-safe cooking. Generate safe, delicious recipes.
+    if wants_event_stream(http_request):
+        return event_stream_response(lambda: run_find_recipes(request, user_id))
+    return await run_find_recipes(request, user_id)
+
+def recipe_prompts(compiled, food_item: str, exclude_recipes: List[str]):
+    """(system message, user message) asking for three recipes not named in exclude_recipes"""
+    # Create AI prompt for recipe generation
+    system_message = f"""You are an expert chef and nutritionist specializing in allergy-safe cooking. Generate safe, delicious recipes.
 
-User's allergies: {', '.join(allergies) if allergies else 'None'}
-Dietary restrictions: {', '.join(dietary_restrictions) if dietary_restrictions else 'None'}
-Religion restrictions: {', '.join(religion_restrictions) if religion_restrictions else 'None'}
-Skin sensitivities (avoid if relevant): {', '.join(skin_sensitivities) if skin_sensitivities else 'None'}
+{compiled.recipe_prompt_header}
 
 Your task:
 1. Generate 2-3 different recipe variations for the requested food item
@@ -1102,10 +1550,10 @@ Your task:
 8. BE CREATIVE AND DIVERSE - think of different cooking styles, cuisines, and variations
 
 Be creative with substitutions and make recipes that are both safe AND delicious. Generate unique variations each time."""
-        
-        user_message = f"""Please create allergy-safe recipes for: {request.food_item}
+    
+    user_message = f"""Please create allergy-safe recipes for: {food_item}
 
-{f"IMPORTANT: Do NOT generate any of these recipes as they were already shown to the user: {', '.join(request.exclude_recipes)}. Create completely NEW and DIFFERENT variations with unique names, ingredients, and cooking methods." if request.exclude_recipes else ""}
+{f"IMPORTANT: Do NOT generate any of these recipes as they were already shown to the user: {', '.join(exclude_recipes)}. Create completely NEW and DIFFERENT variations with unique names, ingredients, and cooking methods." if exclude_recipes else ""}
 
 Think creatively - consider different:
 - Cooking methods (baked, fried, steamed, grilled, etc.)
@@ -1153,69 +1601,117 @@ Provide your response in this JSON format with EXACTLY 3 different recipe variat
   "summary": "Brief summary explaining how these recipes avoid the user's allergens"
 }}
 
-CRITICAL: You MUST provide EXACTLY 3 different recipe variations. All recipes MUST be safe for the user's allergies and restrictions.{f" DO NOT include: {', '.join(request.exclude_recipes)}" if request.exclude_recipes else ""}"""
-        
-        # Initialize Gemini chat
-        chat = LlmChat(
-            api_key=os.environ.get('GOOGLE_API_KEY', os.environ['EMERGENT_LLM_KEY']),
-            session_id=f"recipe_{user_id}_{uuid.uuid4()}",
-            system_message=system_message
-        ).with_model("gemini", "gemini-2.0-flash-exp")
-        
-        message = UserMessage(text=user_message)
-        ai_response = await chat.send_message(message)
-        
-        # Parse AI response
-        import json
-        response_text = ai_response
-        if '```json' in response_text:
-            response_text = response_text.split('```json')[1].split('```')[0].strip()
-        elif '```' in response_text:
-            response_text = response_text.split('```')[1].split('```')[0].strip()
-        
+CRITICAL: You MUST provide EXACTLY 3 different recipe variations. All recipes MUST be safe for the user's allergies and restrictions.{f" DO NOT include: {', '.join(exclude_recipes)}" if exclude_recipes else ""}"""
+    return system_message, user_message
+
+def parse_recipes(ai_response: str):
+    """(valid recipes as dicts, summary) from a recipe-finder answer"""
+    parsed = parse_llm_json(ai_response)
+    if parsed is None:
+        return [], "Failed to parse recipes. Please try again."
+    recipes = []
+    for recipe in parsed.get('recipes') or []:
         try:
-            parsed = json.loads(response_text)
-        except:
-            # Fallback if JSON parsing fails
-            parsed = {
-                "recipes": [],
-                "summary": "Failed to parse recipes. Please try again."
-            }
+            recipes.append(Recipe(**recipe).model_dump())
+        except Exception:
+            continue
+    return recipes, parsed.get('summary', 'Recipes generated based on your allergy profile.')
+
+async def generate_recipes(compiled, food_item: str, exclude_recipes: List[str], user_id: str, priority_class: str):
+    system_message, user_message = recipe_prompts(compiled, food_item, exclude_recipes)
+    ai_response = await send_llm_message(
+        priority_class, "recipe", user_id, system_message, UserMessage(text=user_message)
+    )
+    return parse_recipes(ai_response)
+
+async def run_find_recipes(request: RecipeRequest, user_id: str) -> RecipeFinderResult:
+    # Get user's allergy profile
+    profile = await load_allergy_profile(user_id)
+    
+    # Matcher and prompt header, shared by every user with the same profile
+    compiled = compiled_profiles.get(profile)
+    exclude_recipes = request.exclude_recipes or []
+    
+    try:
+        # Rerolls are served from the pool of recipes generated for this item and profile
+        pool_key = recipe_pool.key(request.food_item, compiled.fingerprint)
+        pooled = recipe_pool.take(pool_key, exclude_recipes)
+        if pooled is not None:
+            report_progress("recipe_pool_hit")
+            recipes, summary = pooled
+        else:
+            # Concurrent identical requests (same item, exclusions and profile) share one Gemini call
+            flight_key = llm_cache.make_key(
+                "recipes",
+                compiled.fingerprint,
+                '\n'.join([request.food_item] + sorted(exclude_recipes)),
+                LLM_MODEL
+            )
+            report_progress("llm_started")
+            recipes, summary = await llm_flights.do(
+                flight_key,
+                lambda: generate_recipes(compiled, request.food_item, exclude_recipes, user_id, "recipe")
+            )
+            report_progress("llm_done")
+            recipe_pool.add(pool_key, recipes, summary)
+        
+        # More variations are generated while the user reads these ones
+        recipe_pool.prefetch(
+            pool_key,
+            lambda avoid: generate_recipes(compiled, request.food_item, avoid, user_id, "recipe_prefetch"),
+            exclude_recipes
+        )
         
         result = RecipeFinderResult(
             user_id=user_id,
             food_item=request.food_item,
-            recipes=[Recipe(**recipe) for recipe in parsed.get('recipes', [])],
-            summary=parsed.get('summary', 'Recipes generated based on your allergy profile.')
+            recipes=[Recipe(**recipe) for recipe in recipes],
+            summary=summary
         )
         
         # Save to history
-        await db.recipe_history.insert_one(result.model_dump())
+        await history_writer.add("recipe_history", result.model_dump())
         
         return result
     
+    except SchedulerOverloaded:
+        raise
     except Exception as e:
         logging.error(f"Recipe finder error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Recipe generation failed: {str(e)}")
 
 # Recipe History endpoint
 @api_router.get("/recipe-history", response_model=List[RecipeFinderResult])
-async def get_recipe_history(user_id: str = Depends(get_current_user)):
-    history = await db.recipe_history.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(20).to_list(20)
-    return history
+async def get_recipe_history(
+    response: Response,
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    return await history_page_response(db.recipe_history, user_id, response, before, limit, fields)
 
 # Include router
 app.include_router(api_router)
 
+@app.exception_handler(SchedulerOverloaded)
+async def scheduler_overloaded_handler(request: Request, exc: SchedulerOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# Oversized photos are refused before their body is read
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/api/analyze-image", "/api/analyze-menu-photo"])
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 logging.basicConfig(
@@ -1224,6 +1720,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_resources():
+    http_pools.start()
+    doc_workers.start()
+    await ensure_indexes(db)
+    history_writer.start()
+    await page_cache.ensure_indexes()
+    await menu_index.ensure_indexes()
+    await llm_cache.ensure_indexes()
+
+@app.on_event("shutdown")
+async def shutdown_resources():
+    await recipe_pool.close()
+    await http_pools.close()
+    doc_workers.shutdown()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await history_writer.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""Bounded reading of uploaded photos.
+
+Two limits apply to the image endpoints. ``UploadSizeLimitMiddleware``
+turns requests away with 413 before the body is parsed when their
+Content-Length is already over the cap, and otherwise counts body bytes as
+they arrive, stopping a chunked upload as soon as it crosses the cap
+instead of letting the form parser spool all of it. ``read_image_upload``
+then reads the parsed file in chunks under the same cap. The first bytes are
+sniffed so that non-images are rejected up front and the real image type is
+passed on to the model.
+"""
+import os
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+MAX_UPLOAD_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(15 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(256 * 1024)))
+# Room for the multipart boundary and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+TOO_LARGE_DETAIL = f"Image is too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Mime type of an image from its first bytes, or None if it isn't one we accept"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'hevc', b'hevx', b'mif1', b'msf1'):
+        return 'image/heic'
+    if head.startswith(b'BM'):
+        return 'image/bmp'
+    return None
+
+
+class UploadStats:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected_too_large = 0
+        self.rejected_not_image = 0
+        self.largest_bytes = 0
+        # Upload + preprocessed copy + its base64 string, the most one request held
+        self.peak_request_bytes = 0
+
+    def record_peak(self, nbytes: int):
+        self.peak_request_bytes = max(self.peak_request_bytes, nbytes)
+
+    def stats(self) -> dict:
+        return {
+            "max_upload_bytes": MAX_UPLOAD_BYTES,
+            "accepted": self.accepted,
+            "rejected_too_large": self.rejected_too_large,
+            "rejected_not_image": self.rejected_not_image,
+            "largest_bytes": self.largest_bytes,
+            "peak_request_bytes": self.peak_request_bytes,
+        }
+
+
+upload_stats = UploadStats()
+
+
+async def read_image_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[bytes, str]:
+    """(content, sniffed mime type) of an uploaded image, read at most max_bytes"""
+    if file.size is not None and file.size > max_bytes:
+        upload_stats.rejected_too_large += 1
+        raise HTTPException(status_code=413, detail=TOO_LARGE_DETAIL)
+
+    chunks = []
+    total = 0
+    mime_type = None
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if mime_type is None:
+            mime_type = sniff_image_type(chunk[:32])
+            if mime_type is None:
+                upload_stats.rejected_not_image += 1
+                raise HTTPException(status_code=415, detail="Unsupported file type, please upload a JPEG, PNG, WebP or HEIC photo")
+        total += len(chunk)
+        if total > max_bytes:
+            upload_stats.rejected_too_large += 1
+            raise HTTPException(status_code=413, detail=TOO_LARGE_DETAIL)
+        chunks.append(chunk)
+
+    if mime_type is None:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    upload_stats.accepted += 1
+    upload_stats.largest_bytes = max(upload_stats.largest_bytes, total)
+    return b''.join(chunks), mime_type
+
+
+class UploadSizeLimitMiddleware:
+    """Answers 413 for oversized uploads, from Content-Length or while the body streams in."""
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.limit = max_bytes + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            length = dict(scope["headers"]).get(b"content-length")
+            if length is not None and length.isdigit() and int(length) > self.limit:
+                upload_stats.rejected_too_large += 1
+                response = JSONResponse(status_code=413, content={"detail": TOO_LARGE_DETAIL})
+                await response(scope, receive, send)
+                return
+            received = 0
+
+            async def limited_receive():
+                nonlocal received
+                message = await receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > self.limit:
+                        # Raised inside body parsing, so the app answers 413 and stops reading
+                        upload_stats.rejected_too_large += 1
+                        raise HTTPException(status_code=413, detail=TOO_LARGE_DETAIL)
+                return message
+
+            await self.app(scope, limited_receive, send)
+            return
+        await self.app(scope, receive, send)
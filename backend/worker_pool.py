@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentBudgetExceeded(Exception):
+    """A document used more CPU time (or wall time) than it was allowed."""
+
+
+class _CPUBudgetInterrupt(BaseException):
+    """Raised by the SIGPROF handler inside a worker.
+
+    A BaseException, so ``except Exception`` blocks in extractors or parsing
+    libraries can't swallow it and return partial text; it is turned into
+    DocumentBudgetExceeded once it reaches the top of the job.
+    """
+
+
+def _raise_budget_exceeded(signum, frame):
+    raise _CPUBudgetInterrupt()
+
+
+def _init_process_worker():
+    # Workers must not react to the parent's Ctrl-C; the parent shuts them down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGPROF"):
+        signal.signal(signal.SIGPROF, _raise_budget_exceeded)
+
+
+def _run_with_cpu_budget(cpu_budget, fn, args):
+    """Run fn(*args) in a process worker, interrupted after cpu_budget CPU seconds."""
+    if not cpu_budget or not hasattr(signal, "setitimer"):
+        return fn(*args)
+
+    signal.setitimer(signal.ITIMER_PROF, cpu_budget)
+    try:
+        return fn(*args)
+    except _CPUBudgetInterrupt:
+        raise DocumentBudgetExceeded("Document extraction exceeded its CPU time budget") from None
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+
+
+class WorkerPool:
+    """Runs CPU-bound document parsing off the event loop.
+
+    Uses a process pool when the platform allows it (so a huge PDF cannot
+    hold the GIL against the event loop) and falls back to a thread pool.
+    Every job gets a CPU time budget (enforced inside process workers) and a
+    wall-clock timeout; cancelling the awaiting coroutine cancels the job if
+    it has not started yet.
+    """
+
+    def __init__(self):
+        self.kind = os.environ.get('DOC_WORKER_POOL', 'process').lower()
+        self.max_workers = int(os.environ.get('DOC_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.cpu_budget = float(os.environ.get('DOC_CPU_BUDGET', '10'))
+        self.timeout = float(os.environ.get('DOC_TIMEOUT', '20'))
+        self._executor = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.budget_exceeded = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        if self._executor is not None:
+            return
+
+        if self.kind == 'process':
+            try:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_process_worker
+                )
+                return
+            except (OSError, NotImplementedError, ImportError) as e:
+                logger.warning(f"Process pool unavailable ({str(e)}); using threads for document parsing")
+                self.kind = 'thread'
+
+        self.kind = 'thread'
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="doc-worker"
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn, *args, timeout: float = None):
+        """Run fn(*args) in the pool and await its result."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        started = time.perf_counter()
+
+        if self.kind == 'process':
+            future = loop.run_in_executor(self._executor, _run_with_cpu_budget, self.cpu_budget, fn, args)
+        else:
+            future = loop.run_in_executor(self._executor, fn, *args)
+
+        try:
+            result = await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise DocumentBudgetExceeded("Document extraction timed out")
+        except DocumentBudgetExceeded:
+            self.budget_exceeded += 1
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); replace the pool so later jobs still run
+            self.failed += 1
+            self.shutdown()
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "cpu_budget_seconds": self.cpu_budget,
+            "timeout_seconds": self.timeout,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "budget_exceeded": self.budget_exceeded,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+
+doc_workers = WorkerPool()
@@ -44,55 +44,23 @@ export default function Dashboard({ allergyProfile, reloadProfile, historyTrigge
 
   const loadHistory = async () => {
     try {
-      // Fetch all four types of history with proper error handling
-      const textHistoryPromise = axios.get(`${API}/history`).then(res => res.data).catch(() => []);
-      const imageHistoryPromise = axios.get(`${API}/image-history`).then(res => res.data).catch(() => []);
-      const menuHistoryPromise = axios.get(`${API}/menu-history`).then(res => res.data).catch(() => []);
-      const recipeHistoryPromise = axios.get(`${API}/recipe-history`).then(res => res.data).catch(() => []);
+      // One merged, server-sorted timeline of all four history types
+      const activity = await axios.get(`${API}/activity`, { params: { limit: 80 } })
+        .then(res => res.data)
+        .catch(() => []);
 
-      const [textHistory, imageHistory, menuHistory, recipeHistory] = await Promise.all([
-        textHistoryPromise,
-        imageHistoryPromise,
-        menuHistoryPromise,
-        recipeHistoryPromise
-      ]);
-
-      // Combine and format all history items
-      const allHistory = [
-        ...textHistory.map(item => ({
-          ...item,
-          type: 'text',
-          displayType: 'Quick Analysis',
-          icon: '🔍'
-        })),
-        ...imageHistory.map(item => ({
-          ...item,
-          type: 'image',
-          displayType: 'Product Scan',
-          icon: '📷',
-          query: item.product_name || 'Product Label',
-          is_safe: item.is_safe
-        })),
-        ...menuHistory.map(item => ({
-          ...item,
-          type: 'menu',
-          displayType: 'Menu Analysis',
-          icon: '🍽️',
-          query: item.restaurant_name || item.source_data,
-          is_safe: item.safe_dishes && item.safe_dishes.length > 0
-        })),
-        ...recipeHistory.map(item => ({
-          ...item,
-          type: 'recipe',
-          displayType: 'Recipe Search',
-          icon: '👨‍🍳',
-          query: item.food_item,
-          is_safe: true // Recipes are always safe by design
-        }))
-      ];
-
-      // Sort by timestamp (newest first)
-      allHistory.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
+      const display = {
+        text: { displayType: 'Quick Analysis', icon: '🔍' },
+        image: { displayType: 'Product Scan', icon: '📷' },
+        menu: { displayType: 'Menu Analysis', icon: '🍽️' },
+        recipe: { displayType: 'Recipe Search', icon: '👨‍🍳' }
+      };
+      const allHistory = activity.map(item => ({
+        ...item,
+        ...display[item.kind],
+        type: item.kind,
+        query: item.title || (item.kind === 'image' ? 'Product Label' : '')
+      }));
 
       setHistory(allHistory);
     } catch (error) {
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark for upload image preprocessing (backend/image_prep.py)
+Compares sending the raw upload against the downscaled/re-encoded image:
+payload size (raw and base64), peak Python-heap memory (tracemalloc; Pillow's
+C buffers are not counted), preprocessing time and an
+estimated end-to-end time including the upload to the LLM provider.
+
+Usage: python image_preprocess_benchmark.py [photo.jpg ...]
+Without arguments, synthetic 12 MP "phone photos" are generated.
+"""
+
+import base64
+import io
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from image_prep import preprocess_image  # noqa: E402
+
+UPLINK_MBPS = 10  # assumed server -> provider throughput for the estimate
+SETTINGS = [
+    ("jpeg q85 1600px", dict(max_edge=1600, output_format="jpeg", quality=85)),
+    ("webp q80 1600px", dict(max_edge=1600, output_format="webp", quality=80)),
+    ("jpeg q85 1600px gray+contrast", dict(max_edge=1600, output_format="jpeg", quality=85,
+                                           grayscale=True, autocontrast=True)),
+    ("jpeg q80 1024px", dict(max_edge=1024, output_format="jpeg", quality=80)),
+]
+
+
+def synthetic_photo(seed: int) -> bytes:
+    """A 4032x3024 JPEG with label-like text lines over a noisy background"""
+    rng = random.Random(seed)
+    image = Image.effect_noise((4032, 3024), 40).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((600, 400, 3400, 2600), fill=(245, 240, 230))
+    for line in range(40):
+        y = 450 + line * 52
+        words = " ".join(rng.choice(["sugar", "whey", "wheat flour", "cocoa butter", "salt",
+                                     "soy lecithin", "milk", "emulsifier", "e322"]) for _ in range(8))
+        draw.text((650, y), f"Ingredients: {words}", fill=(20, 20, 20))
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=95)
+    return output.getvalue()
+
+
+def measure(label: str, data: bytes, settings: dict = None):
+    tracemalloc.start()
+    started = time.perf_counter()
+    if settings is None:
+        payload = data
+    else:
+        payload, _, _ = preprocess_image(data, **settings)
+    encoded = base64.b64encode(payload)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    upload_seconds = len(encoded) * 8 / (UPLINK_MBPS * 1e6)
+    print(f"{label:32} {len(payload) / 1e6:7.2f} MB {len(encoded) / 1e6:7.2f} MB "
+          f"{peak / 1e6:8.1f} MB {elapsed * 1000:8.0f} ms {(elapsed + upload_seconds):7.2f} s")
+    return len(encoded)
+
+
+def main():
+    if len(sys.argv) > 1:
+        photos = [(path, Path(path).read_bytes()) for path in sys.argv[1:]]
+    else:
+        photos = [(f"synthetic-{seed}", synthetic_photo(seed)) for seed in range(2)]
+
+    print("🔍 Image preprocessing benchmark")
+    print(f"(end-to-end estimate assumes a {UPLINK_MBPS} Mbit/s uplink to the LLM provider)")
+    for name, data in photos:
+        print("=" * 90)
+        print(f"{name}: {len(data) / 1e6:.2f} MB")
+        print(f"{'mode':32} {'payload':>10} {'base64':>10} {'peak mem':>11} {'prep':>11} {'e2e':>9}")
+        print("-" * 90)
+        baseline = measure("raw upload (current)", data)
+        for label, settings in SETTINGS:
+            size = measure(label, data, settings)
+            print(f"{'':32} -> {size / baseline:.1%} of the raw base64 payload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Explain-plan check for the MongoDB indexes (backend/indexes.py)
+Ensures the indexes on a database and verifies that none of the hot queries
+(history listing, session/user/profile lookups) falls back to a COLLSCAN.
+Uses MONGO_URL and DB_NAME from the environment or backend/.env.
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+load_dotenv(Path(__file__).parent / "backend" / ".env")
+
+from indexes import INDEXES, ensure_indexes, explain_hot_queries  # noqa: E402
+
+
+async def test_hot_queries_use_indexes():
+    """Every hot query should be answered from an index"""
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+
+    print("🔍 Testing MongoDB index coverage of hot queries")
+    print("=" * 60)
+
+    try:
+        created = await ensure_indexes(db)
+        missing = [
+            f"{collection}.{model.document['name']}"
+            for collection, models in INDEXES.items()
+            for model in models
+            if model.document["name"] not in created.get(collection, [])
+        ]
+        for name in missing:
+            print(f"❌ Index not created: {name}")
+
+        results = await explain_hot_queries(db)
+        for result in results:
+            status = "❌ COLLSCAN" if result["collscan"] else "✅ Indexed"
+            print(f"{status}: {result['collection']} by {', '.join(result['query'])} -> {' > '.join(result['stages'])}")
+
+        return not missing and not any(result["collscan"] for result in results)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    success = asyncio.run(test_hot_queries_use_indexes())
+
+    if success:
+        print("\n✅ All hot queries are served by indexes!")
+    else:
+        print("\n❌ Some hot queries are not covered by an index")
+    sys.exit(0 if success else 1)
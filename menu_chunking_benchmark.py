@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark for chunked menu extraction (backend/menu_chunks.py)
+Compares the old path -- one LLM call over the first 20,000 characters of the
+crawled menu -- against splitting the menu into chunks read by parallel calls
+under the per-request concurrency cap.
+
+The LLM is simulated: a call takes a fixed overhead plus time per input and
+per output token, and "extracts" exactly the dish lines it was shown, so
+coverage is the share of the menu's dishes that reach the result.
+
+Usage: python menu_chunking_benchmark.py [--scale 0.02]
+--scale shrinks every simulated sleep; reported times are scaled back up.
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from menu_chunks import (  # noqa: E402
+    MENU_CHUNK_CHARS, MENU_CHUNK_CONCURRENCY, MENU_MAX_CHUNKS, gather_bounded, split_menu
+)
+
+TRUNCATION_LIMIT = 20000
+
+# Simulated model: ~4 characters per token
+CALL_OVERHEAD = 0.8          # seconds per request
+INPUT_TOKENS_PER_SECOND = 20000
+OUTPUT_TOKENS_PER_SECOND = 150
+OUTPUT_TOKENS_PER_DISH = 45  # JSON entry with ingredients and allergen tags
+
+SECTIONS = ["STARTERS", "SALADS", "SOUPS", "PASTA", "PIZZA", "MAINS", "GRILL", "SIDES",
+            "DESSERTS", "COCKTAILS", "WINE", "SOFT DRINKS"]
+WORDS = ["roasted", "garlic", "tomato", "basil", "mozzarella", "chili", "lemon", "herb",
+         "butter", "parmesan", "shrimp", "chicken", "mushroom", "truffle", "pesto", "walnut"]
+DISH = re.compile(r"^Dish (\d+) ")
+
+
+def synthetic_menu(dishes: int, seed: int = 1) -> str:
+    """Crawled-menu-like text: sections of 'Dish N - description - price' lines"""
+    rng = random.Random(seed)
+    pages = []
+    lines = []
+    for number in range(dishes):
+        if number % max(1, dishes // len(SECTIONS)) == 0:
+            lines.append(SECTIONS[(number * len(SECTIONS) // dishes) % len(SECTIONS)])
+        description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14)))
+        lines.append(f"Dish {number} - {description} - {rng.randint(6, 40)}.50")
+        if number and number % 120 == 0:
+            # The crawler joins separate menu pages with section markers
+            pages.append("\n".join(lines))
+            lines = []
+    pages.append("\n".join(lines))
+    return "\n\n=== MENU SECTION ===\n\n".join(pages)
+
+
+async def fake_llm(text: str, scale: float) -> set:
+    found = {int(m.group(1)) for m in (DISH.match(line) for line in text.split("\n")) if m}
+    seconds = (CALL_OVERHEAD + len(text) / 4 / INPUT_TOKENS_PER_SECOND +
+               len(found) * OUTPUT_TOKENS_PER_DISH / OUTPUT_TOKENS_PER_SECOND)
+    await asyncio.sleep(seconds * scale)
+    return found
+
+
+async def truncated(menu: str, scale: float):
+    return await fake_llm(menu[:TRUNCATION_LIMIT], scale), 1
+
+
+async def chunked(menu: str, scale: float):
+    chunks = split_menu(menu[:MENU_CHUNK_CHARS * MENU_MAX_CHUNKS])[:MENU_MAX_CHUNKS]
+    results = await gather_bounded(lambda chunk: fake_llm(chunk, scale), chunks, MENU_CHUNK_CONCURRENCY)
+    return set().union(*results), len(chunks)
+
+
+async def measure(label: str, path, menu: str, dishes: int, scale: float):
+    started = time.perf_counter()
+    found, calls = await path(menu, scale)
+    elapsed = (time.perf_counter() - started) / scale
+    print(f"{label:12} {calls:6d} {elapsed:9.1f} s {len(found):7d}/{dishes:<5d} {len(found) / dishes:8.1%}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print("🔍 Menu chunking benchmark (simulated LLM)")
+    print(f"chunks of {MENU_CHUNK_CHARS} chars, at most {MENU_MAX_CHUNKS}, "
+          f"{MENU_CHUNK_CONCURRENCY} concurrent calls")
+    for dishes in (60, 150, 400, 800):
+        menu = synthetic_menu(dishes)
+        print("=" * 60)
+        print(f"{dishes} dishes, {len(menu)} characters")
+        print(f"{'path':12} {'calls':>6} {'wall-clock':>11} {'dishes':>13} {'coverage':>8}")
+        print("-" * 60)
+        await measure("truncate 20k", truncated, menu, dishes, args.scale)
+        await measure("chunked", chunked, menu, dishes, args.scale)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+from batch_analysis import match_answers, query_groups, unique_queries
+
+
+def answer(item, is_safe):
+    return {"item": item, "is_safe": is_safe}
+
+
+def test_repeated_items_are_asked_once_in_their_first_spelling():
+    queries = ["Peanut butter", "white bread", "peanut  Butter", "Oat milk", "WHITE BREAD"]
+    assert unique_queries(queries) == ["Peanut butter", "white bread", "Oat milk"]
+
+
+def test_groups_respect_the_items_per_prompt():
+    queries = [f"item {number}" for number in range(7)] + ["item 0"]
+    assert [list(group) for group in query_groups(queries, 3)] == [
+        ["item 0", "item 1", "item 2"], ["item 3", "item 4", "item 5"], ["item 6"]
+    ]
+
+
+def test_answers_are_matched_by_name_whatever_their_order():
+    queries = ["Reese's Peanut Butter Cups", "white bread"]
+    answers = [answer("White Bread", True), answer("reese's peanut butter cups", False)]
+    assert match_answers(queries, answers) == [(answers[1], True), (answers[0], True)]
+
+
+def test_reordered_and_renamed_answer_is_not_given_to_another_item():
+    queries = ["Reese's Peanut Butter Cups", "white bread"]
+    # Reordered, and the first name reworded: position 0 holds the bread answer
+    answers = [answer("white bread", True), answer("Peanut butter cups", False)]
+    matched = match_answers(queries, answers)
+    assert matched[0] == (None, False)
+    assert matched[1] == (answers[0], True)
+
+
+def test_position_is_used_only_when_no_name_matches_and_counts_agree():
+    queries = ["Reese's Peanut Butter Cups", "white bread"]
+    renamed = [answer("Peanut butter cups", False), answer("Sliced white loaf", True)]
+    assert match_answers(queries, renamed) == [(renamed[0], False), (renamed[1], False)]
+    assert match_answers(queries, renamed[:1]) == [(None, False), (None, False)]
+
+
+def test_an_answer_is_claimed_by_one_query_only():
+    queries = ["white bread", "White bread "]
+    answers = [answer("white bread", True)]
+    assert match_answers(queries, answers) == [(answers[0], True), (None, False)]
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from history_writer import HistoryWriter  # noqa: E402
+
+
+class StalledCollection:
+    def __init__(self, error=None):
+        self.error = error
+        self.attempts = 0
+
+    async def insert_many(self, documents, ordered=True):
+        self.attempts += 1
+        if self.error is not None:
+            raise self.error
+        await asyncio.sleep(3600)
+
+
+def writer_with(collection, **settings):
+    writer = HistoryWriter({"analysis_history": collection})
+    for name, value in settings.items():
+        setattr(writer, name, value)
+    return writer
+
+
+def test_close_gives_up_on_a_hung_database_and_counts_the_drop():
+    writer = writer_with(StalledCollection(), close_timeout=0.2)
+
+    async def run():
+        writer.start()
+        await writer.add("analysis_history", {"id": "1"})
+        await writer.add("analysis_history", {"id": "2"})
+        started = time.perf_counter()
+        await writer.close()
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 1
+    assert writer.dropped == 2
+    assert writer.pending() == 0
+
+
+def test_close_does_not_retry_failed_batches():
+    collection = StalledCollection(error=ConnectionError("down"))
+    writer = writer_with(collection, max_retries=5, retry_backoff=10, close_timeout=5)
+
+    async def run():
+        writer.start()
+        await writer.add("analysis_history", {"id": "1"})
+        started = time.perf_counter()
+        await writer.close()
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 1
+    assert collection.attempts == 1
+    assert writer.dropped == 1
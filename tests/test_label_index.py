@@ -0,0 +1,34 @@
+from label_index import HASH_SIZE, LabelIndex
+
+
+def test_same_photo_is_found_by_its_bytes_even_when_another_shares_its_hash():
+    index = LabelIndex()
+    index.add(0b1011, b"photo one", "Oat Crunch", ["oats", "sugar"])
+    index.add(0b1011, b"photo two", "Oat Crunch Honey", ["oats", "honey"])
+
+    assert index.find_same_photo(b"photo one").product_name == "Oat Crunch"
+    assert index.find_same_photo(b"photo two").product_name == "Oat Crunch Honey"
+    assert index.find_same_photo(b"photo three") is None
+    assert index.exact_hits == 2
+
+
+def test_near_match_is_found_through_the_bands():
+    index = LabelIndex()
+    known = (1 << (HASH_SIZE * HASH_SIZE)) - 1
+    index.add(known, b"photo", "Oat Crunch", ["oats"])
+    index.add(0, b"other photo", "Rice Puffs", ["rice"])
+
+    near = known ^ sum(1 << bit for bit in range(0, 256, 256 // index.reuse_distance)[:index.reuse_distance])
+    found = index.lookup(near)
+    assert found.product_name == "Oat Crunch" and found.distance == index.reuse_distance
+
+    too_far = known ^ sum(1 << bit for bit in range(0, 256, 32))
+    assert index.lookup(too_far) is None
+    assert (index.near_hits, index.misses) == (1, 1)
+
+
+def test_photo_whose_hash_failed_can_still_be_reused():
+    index = LabelIndex()
+    index.add(None, b"photo", "Oat Crunch", ["oats"])
+    assert index.find_same_photo(b"photo").ingredients == ["oats"]
+    assert index.lookup(None) is None
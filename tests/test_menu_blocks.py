@@ -0,0 +1,66 @@
+import asyncio
+
+from menu_chunks import menu_blocks, pack_blocks
+from menu_index import MenuIndex, assign_dishes, block_digest, normalize_dishes, snapshot_block
+
+SECTIONS = ["STARTERS", "SALADS", "SOUPS", "PASTA", "PIZZA", "MAINS", "DESSERTS", "DRINKS"]
+
+
+def menu(extra_starter=None):
+    lines = []
+    for section in SECTIONS:
+        lines.append(section)
+        if section == "STARTERS" and extra_starter:
+            lines.append(extra_starter)
+        for number in range(12):
+            lines.append(f"{section.title()} dish {number} - garlic, tomato, basil, lemon and herbs - 12.50")
+    return "\n".join(lines)
+
+
+def hashed_blocks(text, max_chars=1500):
+    texts = menu_blocks(text, max_chars)
+    return [(block_digest(texts[index]), texts[index]) for group in pack_blocks(texts, max_chars) for index in group]
+
+
+def test_inserting_a_dish_changes_only_its_section():
+    before = hashed_blocks(menu())
+    after = hashed_blocks(menu(extra_starter="Burrata - burrata, peach, basil - 14.00"))
+    assert len(before) == len(after) == len(SECTIONS)
+    changed = [index for index, (old, new) in enumerate(zip(before, after)) if old[0] != new[0]]
+    assert changed == [0]
+
+
+def test_unchanged_blocks_keep_their_dishes():
+    blocks = hashed_blocks(menu())
+    raw = [{"name": text.split("\n")[1].split(" - ")[0], "ingredients": ["garlic"]} for _, text in blocks]
+    assigned = assign_dishes(blocks, raw)
+    previous = {
+        "dishes": normalize_dishes(raw),
+        "blocks": [snapshot_block(block_hash, found) for block_hash, found in assigned.items()],
+    }
+
+    index = MenuIndex()
+    reused, changed = index.diff_blocks(previous, hashed_blocks(menu(extra_starter="Burrata - peach - 14.00")))
+    assert len(changed) == 1 and "Burrata" in changed[0][1]
+    assert len(reused) == len(SECTIONS) - 1
+    assert all(len(found) == 1 for found in reused.values())
+
+
+def test_dish_not_found_in_text_goes_to_every_block_of_its_chunk():
+    blocks = [("a", "STARTERS\nSoup of the day"), ("b", "MAINS\nSteak frites")]
+    assigned = assign_dishes(blocks, [{"name": "Steak Frites"}, {"name": "Daily soup"}])
+    assert [dish["name"] for dish in assigned["a"]] == ["Daily soup"]
+    assert [dish["name"] for dish in assigned["b"]] == ["Steak Frites", "Daily soup"]
+
+
+def test_partial_build_is_only_fresh_for_the_partial_ttl():
+    index = MenuIndex()
+    index.partial_ttl = 60
+    complete = asyncio.run(index.save("https://a.example/menu", "A", normalize_dishes([{"name": "Soup"}])))
+    partial = asyncio.run(index.save("https://b.example/menu", "B", normalize_dishes([{"name": "Soup"}]), partial=True))
+    assert index.is_fresh(complete) and index.is_fresh(partial)
+
+    for entry in (complete, partial):
+        entry["indexed_at"] -= 120
+    assert index.is_fresh(complete)
+    assert not index.is_fresh(partial)
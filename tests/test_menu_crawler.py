@@ -0,0 +1,42 @@
+import asyncio
+
+from menu_crawler import MenuCrawler
+
+
+def crawl_with_tracking(**crawler_args):
+    """Crawl a main page with five same-host menu links; return (pages fetched, peak concurrent fetches)"""
+    links = [f"https://restaurant.example/menu/{number}" for number in range(5)]
+    active = 0
+    peak = 0
+    fetched = []
+
+    async def fetch_page(url, is_main_page):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        try:
+            await asyncio.sleep(0.01)
+            fetched.append(url)
+            return [f"text of {url}"], (links if is_main_page else [])
+        finally:
+            active -= 1
+
+    crawler = MenuCrawler(fetch_page, **crawler_args)
+    pieces = asyncio.run(crawler.crawl("https://restaurant.example/"))
+    assert len(pieces) == 6
+    return fetched, peak
+
+
+def test_same_host_fetches_are_bounded_by_default():
+    crawler = MenuCrawler(lambda url, is_main_page: None)
+    assert crawler.per_host < crawler.concurrency
+
+    fetched, peak = crawl_with_tracking()
+    assert len(fetched) == 6
+    assert peak == crawler.per_host
+
+
+def test_per_host_limit_of_one_serializes_fetches():
+    fetched, peak = crawl_with_tracking(per_host=1)
+    assert len(fetched) == 6
+    assert peak == 1
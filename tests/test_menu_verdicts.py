@@ -0,0 +1,32 @@
+from menu_index import merge_menu_verdicts, normalize_dishes, reuse_menu_verdicts, verdict_hashes
+
+DISHES = normalize_dishes([
+    {"name": "Margherita", "ingredients": ["tomato", "mozzarella"]},
+    {"name": "Caesar Salad", "ingredients": ["romaine", "anchovy"]},
+    {"name": "Tiramisu", "ingredients": ["mascarpone", "egg"]},
+])
+
+
+def test_dish_left_out_of_the_answer_is_evaluated_again():
+    # The model skipped Tiramisu in the first scan
+    first = merge_menu_verdicts([{
+        "safe_dishes": [{"name": "Margherita"}],
+        "unsafe_dishes": [{"name": "Caesar Salad", "allergens": ["fish"]}],
+    }])
+    last_scan = {**first, "dish_hashes": verdict_hashes(DISHES, first)}
+    assert "tiramisu" not in last_scan["dish_hashes"]
+
+    carried, to_evaluate = reuse_menu_verdicts(last_scan, DISHES)
+    assert [dish["name"] for dish in to_evaluate] == ["Tiramisu"]
+    assert [dish["name"] for dish in carried[0]["safe_dishes"]] == ["Margherita"]
+
+
+def test_hash_without_a_verdict_is_not_trusted():
+    # An older snapshot that stored hashes for every indexed dish
+    last_scan = {
+        "safe_dishes": [{"name": "Margherita"}],
+        "unsafe_dishes": [],
+        "dish_hashes": {"margherita": DISHES[0]["hash"], "tiramisu": DISHES[2]["hash"]},
+    }
+    _, to_evaluate = reuse_menu_verdicts(last_scan, DISHES)
+    assert [dish["name"] for dish in to_evaluate] == ["Caesar Salad", "Tiramisu"]
@@ -0,0 +1,74 @@
+import asyncio
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from uploads import MULTIPART_OVERHEAD, UploadSizeLimitMiddleware, read_image_upload
+
+LIMIT = 1024
+PNG = b'\x89PNG\r\n\x1a\n'
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"], max_bytes=LIMIT)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        content, _ = await read_image_upload(file, LIMIT)
+        return {"size": len(content)}
+
+    return TestClient(app)
+
+
+def multipart_chunks(payload: bytes, chunk_size: int = 4096, seen=None):
+    yield (b'--xyz\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n'
+           b'Content-Type: image/png\r\n\r\n')
+    for start in range(0, len(payload), chunk_size):
+        if seen is not None:
+            seen.append(start)
+        yield payload[start:start + chunk_size]
+    yield b'\r\n--xyz--\r\n'
+
+
+def test_chunked_upload_is_cut_off_once_over_the_limit():
+    # TestClient reads the whole body up front, so drive the ASGI app directly
+    app = make_client().app
+    seen = []
+    chunks = multipart_chunks(PNG + b'\0' * (10 * 1024 * 1024), seen=seen)
+    sent = []
+
+    async def receive():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/upload", "raw_path": b"/upload", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"transfer-encoding", b"chunked"),
+                    (b"content-type", b"multipart/form-data; boundary=xyz")],
+        "client": ("127.0.0.1", 1), "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+
+    assert sent[0]["type"] == "http.response.start"
+    assert sent[0]["status"] == 413
+    # Rejected at the first chunk past the limit, not after the whole 10 MB
+    assert len(seen) * 4096 <= LIMIT + MULTIPART_OVERHEAD + 4096
+
+
+def test_chunked_upload_under_the_limit_goes_through():
+    client = make_client()
+    payload = PNG + b'\0' * 100
+    response = client.post(
+        "/upload",
+        content=multipart_chunks(payload),
+        headers={"Content-Type": "multipart/form-data; boundary=xyz"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"size": len(payload)}
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+
+from worker_pool import DocumentBudgetExceeded, WorkerPool
+
+
+def swallowing_parser(seconds):
+    """A parser that, like many libraries, catches every Exception it sees"""
+    try:
+        deadline = time.process_time() + seconds
+        while time.process_time() < deadline:
+            try:
+                sum(range(10000))
+            except Exception:
+                pass
+        return "full text"
+    except Exception:
+        return ""
+
+
+def test_cpu_budget_is_not_swallowed_by_except_exception():
+    pool = WorkerPool()
+    pool.kind = 'process'
+    pool.max_workers = 1
+    pool.cpu_budget = 0.2
+    pool.timeout = 30
+
+    async def run():
+        try:
+            return await pool.run(swallowing_parser, 5)
+        finally:
+            pool.shutdown()
+
+    with pytest.raises(DocumentBudgetExceeded):
+        asyncio.run(run())
+    assert pool.kind == 'process'
+    assert pool.budget_exceeded == 1
+    assert pool.completed == 0
+
+
+def test_jobs_within_budget_complete():
+    pool = WorkerPool()
+    pool.kind = 'process'
+    pool.max_workers = 1
+    pool.cpu_budget = 5
+
+    async def run():
+        try:
+            return await pool.run(swallowing_parser, 0.05)
+        finally:
+            pool.shutdown()
+
+    assert asyncio.run(run()) == "full text"
+    assert pool.budget_exceeded == 0
+    assert pool.completed == 1